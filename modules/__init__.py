@@ -4,6 +4,7 @@ Define all API classes here, which need to be exported to Sublime Text.
 """
 from .events import BlameEventListener
 from .events import EventListener
+from .events import TextChangeListener
 from .commands import GitGutterBlameCommand
 from .commands import GitGutterCommand
 from .commands import GitGutterCompareBranchCommand
@@ -20,4 +21,5 @@ from .commands import GitGutterPrevChangeCommand
 from .commands import GitGutterReplaceTextCommand
 from .commands import GitGutterRevertChangeCommand
 from .commands import GitGutterShowCompareCommand
+from .support import GitGutterPerformanceReportCommand
 from .support import GitGutterSupportInfoCommand
@@ -0,0 +1,162 @@
+"""A content-addressed store of the blobs views are compared against.
+
+The same file open in several views or windows is compared against the same
+blob. Instead of each view reading and keeping its own copy, the blobs are
+stored once per process and shared by all views.
+
+The content of a blob is kept in memory as long as any view holds a lease on
+it. Blobs without leases are written to a temporary file and kept on disk
+only, so switching back to a recently used compare target doesn't need to
+read it from the repository again. The least recently used ones of them are
+removed, if there are too many.
+
+Blobs are keyed by their object id. The content of a blob, which is
+converted by smudge filters or eol conversion on checkout, depends on the
+file's attributes, so such blobs are keyed by object id and path.
+"""
+import threading
+
+from collections import OrderedDict
+
+from . import metrics
+from .temp import TempFile
+
+# The maximum number of blobs without lease to keep on disk.
+_MAX_UNUSED = 64
+
+
+class Blob(object):
+    """The content of a compare target's file shared by all views."""
+
+    def __init__(self, key, content):
+        """Initialize Blob object.
+
+        Arguments:
+            key (any): The hashable key of the blob.
+            content (bytes): The content of the file.
+        """
+        self.key = key
+        self.size = len(content)
+        # the number of views holding a lease on the blob
+        self.refs = 0
+        self._content = content
+        # the temporary file, which is written once its path is requested
+        self._file = None
+
+    @property
+    def name(self):
+        """The path of the temporary file containing the blob."""
+        if self._file is None:
+            file = TempFile(mode='wb')
+            with file as stream:
+                stream.write(self._content)
+            self._file = file
+        return self._file.name
+
+    @property
+    def content(self):
+        """The content of the blob, which is read from disk if not in memory.
+
+        Returns:
+            bytes: The content of the file.
+        """
+        content = self._content
+        if content is None:
+            with open(self._file.name, 'rb') as file:
+                content = self._content = file.read()
+        return content
+
+    def text(self, encoding):
+        """Decode the content like a file opened in text mode.
+
+        Arguments:
+            encoding (string): The python codec to decode the content with.
+
+        Returns:
+            string: The decoded content with normalized line endings.
+        """
+        text = self.content.decode(encoding, 'replace')
+        return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+# The map of keys and blobs with leases.
+_blobs = {}
+# The map of keys and blobs without leases in least recently used order.
+_unused = OrderedDict()
+_blobs_lock = threading.Lock()
+
+
+def _lease(key):
+    """Return the blob of a key and increment its leases.
+
+    Must be called with the lock held.
+    """
+    blob = _blobs.get(key)
+    if blob is None:
+        blob = _unused.pop(key, None)
+        if blob is None:
+            return None
+        _blobs[key] = blob
+    blob.refs += 1
+    return blob
+
+
+def acquire(key):
+    """Return a stored blob and take a lease on it.
+
+    Arguments:
+        key (any): The hashable key of the blob.
+
+    Returns:
+        Blob: The blob or None, if it is not stored.
+    """
+    with _blobs_lock:
+        blob = _lease(key)
+    metrics.hit('cache.blob', blob is not None)
+    return blob
+
+
+def add(key, content):
+    """Store a blob and take a lease on it.
+
+    If another view stored the same blob in the meantime, the existing one is
+    returned.
+
+    Arguments:
+        key (any): The hashable key of the blob.
+        content (bytes): The content of the file.
+
+    Returns:
+        Blob: The stored blob.
+    """
+    new_blob = Blob(key, content)
+    with _blobs_lock:
+        blob = _lease(key)
+        if blob is None:
+            blob = _blobs[key] = new_blob
+            blob.refs = 1
+        return blob
+
+
+def release(blob):
+    """Return a lease on a blob.
+
+    The blob is kept on disk for later use, if it has no leases left.
+
+    Arguments:
+        blob (Blob): The blob to return the lease on.
+    """
+    with _blobs_lock:
+        blob.refs -= 1
+        if blob.refs > 0 or _blobs.get(blob.key) is not blob:
+            return
+        del _blobs[blob.key]
+        try:
+            blob.name
+        except OSError:
+            # drop the blob, if it can't be kept on disk
+            return
+        blob._content = None
+        _unused[blob.key] = blob
+        while len(_unused) > _MAX_UNUSED:
+            _unused.popitem(last=False)
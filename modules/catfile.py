@@ -0,0 +1,283 @@
+"""Long-lived git co-processes to read objects of a repository.
+
+Spawning a new `git cat-file` or `git rev-parse` for each object lookup is
+expensive, if lots of views of a big repository need to be updated at once.
+Therefore this module maintains one set of `git cat-file --batch-check`,
+`git cat-file --batch` and `git check-attr --stdin` processes per working tree,
+which serve all requests via their pipes.
+
+The processes are shared by all views of a working tree. They are spawned on
+demand, restarted if they die and closed as soon as the last view of the
+working tree releases them.
+
+Note:
+    `git cat-file --batch --filters` reports the size of the unfiltered object
+    in its header, which makes its output unparsable if a filter changes the
+    size of the content. Hence the `--batch` process reads raw objects only and
+    `check-attr` is used to find out whether a file needs to be passed through
+    smudge filters or eol conversion by a dedicated `cat-file --filters` call.
+"""
+import subprocess
+import threading
+
+# The git config arguments to use for all object reading commands.
+GIT_CONFIG_ARGS = (
+    '-c', 'core.autocrlf=input',
+    '-c', 'core.eol=lf',
+    '-c', 'core.safecrlf=false'
+)
+
+# The attributes which cause git to modify the content of a blob on checkout.
+_FILTER_ATTRIBUTES = ('filter', 'ident', 'working-tree-encoding', 'eol')
+
+# The values of an attribute which don't cause any conversion.
+_NO_FILTER_VALUES = frozenset(('unspecified', 'unset', 'lf'))
+
+
+class CoProcess(object):
+    """A long-lived git process communicating via stdin/stdout pipes.
+
+    The process is spawned on demand by the first request and respawned if it
+    died in the meanwhile. All requests are serialized by a lock, so an object
+    can be shared by several threads.
+    """
+
+    def __init__(self, args):
+        """Initialize CoProcess object.
+
+        Arguments:
+            args (tuple): The git arguments without the git binary.
+        """
+        self.args = args
+        self._lock = threading.Lock()
+        self._proc = None
+        self._git_binary = None
+
+    def __del__(self):
+        """Destroy the CoProcess object and terminate git."""
+        self.close()
+
+    def close(self):
+        """Terminate the process by closing its stdin."""
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+            proc.wait(1.0)
+        except Exception:
+            try:
+                proc.kill()
+            except Exception:
+                pass
+
+    def request(self, popen, git_binary, data, reader):
+        """Send a request to the process and parse its response.
+
+        Arguments:
+            popen (callable):
+                The function to spawn a git process with, if needed.
+            git_binary (string):
+                The git executable to run.
+            data (bytes):
+                The request to write to stdin of the process.
+            reader (callable):
+                The function to read the response from the process' stdout.
+
+        Returns:
+            any: The result of `reader`.
+
+        Raises:
+            OSError: if git failed to serve the request twice.
+        """
+        with self._lock:
+            for retry in (True, False):
+                if self._git_binary != git_binary:
+                    self.close()
+                    self._git_binary = git_binary
+                if self._proc is None or self._proc.poll() is not None:
+                    self._proc = popen(
+                        [git_binary] + list(self.args),
+                        stderr=subprocess.DEVNULL)
+                try:
+                    self._proc.stdin.write(data)
+                    self._proc.stdin.flush()
+                    return reader(self._proc.stdout)
+                except (OSError, ValueError) as error:
+                    # the process died, so restart it once
+                    self.close()
+                    if not retry:
+                        raise OSError('git %s failed: %s' % (
+                            ' '.join(self.args), error))
+
+
+def _read_header(stdout):
+    """Read and split the header line of a `git cat-file --batch` response.
+
+    Returns:
+        list: [<oid>, <type>, <size>] or None, if the object is missing.
+
+    Raises:
+        OSError: if the process closed its stdout.
+    """
+    header = stdout.readline()
+    if not header:
+        raise OSError('unexpected end of stream')
+    tokens = header.decode('utf-8', 'replace').split()
+    if len(tokens) != 3 or not tokens[2].isdigit():
+        # '<name> missing' or '<name> ambiguous'
+        return None
+    return tokens
+
+
+def _read_object(stdout):
+    """Read the response of `git cat-file --batch` from stdout.
+
+    Returns:
+        tuple: (<oid>, <type>, <content>) or None if the object is missing.
+    """
+    tokens = _read_header(stdout)
+    if tokens is None:
+        return None
+    oid, kind, size = tokens
+    content = stdout.read(int(size))
+    # each object is terminated by a linefeed
+    stdout.read(1)
+    return (oid, kind, content)
+
+
+def _read_attributes(stdout):
+    """Read the response of `git check-attr --stdin -z` from stdout.
+
+    Returns:
+        dict: The attribute names and values of the requested path.
+    """
+    result = {}
+    # the output is terminated by NUL and consists of <path> <attr> <value>
+    buf = b''
+    while len(result) < len(_FILTER_ATTRIBUTES):
+        chunk = stdout.read1(4096)
+        if not chunk:
+            raise OSError('unexpected end of stream')
+        buf += chunk
+        fields = buf.split(b'\0')
+        while len(fields) > 3:
+            _, attr, value = fields[:3]
+            del fields[:3]
+            result[attr.decode('utf-8')] = value.decode('utf-8')
+        buf = b'\0'.join(fields)
+    return result
+
+
+class CatFile(object):
+    """The set of git co-processes of a working tree."""
+
+    def __init__(self):
+        """Initialize CatFile object."""
+        self._check = CoProcess(('cat-file', '--batch-check'))
+        self._batch = CoProcess(GIT_CONFIG_ARGS + ('cat-file', '--batch'))
+        self._attrs = CoProcess(
+            ('check-attr', '--stdin', '-z') + _FILTER_ATTRIBUTES)
+
+    def close(self):
+        """Terminate all processes."""
+        self._check.close()
+        self._batch.close()
+        self._attrs.close()
+
+    def object_id(self, popen, git_binary, name):
+        """Resolve an object name like `HEAD` or `<commit>:<path>` to its id.
+
+        Arguments:
+            popen (callable): The function to spawn a git process with.
+            git_binary (string): The git executable to run.
+            name (string): The object name to resolve.
+
+        Returns:
+            string: The full hash of the object or None if it does not exist.
+        """
+        if '\n' in name:
+            return None
+        tokens = self._check.request(
+            popen, git_binary, name.encode('utf-8') + b'\n', _read_header)
+        return tokens[0] if tokens else None
+
+    def read(self, popen, git_binary, oid):
+        """Read the raw content of an object.
+
+        Arguments:
+            popen (callable): The function to spawn a git process with.
+            git_binary (string): The git executable to run.
+            oid (string): The full hash of the object to read.
+
+        Returns:
+            bytes: The content of the object or None if it does not exist.
+        """
+        result = self._batch.request(
+            popen, git_binary, oid.encode('utf-8') + b'\n', _read_object)
+        return result[2] if result else None
+
+    def needs_filters(self, popen, git_binary, path):
+        """Check whether git converts the content of `path` on checkout.
+
+        Arguments:
+            popen (callable): The function to spawn a git process with.
+            git_binary (string): The git executable to run.
+            path (string): The path relative to the working tree.
+
+        Returns:
+            bool: True if smudge filters or eol conversion apply to `path`.
+        """
+        attrs = self._attrs.request(
+            popen, git_binary, path.encode('utf-8') + b'\0', _read_attributes)
+        return any(
+            attrs.get(attr, 'unspecified') not in _NO_FILTER_VALUES
+            for attr in _FILTER_ATTRIBUTES)
+
+
+# The map of all working trees and their CatFile objects and reference counts.
+_cat_files = {}
+_cat_files_lock = threading.Lock()
+
+
+def acquire(work_tree):
+    """Return the CatFile object of a working tree and increment its users.
+
+    Arguments:
+        work_tree (string): The real path of the working tree.
+
+    Returns:
+        CatFile: The shared CatFile object of the working tree.
+    """
+    with _cat_files_lock:
+        entry = _cat_files.get(work_tree)
+        if entry is None:
+            entry = _cat_files[work_tree] = [CatFile(), 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def release(work_tree):
+    """Decrement the users of a working tree's CatFile and close it if unused.
+
+    Arguments:
+        work_tree (string): The real path of the working tree.
+    """
+    with _cat_files_lock:
+        entry = _cat_files.get(work_tree)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        del _cat_files[work_tree]
+    entry[0].close()
+
+
+def close_all():
+    """Terminate all processes of all working trees."""
+    with _cat_files_lock:
+        entries = list(_cat_files.values())
+        _cat_files.clear()
+    for cat_file, _ in entries:
+        cat_file.close()
@@ -51,7 +51,8 @@ class GitGutterCommand(sublime_plugin.TextCommand):
         'show_compare': compare.show_compare,
         'show_diff_popup': popup.show_diff_popup,
         'copy_from_commit': copy.copy_from_commit,
-        'revert_change': revert.revert_change
+        'revert_change': revert.revert_change,
+        'update_viewport': show_diff.update_viewport
     }
 
     def __init__(self, *args, **kwargs):
@@ -136,19 +137,29 @@ class GitGutterCommand(sublime_plugin.TextCommand):
             return command_func(self, **kwargs)
 
         queued_events = kwargs.get('events', events.ACTIVATED)
+        if queued_events & events.POST_SAVE:
+            # saved files change the status of the work tree
+            self.git_handler.touch_git_state()
         if queued_events & (events.ACTIVATED | events.LOAD):
-            self.update_git_status()
-        if queued_events & events.ACTIVATED:
-            self.git_handler.invalidate_git_file()
+            # the branch is queried only if the repository state changed
+            self.update_git_status(self.git_handler.update_git_state())
 
         self.show_diff_handler.run()
 
-    def update_git_status(self):
+    def update_git_status(self, state_changed=True):
         """Update git repository status.
 
         Try to reduce the amount of information to retrieve via git by
         analysizng the variables defined in the template. Don't waste CPU time
         if the template is quite simple.
+
+        The file counts always need to be queried as the repository watcher
+        doesn't track changes of the work tree, while the branch name changes
+        with the repository state only.
+
+        Arguments:
+            state_changed (bool): True if the repository state changed since
+                the last update.
         """
         if self.status_bar.is_enabled():
             if self.status_bar.has([
@@ -162,7 +173,7 @@ class GitGutterCommand(sublime_plugin.TextCommand):
                         **branch_status
                     )
                 )
-            elif self.status_bar.has(['branch']):
+            elif self.status_bar.has(['branch']) and state_changed:
                 # display the branch name in the statusbar
                 self.git_handler.git_branch_name().then(
                     lambda branch_name: self.status_bar.update(
@@ -171,7 +182,7 @@ class GitGutterCommand(sublime_plugin.TextCommand):
                         branch=branch_name
                     )
                 )
-            else:
+            elif not self.status_bar.has(['branch']):
                 # no global branch information to display in the statusbar
                 self.status_bar.update(
                     repo=self.git_handler.repository_name,
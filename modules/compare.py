@@ -1,5 +1,7 @@
 import sublime
 
+from . import tasks
+
 
 def set_against_commit(git_gutter, **kwargs):
     """Show a quick panel with commits to be chosen from as compare against.
@@ -82,23 +84,21 @@ def set_against_branch(git_gutter, **kwargs):
             This argument is declared to create a common interface being used
             by the GitGutterCommand object.
     """
-    def show_quick_panel(output):
-        """Parse git output and present the quick panel.
+    def show_quick_panel(branches):
+        """Present the quick panel.
 
         Arguments:
-            output (string): The output of git with the list of branches.
+            branches (list): The list of branches as returned by
+                `GitGutterHandler.git_branches()`.
         """
-        if not output:
+        if not branches:
             return sublime.message_dialog('No branches found in repository.')
 
-        def parse_result(result):
-            """Create a quick panel item for one line of git's output."""
-            branch, commit, name, date = result[1:-1].split('\a')
-            branch = branch[11:]   # skip 'refs/heads/'
-            return [branch, commit, name, date]
-
         # Create the list of branches to show in the quick panel
-        items = [parse_result(r) for r in output.split('\n')]
+        items = [
+            [branch[11:], commit, name, date]   # skip 'refs/heads/'
+            for branch, commit, name, date, _ in branches
+        ]
 
         def on_done(index):
             """Select new compare target according to user selection."""
@@ -121,23 +121,21 @@ def set_against_tag(git_gutter, **kwargs):
             This argument is declared to create a common interface being used
             by the GitGutterCommand object.
     """
-    def show_quick_panel(output):
-        """Parse git output and present the quick panel.
+    def show_quick_panel(tags):
+        """Present the quick panel.
 
         Arguments:
-            output (string): The output of git with the list of tags.
+            tags (list): The list of tags as returned by
+                `GitGutterHandler.git_tags()`.
         """
-        if not output:
+        if not tags:
             return sublime.message_dialog('No tags found in repository.')
 
-        def parse_result(result):
-            """Create a quick panel item for one line of git's output."""
-            tag, commit, tname, tdate, cname, cdate = result[1:-1].split('\a')
-            tag = tag[10:]         # skip 'refs/heads/'
-            return [tag, commit, tname.strip() or cname, tdate.strip() or cdate]
-
         # Create the list of tags to show in the quick panel
-        items = [parse_result(r) for r in output.split('\n')]
+        items = [
+            [tag[10:], commit, name, date]   # skip 'refs/tags/'
+            for tag, commit, name, date, _ in tags
+        ]
 
         def on_done(index):
             """Select new compare target according to user selection."""
@@ -179,7 +177,8 @@ def set_against_origin(git_gutter, **kwargs):
             git_gutter.git_handler.set_compare_against(remote, True)
         sublime.message_dialog('Current branch has no tracking remote!')
 
-    git_gutter.git_handler.git_branch_status().then(on_branch_name)
+    git_gutter.git_handler.git_branch_status(
+        tasks.PRIORITY_INTERACTIVE).then(on_branch_name)
 
 
 def show_compare(git_gutter, **kwargs):
@@ -3,9 +3,14 @@ import time
 import sublime
 import sublime_plugin
 
+from . import catfile
+from . import handler
 from . import settings
+from . import tasks
+from . import watcher
 from .annotation import erase_line_annotation
 from .temp import cleanup
+from .view import apply_text_changes
 
 # binary representation of all ST events
 NEW = 1
@@ -18,6 +23,9 @@ SELECTION_MODIFIED = 64
 ACTIVATED = 128
 DEACTIVATED = 256
 
+# The interval in milliseconds to poll the viewport of the focused view with.
+VIEWPORT_POLL_INTERVAL = 200
+
 
 class EventListener(sublime_plugin.EventListener):
     """The EventListener invokes evaluation of changes on certain events.
@@ -33,8 +41,21 @@ class EventListener(sublime_plugin.EventListener):
         self.view_events = {}
 
     def on_exit(self):
+        tasks.cancel_all()
+        catfile.close_all()
+        watcher.close_all()
         cleanup()
 
+    def on_init(self, views):
+        """Watch the viewport of views loaded before the plugin (ST4 only).
+
+        Arguments:
+            views (list): The views which existed before the plugin was
+                loaded.
+        """
+        for view in views:
+            self.watch_viewport(view)
+
     def on_load(self, view):
         """Run git_gutter after loading, if view is valid.
 
@@ -42,9 +63,10 @@ class EventListener(sublime_plugin.EventListener):
             view (View): The view which received the event.
         """
         self.debounce(view, LOAD)
+        self.watch_viewport(view)
 
     def on_close(self, view):
-        """Clean up the debounce dictionary.
+        """Clean up the debounce dictionary and release shared resources.
 
         Arguments:
             view (View): The view which received the event.
@@ -53,6 +75,7 @@ class EventListener(sublime_plugin.EventListener):
             del self.view_events[view.id()]
         except KeyError:
             pass
+        handler.close_view(view)
 
     def on_modified(self, view):
         """Run git_gutter for modified visible view.
@@ -88,6 +111,29 @@ class EventListener(sublime_plugin.EventListener):
             view (View): The view which received the event.
         """
         self.debounce(view, ACTIVATED)
+        self.watch_viewport(view)
+
+    def on_deactivated(self, view):
+        """Stop polling the viewport of a view, which lost focus.
+
+        Arguments:
+            view (View): The view which received the event.
+        """
+        try:
+            self.view_events[view.id()].stop_watching_viewport()
+        except KeyError:
+            pass
+
+    def on_selection_modified(self, view):
+        """Bind gutter regions of lines scrolled into view by the caret.
+
+        Arguments:
+            view (View): The view which received the event.
+        """
+        try:
+            self.view_events[view.id()].check_viewport()
+        except KeyError:
+            pass
 
     def on_hover(self, view, point, hover_zone):
         """Open diff popup if user hovers the mouse over the gutter area.
@@ -125,18 +171,42 @@ class EventListener(sublime_plugin.EventListener):
             view (View): The view to perform evaluation for
             event_id (int): The event identifier
         """
+        listener = self.view_listener(view)
+        if listener:
+            listener.push(event_id)
+
+    def watch_viewport(self, view):
+        """Start polling the viewport of a view, if it is visible.
+
+        Arguments:
+            view (View): The view to poll the viewport of.
+        """
+        listener = self.view_listener(view)
+        if listener:
+            listener.watch_viewport()
+
+    def view_listener(self, view):
+        """Return the ViewEventListener of a view and create it if needed.
+
+        Arguments:
+            view (View): The view to return the listener for.
+
+        Returns:
+            ViewEventListener: The listener or None if the view is invalid.
+        """
         key = view.id()
         try:
-            self.view_events[key].push(event_id)
+            return self.view_events[key]
         except KeyError:
+            new_listener = None
             if view.buffer_id():
                 new_listener = ViewEventListener(view)
-                new_listener.push(event_id)
                 self.view_events[key] = new_listener
             # do garbage connection
             for vid in [vid for vid, listener in self.view_events.items()
                         if listener.view.buffer_id() == 0]:
                 del self.view_events[vid]
+            return new_listener
 
 
 class ViewEventListener(object):
@@ -165,6 +235,13 @@ class ViewEventListener(object):
         self.latest_time = 0.0
         # debounce delay in milliseconds
         self.delay = 0
+        # the number of started and stopped viewport polls, which identifies
+        # the running one
+        self.viewport_poll = 0
+        # viewport is polled flag
+        self.watching_viewport = False
+        # latest visible region of the view
+        self.viewport = None
 
     def push(self, event_id):
         """Push the event to the queue and start idle timer.
@@ -221,6 +298,50 @@ class ViewEventListener(object):
         self.busy = True
         sublime.set_timeout(worker, delay)
 
+    def watch_viewport(self):
+        """Bind gutter regions of lines scrolled into view.
+
+        Sublime Text doesn't send events if a view is scrolled by mouse. So
+        if regions are bound for the viewport only, the visible region is
+        polled while the view has focus and GitGutterCommand is told to bind
+        the regions of the new viewport, once it changed.
+        """
+        if self.watching_viewport or self.settings.viewport_margin is None:
+            return
+        self.viewport_poll += 1
+        poll = self.viewport_poll
+
+        def worker():
+            """The function called to poll the viewport."""
+            if poll != self.viewport_poll:
+                return
+            if self.settings.viewport_margin is None or \
+                    not self.is_view_visible():
+                self.stop_watching_viewport()
+                return
+            self.check_viewport()
+            sublime.set_timeout(worker, VIEWPORT_POLL_INTERVAL)
+
+        self.watching_viewport = True
+        sublime.set_timeout(worker, VIEWPORT_POLL_INTERVAL)
+
+    def stop_watching_viewport(self):
+        """Stop polling the viewport."""
+        if self.watching_viewport:
+            self.watching_viewport = False
+            self.viewport_poll += 1
+
+    def check_viewport(self):
+        """Bind gutter regions of lines scrolled into view, if it changed."""
+        if self.settings.viewport_margin is None:
+            return
+        viewport = self.view.visible_region()
+        if viewport != self.viewport:
+            self.viewport = viewport
+            # events=0 skips validating the work tree
+            self.view.run_command(
+                'git_gutter', {'action': 'update_viewport', 'events': 0})
+
     def is_view_visible(self):
         """Determine if the view is visible.
 
@@ -239,6 +360,40 @@ class ViewEventListener(object):
         return False
 
 
+class TextChangeListener(
+        getattr(sublime_plugin, 'TextChangeListener', object)):
+    """A TextChangeListener to patch the view caches with text changes.
+
+    Sublime Text 4 reports the changed ranges of a buffer, which are used to
+    keep the encoded content of the views up to date without encoding their
+    whole text after each modification. It is an ordinary class with ST3,
+    which is not loaded by the plugin host.
+    """
+
+    @classmethod
+    def is_applicable(cls, buffer):
+        """Attach the listener to all buffers but those of widgets.
+
+        Arguments:
+            buffer (sublime.Buffer): The buffer to check.
+
+        Returns:
+            bool: True to attach a listener to the buffer.
+        """
+        view = buffer.primary_view()
+        return view is not None and not view.settings().get('is_widget')
+
+    def on_text_changed(self, changes):
+        """Patch the view caches of all views of the buffer.
+
+        Arguments:
+            changes (list): The `sublime.TextChange` objects describing the
+                changes in the order they were applied.
+        """
+        for view in self.buffer.views():
+            apply_text_changes(view, changes)
+
+
 class BlameEventListener(sublime_plugin.EventListener):
     """An EventListener to track caret movement and update blame messages."""
 
@@ -1,17 +1,33 @@
-import codecs
 import functools
 import os
 import re
 import subprocess
+import threading
+import weakref
+
+from collections import OrderedDict
+from time import perf_counter
 
 import sublime
 
+from . import blobs
+from . import catfile
+from . import metrics
+from . import objects
 from . import path
+from . import refs
+from . import tasks
 from . import utils
+from . import watcher
+from . import xdiff
+from .hunks import Changes
+from .hunks import Hunks
 from .promise import Promise
 from .promise import PromiseError
 from .tasks import execute_async
+from .temp import MemoryFile
 from .temp import TempFile
+from .temp import memory_files_supported
 from .utils import WIN32
 from .view import GitGutterViewCache
 
@@ -34,6 +50,37 @@ _STATUS_RE = re.compile(
 
 _BUFSIZE = 2**15
 
+# The maximum number of diff results to keep per view.
+_DIFF_CACHE_SIZE = 32
+
+# The maximum number of (commit, path) blob id lookups to keep.
+_BLOB_ID_CACHE_SIZE = 4096
+
+# A full SHA-1 or SHA-256 object id.
+_OID_RE = re.compile(r'^(?:[0-9a-f]{40}|[0-9a-f]{64})$')
+
+# The git commands, which don't modify the repository and therefore may share
+# their output with all callers running the same command at the same time.
+# `blame` is not shared as it reads the view's content from a temporary file,
+# which may change between the callers.
+_READ_ONLY_COMMANDS = frozenset((
+    'for-each-ref', 'log', 'ls-files', 'rev-parse', 'status'))
+
+
+# The handlers of all views by view id.
+_handlers = weakref.WeakValueDictionary()
+
+
+def close_view(view):
+    """Release the shared resources of a closed view's handler.
+
+    Arguments:
+        view (sublime.View): The view which was closed.
+    """
+    git_handler = _handlers.pop(view.id(), None)
+    if git_handler is not None:
+        git_handler.close()
+
 
 class GitGutterHandler(object):
 
@@ -47,6 +94,19 @@ class GitGutterHandler(object):
     # It is initialized once and keeps the values of all object instantces.
     _compare_against_mapping = {}
 
+    # The map of (args, cwd, env, decode) keys of read-only git commands and
+    # the Promise of their running task shared by all object instances.
+    _in_flight = {}
+    _in_flight_lock = threading.Lock()
+
+    # The map of git binaries and whether they can read memory files.
+    _memory_files_support = {}
+
+    # The map of (work tree, commit, path) and the blob id the path refers to
+    # in the commit's tree shared by all object instances.
+    _blob_ids = OrderedDict()
+    _blob_ids_lock = threading.Lock()
+
     def __init__(self, view, settings):
         """Initialize GitGutterHandler object."""
         self.settings = settings
@@ -56,8 +116,8 @@ class GitGutterHandler(object):
         self.view_cache = GitGutterViewCache(view)
         # cached view file name to detect renames
         self._view_file_name = None
-        # path to temporary file with git index content
-        self._git_temp_file = None
+        # leased blob of the compare target's file
+        self._git_blob = None
         # temporary file contains up to date information
         self._git_temp_file_valid = False
         # real path to current work tree
@@ -68,16 +128,53 @@ class GitGutterHandler(object):
         self.git_tracked = False
         # compare target commit hash
         self._git_compared_commit = None
-        # cached git diff result for diff popup
-        self._git_diff_cache = ''
+        # hunks of the recent git diff result for diff popup
+        self._git_hunks = Hunks()
         # cached git binary checked for version
         self._git_binary = None
         # PEP-440 conform git version (major, minor, patch)
         self._git_version = None
         # local dictionary of environment variables
         self._git_env = None
+        # hashable representation of the local environment variables
+        self._git_env_key = None
         # git is accessed via WSL on Windows 10
         self._git_wsl = False
+        # shared git co-processes to read objects of the work tree
+        self._cat_file = None
+        # shared watcher of the work tree's repository state
+        self._watcher = None
+        # repository state generation the cached git state belongs to
+        self._git_generation = None
+        # compare target the temporary git file was read for
+        self._git_compared_refs = None
+        # built-in diff engine keeping the recent result for incremental diffs
+        self._differ = xdiff.Differ()
+        # object id of the compare target's blob
+        self._git_blob_id = None
+        # the compare target's blob is converted by filters when read
+        self._git_filtered = False
+        # the recent diff results keyed by the compared contents and options
+        self._diff_cache = OrderedDict()
+        # the differing sections of the git and view content passed to git
+        self._diff_old_file = None
+        self._diff_new_file = None
+        _handlers[view.id()] = self
+
+    def __del__(self):
+        """Destroy GitGutterHandler object and release shared resources."""
+        self._set_git_blob(None, None)
+        self._release_work_tree()
+
+    def close(self):
+        """Release the shared resources, once the view was closed.
+
+        The git co-processes, the watcher and the blob of the work tree are
+        shared by all its views, so they are released explicitly rather than
+        relying on the garbage collector to destroy the handler.
+        """
+        self.reset_git_file()
+        self._view_file_name = None
 
     def version(self, validate):
         """Return git executable version.
@@ -172,8 +269,20 @@ class GitGutterHandler(object):
                 self.reset_git_file()
                 self._view_file_name = file_name
                 self._git_tree, self._git_path = path.split_work_tree(file_name)
+                if self._git_tree:
+                    self._cat_file = catfile.acquire(self._git_tree)
+                    self._watcher = watcher.acquire(self._git_tree)
         return self._git_tree
 
+    def _release_work_tree(self):
+        """Release the shared git co-processes and watcher of the work tree."""
+        if self._cat_file:
+            self._cat_file = None
+            catfile.release(self._git_tree)
+        if self._watcher:
+            self._watcher = None
+            watcher.release(self._git_tree)
+
     def work_tree_supported(self):
         """The path of the working directory is accessible by git.
 
@@ -204,8 +313,30 @@ class GitGutterHandler(object):
 
     def is_rebase_active(self):
         """Returns True if a rebase is active in the repository."""
-        return os.path.exists(
-            os.path.join(self._git_tree, '.git', 'rebase-merge'))
+        return self._watcher is not None and self._watcher.rebase_active
+
+    def update_git_state(self):
+        """Check whether the repository state changed since the last call.
+
+        The repository's watcher increments its generation whenever HEAD, the
+        index or any ref changes. Cached git state is invalidated only, if the
+        generation differs from the one it was created with.
+
+        Returns:
+            bool: True if the repository state changed and cached git state
+                has been invalidated.
+        """
+        generation = self._watcher.generation if self._watcher else None
+        if generation is not None and generation == self._git_generation:
+            return False
+        self._git_generation = generation
+        self.invalidate_git_file()
+        return True
+
+    def touch_git_state(self):
+        """Invalidate the cached git state of all views of the work tree."""
+        if self._git_tree:
+            watcher.touch(self._git_tree)
 
     def get_compare_against(self):
         """Return the compare target for a view.
@@ -244,8 +375,8 @@ class GitGutterHandler(object):
             return
         self._compare_against_mapping[self._git_tree] = compare_against
         # force refresh if live_mode and focus_change_mode are disabled
-        refresh |= (not self.settings.get('live_mode') and
-                    not self.settings.get('focus_change_mode'))
+        modes = ('live_mode', 'focus_change_mode')
+        refresh |= not any(self.settings.get(mode) for mode in modes)
         # set view id to ommit from evaluation
         active_view_id = 0 if refresh else self.view.id()
         # refresh all visible views
@@ -278,17 +409,24 @@ class GitGutterHandler(object):
         """Invalidate all cached results of recent git commands."""
         self._git_temp_file_valid = False
         self._git_env = None
+        self._git_env_key = None
 
     def reset_git_file(self):
         """Reset cached information of the commited file."""
         self.git_tracked = False
         self._git_compared_commit = None
-        self._git_diff_cache = ''
-        self._git_temp_file = None
+        self._git_hunks = Hunks()
+        self._set_git_blob(None, None)
+        self._diff_cache.clear()
+        self._differ.reset()
+        self._git_generation = None
+        self._git_compared_refs = None
+        self._release_work_tree()
         self._git_tree = None
         self._git_path = None
         self.invalidate_git_file()
 
+    @metrics.timed('stage.update_git_file')
     def update_git_file(self):
         """Update file from git index and write it to a temporary file.
 
@@ -300,13 +438,17 @@ class GitGutterHandler(object):
         Returns:
             Promise resolved with True if the temporary file was updated.
         """
-        # Always resolve with False if temporary file is marked up to date.
-        if self._git_temp_file_valid:
+        # Always resolve with False if temporary file is marked up to date
+        # and the compare target didn't change.
+        refs = self.get_compare_against()
+        is_valid = self._git_temp_file_valid and self._git_compared_refs == refs
+        metrics.hit('cache.git_file', is_valid)
+        if is_valid:
             return Promise.resolve(False)
         self._git_temp_file_valid = True
+        self._git_compared_refs = refs
 
         # Read commit hash from git if compare target is a reference.
-        refs = self.get_compare_against()
         if 'HEAD' in refs or '/' in refs:
             return self.git_compare_commit(refs).then(self._update_from_commit)
         return self._update_from_commit(refs)
@@ -315,7 +457,8 @@ class GitGutterHandler(object):
         """Update git file from commit, if the commit id changed.
 
         The compared_id is compared to the last compare target. If it changed,
-        the temporary git file is updated from the provided commit.
+        the temporary git file is updated from the provided commit, unless the
+        file's blob is still the same.
 
         Arguments:
             compared_id (string): Full hash of the commit the view is currently
@@ -338,6 +481,7 @@ class GitGutterHandler(object):
         Arguments:
             compared_id (string): The new compare target's object id to store.
             output (integer): The size of the file.
+                   (None): The file's blob didn't change.
                    (PromiseError): An error object indicating failure.
 
         Returns:
@@ -348,16 +492,18 @@ class GitGutterHandler(object):
             return False
 
         self._git_compared_commit = compared_id
+        if output is None:
+            return False
+
         self.git_tracked = output > 0
 
         if _HAVE_MINI_DIFF and self.git_tracked and self.view.settings().get('mini_diff', False):
-            # file is still open for writing at this point
-            with open(self._git_temp_file.name, mode='r',
-                      encoding=self.view_cache.python_friendly_encoding()) as file:
-                self.view.set_reference_document(file.read())
+            self.view.set_reference_document(self._git_blob.text(
+                self.view_cache.python_friendly_encoding()))
 
         return self.git_tracked
 
+    @metrics.timed('stage.diff')
     def diff(self):
         """Run git diff to check for inserted, modified and deleted lines.
 
@@ -366,6 +512,7 @@ class GitGutterHandler(object):
         """
         return self.update_git_file().then(self._run_diff)
 
+    @metrics.timed('stage.run_diff')
     def _run_diff(self, updated_git_file):
         """Call git diff and return the decoded unified diff string.
 
@@ -373,19 +520,109 @@ class GitGutterHandler(object):
             updated_git_file (bool): Is True if the file was updated
                 from git database since last call.
         Returns:
-            tuple: (first_line, last_line, [inserted], [modified], [deleted])
+            Changes: (first_line, last_line, [inserted], [modified], [deleted])
                 The processed result of git diff with the information about
                 the modifications of the file.
             None: Returns None if nothing has changed since last call.
         """
+        # the file is unchanged, if it matches the compared blob's index entry
+        if self._git_blob_id and not self.view.is_dirty():
+            entry = self._unchanged_index_entry()
+            if entry and entry.oid == self._git_blob_id:
+                metrics.count('diff.unchanged_stat')
+                self._git_hunks = Hunks()
+                return self.process_diff(self._git_hunks)
+
         updated_view_file = self.view_cache.update()
-        if not updated_git_file and not updated_view_file:
-            return self.process_diff(self._git_diff_cache)
+        unchanged = not updated_git_file and not updated_view_file
+        metrics.hit('cache.diff', unchanged)
+        if unchanged:
+            return self.process_diff(self._git_hunks)
+
+        if self._git_blob_id is None:
+            return self.process_diff(self._git_hunks)
+
+        return execute_async(
+            self._diff_task,
+            self.view_cache.content or b'',
+            self.settings.diff_engine,
+            self.settings.get('diff_algorithm'),
+            self.settings.get('ignore_whitespace'),
+            key=self._git_tree,
+            supersede=self._diff_task_key())
+
+    def _diff_task(self, resolve, new, engine, algorithm, whitespace):
+        """The task to diff the view's content against the compare target.
+
+        Hashing the view's content and preparing the inputs of the diff engine
+        is done by the task, too. As the former diff task of the view is
+        cancelled before and tasks of a work tree run one after another, the
+        inputs of a running diff are never overwritten.
+
+        Arguments:
+            resolve (callable):
+                The function to call to resolve the Promise.
+            new (bytes):
+                The encoded content of the view.
+            engine (string):
+                The diff engine to use.
+            algorithm (string):
+                The diff algorithm to use.
+            whitespace (string):
+                The kind of whitespace changes to ignore.
+        """
+        # the view is unchanged, if its content hashes to the compared blob
+        content_id = objects.hash_blob(new)
+        if not self._git_filtered and self._git_blob_id == content_id:
+            metrics.count('diff.identical')
+            self._git_hunks = Hunks()
+            return resolve(self.process_diff(self._git_hunks))
+
+        # reuse the result of a recent diff of the same contents
+        key = (self._git_blob_id, content_id, whitespace, algorithm)
+        cached = self._diff_cache.get(key)
+        metrics.hit('cache.diff_result', cached is not None)
+        if cached:
+            self._diff_cache.move_to_end(key)
+            self._git_hunks, contents = cached
+            return resolve(contents)
+
+        if engine == 'python':
+            diff = self._run_python_diff(new, algorithm, whitespace)
+        else:
+            try:
+                diff = self._run_git_diff(new)
+            except OSError as error:
+                utils.log_message('failed to write diff input! %s' % error)
+                return resolve(self.process_diff(self._git_hunks))
+        if tasks.is_cancelled():
+            return None
+        return resolve(self._decode_diff(diff, key))
+
+    def _run_git_diff(self, new):
+        """Compare the git and view content using `git diff --no-index`.
 
-        if not self._git_temp_file:
-            return self.process_diff(self._git_diff_cache)
+        Only the differing sections of both contents are passed to git.
 
-        return self.execute_async(list(filter(None, (
+        Arguments:
+            new (bytes): The encoded content of the view.
+
+        Returns:
+            bytes: The binary unified diff or None if git failed.
+
+        Raises:
+            OSError: If the inputs can't be written.
+        """
+        lines, old, new = xdiff.trim_common_lines(
+            self._read_git_content(), new)
+        old_file, new_file = self._diff_files()
+        with old_file as file:
+            file.write(old)
+        if new_file:
+            with new_file as file:
+                file.write(new)
+
+        diff = self._communicate(list(filter(None, (
             self._git_binary,
             '-c', 'core.autocrlf=input',
             '-c', 'core.eol=lf',
@@ -393,77 +630,150 @@ class GitGutterHandler(object):
             'diff', '-U0', '--no-color', '--no-index', '--no-ext-diff',
             self.settings.ignore_whitespace,
             self.settings.diff_algorithm,
-            self.translate_path_to_wsl(self._git_temp_file.name),
-            self.translate_path_to_wsl(self.view_cache.name)
-        ))), decode=False).then(self._decode_diff)
+            self.translate_path_to_wsl(old_file.name),
+            self.translate_path_to_wsl(new_file.name) if new_file else '-'
+        ))), (old_file.fd,) if isinstance(old_file, MemoryFile) else (),
+            None if new_file else new)
+        return xdiff.shift_hunks(diff, lines)
+
+    def _diff_files(self):
+        """Return the files to pass the contents to `git diff` with.
+
+        If the "diff_transport" setting is "memory", the view's content is
+        passed via stdin and the compare target's content via an anonymous
+        file in memory, if git can read it. Temporary files are used
+        otherwise.
+
+        Returns:
+            tuple: (old_file, new_file) with old_file being a MemoryFile or
+                TempFile and new_file a TempFile or None to use stdin.
+        """
+        use_memory = self.settings.diff_transport == 'memory' and \
+            not self._git_wsl
+        use_memfd = use_memory and self._memory_files_readable()
+        if self._diff_old_file is None or use_memfd != isinstance(
+                self._diff_old_file, MemoryFile):
+            self._diff_old_file = None
+            if use_memfd:
+                try:
+                    self._diff_old_file = MemoryFile()
+                except OSError as error:
+                    utils.log_message(
+                        'failed to create memory file! %s' % error)
+            if self._diff_old_file is None:
+                self._diff_old_file = TempFile(mode='wb')
+        if use_memory:
+            self._diff_new_file = None
+        elif self._diff_new_file is None:
+            self._diff_new_file = TempFile(mode='wb')
+        return self._diff_old_file, self._diff_new_file
+
+    def _memory_files_readable(self):
+        """Check whether git can compare memory files via `/proc/self/fd`.
+
+        Git before 2.42 compares the `/proc/self/fd/<fd>` symlinks instead of
+        the files they point to. So it is checked once per git binary,
+        whether git reads the content of memory files.
+
+        Returns:
+            bool: True if MemoryFile objects can be passed to `git diff`.
+        """
+        result = self._memory_files_support.get(self._git_binary)
+        if result is None:
+            result = False
+            if memory_files_supported():
+                try:
+                    files = (MemoryFile(), MemoryFile())
+                    for file, content in zip(files, (b'old\n', b'new\n')):
+                        with file as stream:
+                            stream.write(content)
+                    proc = self.popen([
+                        self._git_binary, 'diff', '--no-index', '--no-color',
+                        '--no-ext-diff', '-U0'
+                    ] + [file.name for file in files],
+                        pass_fds=tuple(file.fd for file in files))
+                    output = proc.communicate()[0]
+                    result = b'\n-old\n+new\n' in output
+                except OSError as error:
+                    utils.log_message(str(error))
+            self._memory_files_support[self._git_binary] = result
+        return result
+
+    def _read_git_content(self):
+        """Return the content of the compare target's file.
+
+        Returns:
+            bytes: The content of the leased blob or an empty content if the
+                file doesn't exist in the compare target.
+        """
+        blob = self._git_blob
+        return blob.content if blob else b''
+
+    def _run_python_diff(self, new, algorithm, whitespace):
+        """Compare the git and view content using the built-in xdiff port.
+
+        Avoids spawning `git diff --no-index` by running the python port of
+        git's xdiff library on the background thread.
+
+        The git file's content is read once after it was updated and kept in
+        memory together with the recent diff result, so edits to the view are
+        diffed incrementally within the window of touched lines.
+
+        Arguments:
+            new (bytes): The encoded content of the view.
+            algorithm (string): The diff algorithm to use.
+            whitespace (string): The kind of whitespace changes to ignore.
 
-    def _decode_diff(self, results):
-        encoding = self.view_cache.python_friendly_encoding()
+        Returns:
+            bytes: The binary unified diff or None on failure.
+        """
         try:
-            decoded_results = results.decode(encoding)
-        except AttributeError:
-            # git returned None on stdout
-            decoded_results = ''
-        except UnicodeError:
-            try:
-                decoded_results = results.decode('utf-8')
-            except UnicodeDecodeError:
-                decoded_results = ''
-        except LookupError:
-            try:
-                decoded_results = codecs.decode(results)
-            except UnicodeDecodeError:
-                decoded_results = ''
+            return self._differ.diff(
+                self._read_git_content(), new, algorithm, whitespace)
+        except Exception as error:
+            utils.log_message(str(error))
+            return None
+
+    def _diff_task_key(self):
+        """Return the key to cancel outdated diff tasks of the view with."""
+        return ('diff', self.view.id())
+
+    def _decode_diff(self, results, key=None):
+        """Index the hunks of the diff and cache them.
+
+        The diff is kept as bytes. Hunks are decoded on demand only.
+
+        Arguments:
+            results (bytes): The output of the diff engine or None on failure.
+            key (tuple): The key to cache the parsed result with.
+
+        Returns:
+            tuple: The result of `process_diff()`.
+        """
         # cache the diff result for reuse with diff_popup.
-        self._git_diff_cache = decoded_results
-        return self.process_diff(decoded_results)
+        self._git_hunks = Hunks(
+            results or b'', self.view_cache.python_friendly_encoding())
+        contents = self.process_diff(self._git_hunks)
+        if key and results is not None:
+            self._diff_cache[key] = (self._git_hunks, contents)
+            self._diff_cache.move_to_end(key)
+            while len(self._diff_cache) > _DIFF_CACHE_SIZE:
+                self._diff_cache.popitem(last=False)
+        return contents
 
     @staticmethod
-    def process_diff(diff_str):
-        r"""Parse unified diff with 0 lines of context.
-
-        Hunk range info format:
-          @@ -3,2 +4,0 @@
-            Hunk originally starting at line 3, and occupying 2 lines, now
-            starts at line 4, and occupies 0 lines, i.e. it was deleted.
-          @@ -9 +10,2 @@
-            Hunk size can be omitted, and defaults to one line.
-
-        Dealing with ambiguous hunks:
-          "A\nB\n" -> "C\n"
-          Was 'A' modified, and 'B' deleted? Or 'B' modified, 'A' deleted?
-          Or both deleted? To minimize confusion, let's simply mark the
-          hunk as modified.
+    @metrics.timed('stage.process_diff')
+    def process_diff(hunks):
+        """Convert the hunks of a unified diff to the changed lines.
 
         Arguments:
-            diff_str (string): The unified diff string to parse.
-
-        Returns:
-            tuple: (first, last, [inserted], [modified], [deleted])
-                A tuple with meta information of the diff result.
-        """
-        # first and last changed line in the view
-        first, last = 0, 0
-        # lists with inserted, modified and deleted lines
-        inserted, modified, deleted = [], [], []
-        hunk_re = r'^@@ \-(\d+),?(\d*) \+(\d+),?(\d*) @@'
-        for hunk in re.finditer(hunk_re, diff_str, re.MULTILINE):
-            _, old_size, start, new_size = hunk.groups()
-            start = int(start)
-            old_size = int(old_size or 1)
-            new_size = int(new_size or 1)
-            if first == 0:
-                first = max(1, start)
-            if not old_size:
-                last = start + new_size
-                inserted += range(start, last)
-            elif not new_size:
-                last = start + 1
-                deleted.append(last)
-            else:
-                last = start + new_size
-                modified += range(start, last)
-        return (first, last, inserted, modified, deleted)
+            hunks (Hunks): The hunks of the diff.
+
+        Returns:
+            Changes: The runs of inserted, modified and deleted lines, which
+                unpack like (first, last, [inserted], [modified], [deleted]).
+        """
+        return Changes(hunks)
 
     def diff_changed_blocks(self):
         """Create a list of all changed code blocks from cached diff result.
@@ -471,9 +781,7 @@ class GitGutterHandler(object):
         Returns:
             list: A list with the row numbers of all changed code blocks.
         """
-        hunk_re = r'^@@ \-\d+,?\d* \+(\d+),?\d* @@'
-        hunks = re.finditer(hunk_re, self._git_diff_cache, re.MULTILINE)
-        return [int(hunk.group(1)) for hunk in hunks]
+        return self._git_hunks.starts.tolist()
 
     def diff_line_change(self, row):
         """Use cached diff result to extract the changes of a certain line.
@@ -485,78 +793,37 @@ class GitGutterHandler(object):
             tuple: The tuple contains 4 items of information about changes
                 around the row with (deleted_lines, start, size, meta).
         """
-        hunk_re = r'^@@ \-(\d+),?(\d*) \+(\d+),?(\d*) @@'
-        hunks = re.finditer(hunk_re, self._git_diff_cache, re.MULTILINE)
+        hunks = self._git_hunks
+        index = hunks.find(row)
+        if index < 0:
+            return ([], -1, -1, {})
+
+        _, _, start, size = hunks[index]
+        starts = hunks.starts
+        # the position of the surrounding changes
+        first_change = starts[0]
+        prev_change = starts[index - 1] if index > 0 else None
+        next_change = starts[index + 1] if index + 1 < len(starts) else None
         # if wrap is disable avoid wrapping
-        wrap = self.settings.get('next_prev_change_wrap')
-        # we also want to extract the position of the surrounding changes
-        first_change = prev_change = next_change = None
-
-        for hunk in hunks:
-            _, _, start, size = hunk.groups()
-            start = int(start)
-            size = int(size or 1)
-            if first_change is None:
-                first_change = start
-            # special handling to also match the line below deleted
-            # content
-            if size == 0 and row == start + 1:
-                pass
-            # continue if the hunk is before the line
-            elif start + size < row:
-                prev_change = start
-                continue
-            # break if the hunk is after the line
-            elif row < start:
-                break
-            # in the following the line is inside the hunk
-            try:
-                next_hunk = next(hunks)
-                hunk_end = next_hunk.start()
-                next_change = int(next_hunk.group(3))
-            except:
-                hunk_end = len(self._git_diff_cache)
-
-            if not wrap:
-                if prev_change is None:
-                    prev_change = start
-                if next_change is None:
-                    next_change = start
-
-            # if prev change is None set it to the wrap around the
-            # document: prev -> last hunk, next -> first hunk
+        if not self.settings.get('next_prev_change_wrap'):
             if prev_change is None:
-                try:
-                    remaining_hunks = list(hunks)
-                    if remaining_hunks:
-                        last_hunk = remaining_hunks[-1]
-                        prev_change = int(last_hunk.group(3))
-                    elif next_change is not None:
-                        prev_change = next_change
-                    else:
-                        prev_change = start
-                except:
-                    prev_change = start
+                prev_change = start
             if next_change is None:
-                next_change = first_change
-
-            # extract the content of the hunk
-            hunk_content = self._git_diff_cache[hunk.start():hunk_end]
-            # store all deleted lines (starting with -)
-            hunk_lines = hunk_content.splitlines()[1:]
-            deleted_lines = [
-                line[1:] for line in hunk_lines if line.startswith("-")
-            ]
-            added_lines = [line[1:] for line in hunk_lines
-                           if line.startswith("+")]
-            meta = {
-                "added_lines": added_lines,
-                "first_change": first_change,
-                "next_change": next_change,
-                "prev_change": prev_change
-            }
-            return (deleted_lines, start, size, meta)
-        return ([], -1, -1, {})
+                next_change = start
+        # wrap around the document: prev -> last hunk, next -> first hunk
+        if prev_change is None:
+            prev_change = starts[-1]
+        if next_change is None:
+            next_change = first_change
+
+        deleted_lines, added_lines = hunks.lines(index)
+        meta = {
+            "added_lines": added_lines,
+            "first_change": first_change,
+            "next_change": next_change,
+            "prev_change": prev_change
+        }
+        return (deleted_lines, start, size, meta)
 
     def untracked(self):
         """Determine whether the view shows an untracked file."""
@@ -587,7 +854,7 @@ class GitGutterHandler(object):
             'log', '--all',
             '--pretty="%h | %s\a%an <%aE>\a%ad (%ar)"',
             '--date=local', '--max-count=9000'
-        ])
+        ], priority=tasks.PRIORITY_INTERACTIVE)
 
     def git_file_commits(self):
         r"""Query all commits with changes to the attached file.
@@ -604,44 +871,136 @@ class GitGutterHandler(object):
             '--pretty="%at\a%h | %s\a%an <%aE>\a%ad (%ar)"',
             '--date=local', '--max-count=9000',
             '--', self._git_path
-        ])
+        ], priority=tasks.PRIORITY_INTERACTIVE)
 
     def git_branches(self):
-        """Query all branches of the file's repository."""
-        template = (
-            '--format="%(refname)\a%(objectname:short) | %(subject)'
-            '\a%(committername) %(committeremail)\a%(committerdate)"'
-        )
-        return self.execute_async([
-            self._git_binary,
-            'for-each-ref', '--sort=-committerdate', template, 'refs/heads/'
-        ])
+        """Query all branches of the file's repository.
+
+        Returns:
+            Promise: A promise resolved with a list of
+                (refname, '<commit> | <subject>', '<name> <email>', <date>,
+                <timestamp>) tuples sorted by committer date in descending
+                order.
+        """
+        return self._git_refs('refs/heads/').then(
+            lambda items: sorted(items, key=lambda item: -item[4]))
 
     def git_tags(self):
         """Query all tags of the file's repository.
 
-        Use the plumping for-each-ref to read the tag information.
-        Both tagger- and committer- name/date are read because the first one
-        is valid for annoted and later for simple tags.
+        The tagger name and date are used for annotated tags and the
+        committer's ones for lightweight tags.
+
+        Returns:
+            Promise: A promise resolved with a list of
+                (refname, '<commit> | <subject>', '<name> <email>', <date>,
+                <timestamp>) tuples sorted by refname in descending order.
         """
-        template = (
-            '--format="%(refname)\a%(objectname:short) | %(subject)'
-            '\a%(taggername) %(taggeremail)\a%(taggerdate)'
-            '\a%(committername) %(committeremail)\a%(committerdate)"'
-        )
-        return self.execute_async([
-            self._git_binary,
-            'for-each-ref', '--sort=-refname', template, 'refs/tags/'
-        ])
+        return self._git_refs('refs/tags/').then(
+            lambda items: sorted(items, reverse=True))
+
+    def _git_refs(self, prefix):
+        """Query information about all refs starting with prefix.
+
+        The refs are listed by the native ref reader and the referenced
+        objects are read via the work tree's `git cat-file --batch` process.
+        If the repository's refs can't be read natively, `git for-each-ref`
+        is used instead.
+
+        Arguments:
+            prefix (string): The prefix of the refs to list like 'refs/heads/'.
+
+        Returns:
+            Promise: A promise resolved with a list of
+                (refname, '<commit> | <subject>', '<name> <email>', <date>,
+                <timestamp>) tuples.
+        """
+        def task_fn(resolve, prefix):
+            """The task to run asynchronously which resolves the Promise.
+
+            Arguments:
+                resolve (callable):
+                    The function to call to resolve the Promise.
+                prefix (string):
+                    The prefix of the refs to list.
+            """
+            try:
+                reader = self._watcher.refs
+                if not reader.is_supported():
+                    raise OSError('refs not supported')
+                items = []
+                abbrev = reader.abbrev_length()
+                for refname, oid in reader.list_refs(prefix).items():
+                    content = self._cat_file.read(
+                        self.popen, self._git_binary, oid)
+                    if content is None:
+                        continue
+                    headers, subject = refs.parse_object(content)
+                    name, email, timestamp, date = refs.parse_ident(
+                        headers.get('tagger') or headers.get('committer'))
+                    items.append((
+                        refname, '%s | %s' % (oid[:abbrev], subject),
+                        ' '.join((name, email)), date, timestamp))
+                return resolve(items)
+            except Exception as error:
+                if self.settings.get('debug'):
+                    utils.log_message(str(error))
+
+            template = (
+                '--format=%(refname)\a%(objectname:short) | %(subject)'
+                '\a%(taggername) %(taggeremail)\a%(taggerdate:raw)'
+                '\a%(committername) %(committeremail)\a%(committerdate:raw)'
+            )
+            try:
+                proc = self.popen([
+                    self._git_binary, 'for-each-ref', template, prefix])
+                output = proc.stdout.read().decode('utf-8')
+            except Exception as error:
+                utils.log_message(str(error))
+                return resolve([])
+
+            items = []
+            for line in output.splitlines():
+                try:
+                    refname, commit, tname, tdate, cname, cdate = \
+                        line.split('\a')
+                    tdate = tdate.split() or cdate.split()
+                    timestamp = int(tdate[0])
+                    items.append((
+                        refname, commit, tname.strip() or cname,
+                        refs.format_date(timestamp, tdate[1]), timestamp))
+                except (IndexError, ValueError):
+                    pass
+            return resolve(items)
+
+        return execute_async(
+            task_fn, prefix, key=self._git_tree,
+            priority=tasks.PRIORITY_INTERACTIVE)
 
     def git_branch_name(self):
+        """Query the abbreviated name of the checked out branch.
+
+        HEAD is read natively, if possible. `git rev-parse` is called
+        otherwise.
+
+        Returns:
+            Promise: A promise resolved with the branch name or 'HEAD' if
+                detached.
+        """
+        branch = self._watcher.refs.branch_name() if self._watcher else None
+        if branch:
+            return Promise.resolve(branch)
         return self.execute_async([
             self._git_binary,
             'rev-parse', '--abbrev-ref', 'HEAD'
-        ])
+        ], priority=tasks.PRIORITY_BACKGROUND)
+
+    def git_branch_status(self, priority=tasks.PRIORITY_BACKGROUND):
+        """Query the current status of the file's repository.
 
-    def git_branch_status(self):
-        """Query the current status of the file's repository."""
+        Arguments:
+            priority (int): The priority of the `git status` task.
+        """
         def parse_output(output):
             """Parse output of git status and cache the value."""
             added, deleted, modified, staged = 0, 0, 0, 0
@@ -676,19 +1035,50 @@ class GitGutterHandler(object):
             self._git_binary,
             '-c', 'color.status=never',
             'status', '-b', '-s', '-u'
-        ]).then(parse_output)
+        ], priority=priority).then(parse_output)
 
     def git_compare_commit(self, compare_against):
         """Query the commit hash of the compare target.
 
+        Plain references are resolved by reading the repository's refs from
+        disk. Revision expressions like `HEAD~1` are resolved by the work
+        tree's shared `git cat-file --batch-check` process to avoid spawning
+        `git rev-parse` each time.
+
         Arguments:
             compare_against  - The reference to compare against if not a hash.
+
+        Returns:
+            Promise: A promise resolved with the full hash of the compare
+                target or the unresolved reference, if it does not exist.
         """
-        return self.execute_async([
-            self._git_binary, 'rev-parse', compare_against])
+        if self._watcher:
+            commit = self._watcher.refs.resolve(compare_against)
+            if commit:
+                return Promise.resolve(commit)
+
+        def task_fn(resolve, compare_against):
+            """The task to run asynchronously which resolves the Promise.
+
+            Arguments:
+                resolve (callable):
+                    The function to call to resolve the Promise.
+                compare_against (string):
+                    The reference to resolve.
+            """
+            try:
+                commit = self._cat_file.object_id(
+                    self.popen, self._git_binary, compare_against)
+            except Exception as error:
+                utils.log_message(str(error))
+                commit = None
+            return resolve(commit or compare_against)
+
+        return execute_async(task_fn, compare_against, key=self._git_tree)
 
     def git_blame(self, row):
         """Call git blame to find out who changed a specific line of code"""
+        contents = self.view_cache.write() or self.view_cache.name
         if self.settings.get('line_annotation_ignore_whitespace'):
             ignore_ws = ['-w']
         else:
@@ -701,17 +1091,33 @@ class GitGutterHandler(object):
             '-c', 'core.safecrlf=false',
             'blame', '-p', '-L%d,%d' % (row + 1, row + 1)
         ] + ignore_ws + [
-            '--contents', self.translate_path_to_wsl(self.view_cache.name),
+            '--contents', self.translate_path_to_wsl(contents),
             '--', self._git_path
-        ])
+        ], priority=tasks.PRIORITY_INTERACTIVE)
 
     def git_read_file(self, commit):
         """Read the content of the file from specific commit.
 
-        This method uses `git cat-files` to read the file content from git
-        index to enable support of smudge filters (fixes Issue #74). Git
-        applies smudge filters to some commands like `archive`, `diff`,
-        `checkout` and `cat-file` only, but not to commands like `show`.
+        The blob is looked up and read by the work tree's shared
+        `git cat-file --batch-check` and `git cat-file --batch` processes.
+        If the "object_reader" setting is "python", loose objects and packs
+        are read from the object database directly, falling back to git for
+        objects, which can't be read that way.
+
+        Files with smudge filters or eol conversion are read by a dedicated
+        `git cat-file --filters` call to enable support of smudge filters
+        (fixes Issue #74). Git applies smudge filters to some commands like
+        `archive`, `diff`, `checkout` and `cat-file` only, but not to commands
+        like `show`.
+
+        If the file on disk matches its index entry and the entry's blob is
+        the one of the compare target, the file is copied from disk, as it is
+        the checked out content of the blob.
+
+        Blobs are shared with all other views via the blob store, so a blob
+        is read only, if no other view holds it. The current blob is kept, if
+        the blob id didn't change, so a commit causes only the files, which
+        are part of it, to be read again.
 
         Arguments:
             commit (string): The identifier of the commit to read file from.
@@ -719,11 +1125,10 @@ class GitGutterHandler(object):
         Returns:
             Promise: A promise to read the content of a file from git index.
 
-            The Promise resolves with the number of bytes written to the cache
-            in case of success.
+            The Promise resolves with the size of the file in case of success
+            or None if the blob didn't change.
 
-            The Promise resolves with PromiseError if the cache file could not
-            be created, opened or written data to, if git failed to run or
+            The Promise resolves with PromiseError if git failed to run or
             returned a none-zero exit code other than 128 (file not found).
         """
         def task_fn(resolve, commit):
@@ -737,48 +1142,246 @@ class GitGutterHandler(object):
                     The identifier of the commit to read file from.
             """
             try:
-                if not self._git_temp_file:
-                    self._git_temp_file = TempFile(mode='wb')
-
-                with self._git_temp_file as temp_file:
-                    proc = self.popen([
-                        self._git_binary,
-                        '-c', 'core.autocrlf=input',
-                        '-c', 'core.eol=lf',
-                        '-c', 'core.safecrlf=false',
-                        'cat-file',
-                        # smudge filters are supported with git 2.11.0+ only
-                        '--filters' if self._git_version >= (2, 11, 0) else '-p',
-                        ':'.join((commit, self._git_path))
-                    ], stdout=temp_file)
-
-                    proc.wait()
-
-                    if proc.returncode == 0:
-                        # resolve with the number of bytes got from git cat-file
-                        return resolve(temp_file.tell())
-                    elif proc.returncode == 128:
-                        # resolve with 0 bytes if file was not found in repo.
-                        return resolve(0)
-                    return resolve(PromiseError("git returned error %d: %s" % (
-                        proc.returncode, proc.stderr.read().decode('utf-8'))))
+                store = self._object_store()
+                oid = self._git_blob_id_of(commit, store)
+                if oid is not None and oid == self._git_blob_id:
+                    metrics.count('git.blob_reused')
+                    return resolve(None)
+                if not oid:
+                    # resolve with 0 bytes if file was not found in repo.
+                    self._set_git_blob(oid, None)
+                    return resolve(0)
+
+                blob = self._read_blob_from_disk(oid)
+                if blob is None:
+                    # smudge filters are supported with git 2.11.0+ only
+                    filtered = self._git_version >= (2, 11, 0) and \
+                        self._cat_file.needs_filters(
+                            self.popen, self._git_binary, self._git_path)
+                    key = (oid, self._git_tree, self._git_path) \
+                        if filtered else oid
+                    blob = blobs.acquire(key)
+                    if blob is None:
+                        content = self._read_blob(oid, store, filtered)
+                        if isinstance(content, PromiseError):
+                            return resolve(content)
+                        if content is None:
+                            # resolve with 0 bytes if file was not found.
+                            self._set_git_blob('', None)
+                            return resolve(0)
+                        blob = blobs.add(key, content)
+
+                self._set_git_blob(oid, blob)
+                return resolve(blob.size)
 
             except Exception as error:
                 return resolve(PromiseError(str(error)))
 
-        return execute_async(task_fn, commit)
+        return execute_async(task_fn, commit, key=self._git_tree)
+
+    def _read_blob_from_disk(self, oid):
+        """Read the compare target's blob from the file on disk.
+
+        The file on disk is the checked out content of the blob, if it matches
+        the blob's index entry. If filters converted it, it is shared with
+        views of the same file only, as the output of `git cat-file --filters`
+        may still differ from it.
+
+        Arguments:
+            oid (string): The object id of the compare target's blob.
+
+        Returns:
+            blobs.Blob: The leased blob or None if the file doesn't match.
+        """
+        entry = self._unchanged_index_entry(parse=True)
+        if not entry or entry.oid != oid:
+            return None
+        with open(self._view_file_name, 'rb') as file:
+            content = file.read()
+        if len(content) != entry.size:
+            return None
+        metrics.count('git.read_from_disk')
+        if objects.hash_blob(content) == oid:
+            return blobs.add(oid, content)
+        return blobs.add(
+            ('disk', oid, self._git_tree, self._git_path), content)
+
+    def _read_blob(self, oid, store, filtered):
+        """Read the content of a blob from the repository.
+
+        Arguments:
+            oid (string): The object id of the blob.
+            store (objects.ObjectStore): The native object reader or None.
+            filtered (bool): True to apply smudge filters and eol conversion.
+
+        Returns:
+            bytes: The content of the blob or None if it doesn't exist.
+            PromiseError: If git failed.
+        """
+        if not filtered:
+            if store:
+                obj = store.read(oid)
+                if obj and obj[0] == 'blob':
+                    return obj[1]
+            return self._cat_file.read(self.popen, self._git_binary, oid)
+
+        proc = self.popen([self._git_binary] + list(
+            catfile.GIT_CONFIG_ARGS) + [
+            'cat-file', '--filters', '--path=' + self._git_path, oid
+        ])
+        content, error = proc.communicate()
+        if proc.returncode == 0:
+            return content
+        elif proc.returncode == 128:
+            return None
+        return PromiseError("git returned error %d: %s" % (
+            proc.returncode, error.decode('utf-8')))
+
+    def _set_git_blob(self, oid, blob):
+        """Replace the leased blob of the compare target.
+
+        Arguments:
+            oid (string): The object id of the blob or an empty string if the
+                file doesn't exist in the compare target.
+            blob (blobs.Blob): The leased blob or None.
+        """
+        former, self._git_blob = self._git_blob, blob
+        self._git_blob_id = oid
+        self._git_filtered = blob is not None and blob.key != oid
+        if former:
+            blobs.release(former)
+
+    def _git_blob_id_of(self, commit, store):
+        """Look up the blob id of the file in a commit.
+
+        The result is cached per (work tree, commit, path) if commit is a
+        full object id, as the tree of a commit never changes.
+
+        Arguments:
+            commit (string): The identifier of the commit to read the id from.
+            store (objects.ObjectStore): The native object reader or None.
+
+        Returns:
+            string: The blob id, an empty string if the file doesn't exist in
+                the commit or None if the lookup failed.
+        """
+        key = (self._git_tree, commit, self._git_path)
+        with self._blob_ids_lock:
+            oid = self._blob_ids.get(key)
+            if oid is not None:
+                self._blob_ids.move_to_end(key)
+        metrics.hit('cache.blob_id', oid is not None)
+        if oid is not None:
+            return oid
+
+        if store:
+            commit_id = self._watcher.refs.resolve(commit)
+            if commit_id:
+                oid = store.blob_id(commit_id, self._git_path)
+        if oid is None:
+            oid = self._cat_file.object_id(
+                self.popen, self._git_binary,
+                ':'.join((commit, self._git_path)))
+
+        if oid is not None and _OID_RE.match(commit):
+            with self._blob_ids_lock:
+                self._blob_ids[key] = oid
+                while len(self._blob_ids) > _BLOB_ID_CACHE_SIZE:
+                    self._blob_ids.popitem(last=False)
+        return oid
+
+    def _unchanged_index_entry(self, parse=False):
+        """Return the index entry of the view's file, if the file matches it.
+
+        Arguments:
+            parse (bool): True to parse a changed index on the calling thread.
+                Otherwise it is parsed in background and None is returned.
+
+        Returns:
+            index.IndexEntry: The entry if the file on disk has the content
+                of the entry's blob according to its stat or None otherwise.
+        """
+        index = self._watcher.index if self._watcher else None
+        if not index or not self._view_file_name:
+            return None
+        if not parse and not index.is_current():
+            # parse a changed index in background and skip the check until
+            # then, as large indexes take a while to parse
+            execute_async(
+                lambda resolve: resolve(index.entries()), key=index,
+                priority=tasks.PRIORITY_BACKGROUND)
+            return None
+        try:
+            stat = os.stat(self._view_file_name)
+        except OSError:
+            return None
+        return index.unchanged_entry(self._git_path, stat, parse)
+
+    def _object_store(self):
+        """Return the native object reader if enabled by settings.
 
-    def execute_async(self, args, decode=True):
+        Returns:
+            objects.ObjectStore: The work tree's shared object reader or None.
+        """
+        if self._watcher and self.settings.object_reader == 'python':
+            return self._watcher.objects
+        return None
+
+    def execute_async(self, args, decode=True,
+                      priority=tasks.PRIORITY_NORMAL, supersede=None):
         """Execute a git command asynchronously and return a Promise.
 
         Arguments:
             args (list): The command line arguments used to run git.
             decode (bool): If True the git's output is decoded assuming utf-8
                       which is the default output encoding of git.
+            priority (int): The priority of the task.
+            supersede (any): The key of a former task to cancel, as its
+                      result would be outdated.
+
+        Read-only commands are coalesced with an identical one of the same
+        priority, which is still in flight, so all callers share a single git
+        process and its output. A caller doesn't wait for a task of lower
+        priority this way.
+
+        Returns:
+            Promise: A promise to return the git output in the future.
+        """
+        key = None
+        if supersede is None and _git_command(args) in _READ_ONLY_COMMANDS:
+            key = (
+                tuple(args), self._git_tree, self.environment_key(), decode,
+                priority)
+            with self._in_flight_lock:
+                promise = self._in_flight.get(key)
+                metrics.hit('cache.in_flight', promise is not None)
+                if promise:
+                    return promise
+                # register the task before it can finish
+                promise = self._in_flight[key] = self._execute_async(
+                    args, decode, priority, supersede, key)
+                return promise
+        return self._execute_async(args, decode, priority, supersede, key)
+
+    def _execute_async(self, args, decode, priority, supersede, key):
+        """Queue the task to execute a git command.
+
+        Arguments:
+            args (list): The command line arguments used to run git.
+            decode (bool): If True the git's output is decoded.
+            priority (int): The priority of the task.
+            supersede (any): The key of a former task to cancel.
+            key (tuple): The key of the coalesced command or None.
 
         Returns:
             Promise: A promise to return the git output in the future.
         """
+        def forget():
+            """Stop sharing the Promise with new callers of the command."""
+            if key:
+                with self._in_flight_lock:
+                    self._in_flight.pop(key, None)
+
         def task_fn(resolve, decode, args):
             """The task to run asynchronously which resolves the Promise.
 
@@ -790,28 +1393,88 @@ class GitGutterHandler(object):
                 args (list):
                     A list of arguments to pass to `subprocess.Popen`.
             """
-            try:
-                proc = self.popen(args)
-            except Exception as error:
-                utils.log_message(str(error))
-                return resolve(None)
-
-            chunk = proc.stdout.read()
-            if not chunk and self.settings.get('debug'):
-                proc.wait()
-                # 0 = ok, 128 = file not found
-                if proc.returncode not in (0, 128):
-                    utils.log_message('%s failed with "%s"' % (
-                        ' '.join(args), proc.stderr.read().decode('utf-8').strip()))
+            chunk = self._communicate(args)
+            forget()
+            if tasks.is_cancelled():
+                return None
 
             # return decoded ouptut using utf-8 or binary output
             if decode and chunk is not None:
                 return resolve(chunk.decode('utf-8').strip())
             return resolve(chunk)
 
-        return execute_async(task_fn, decode, args)
+        return execute_async(
+            task_fn, decode, args, key=self._git_tree,
+            priority=priority, supersede=supersede, on_cancel=forget)
+
+    def _communicate(self, args, pass_fds=(), stdin=None):
+        """Run a git command on the current task's thread.
+
+        The process is attached to the running task to kill it, if the task is
+        cancelled.
+
+        Arguments:
+            args (list): The command line arguments used to run git.
+            pass_fds (tuple): The file descriptors to keep open in git.
+            stdin (bytes): The data to write to git's stdin.
+
+        Returns:
+            bytes: The binary output of git or None if it can't be started.
+        """
+        start = perf_counter()
+        try:
+            proc = self.popen(args, pass_fds=pass_fds)
+        except Exception as error:
+            utils.log_message(str(error))
+            return None
+
+        # kill git if the task is cancelled while running
+        tasks.attach(proc)
+        if stdin is None:
+            chunk, error = proc.stdout.read(), None
+        else:
+            chunk, error = proc.communicate(stdin)
+        metrics.record(
+            'git.' + (_git_command(args) or 'unknown'),
+            perf_counter() - start)
+        if not chunk and not tasks.is_cancelled() and \
+                self.settings.get('debug'):
+            proc.wait()
+            # 0 = ok, 128 = file not found
+            if proc.returncode not in (0, 128):
+                if error is None:
+                    error = proc.stderr.read()
+                utils.log_message('%s failed with "%s"' % (
+                    ' '.join(args), error.decode('utf-8').strip()))
+        return chunk
+
+    def environment(self):
+        """Return the environment variables to run git with.
 
-    def popen(self, args, stdout=subprocess.PIPE):
+        Returns:
+            dict: The environment of Sublime Text updated by the "env" setting.
+        """
+        if self._git_env is None:
+            env = os.environ.copy()
+            # don't let `git status` refresh the index, which would trigger
+            # the repository watcher of the work tree again
+            env['GIT_OPTIONAL_LOCKS'] = '0'
+            for key, value in self.settings.get('env', {}).items():
+                if value is None:
+                    env.pop(key, None)
+                else:
+                    env[key] = str(value)
+            self._git_env = env
+        return self._git_env
+
+    def environment_key(self):
+        """Return a hashable representation of the git environment."""
+        if self._git_env_key is None:
+            self._git_env_key = frozenset(self.environment().items())
+        return self._git_env_key
+
+    def popen(self, args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+              pass_fds=()):
         """Prepare the environment and spawn the subprocess.
 
         Arguments:
@@ -822,6 +1485,13 @@ class GitGutterHandler(object):
                 It defaults to `subprocess.PIPE` to retrieve output via stdout,
                 but can also be a filestream to directly write the content to
                 a file on disk.
+            stderr (int or stream):
+                The target of the error output of the spawned subprocess.
+                Long-lived processes pass `subprocess.DEVNULL` to avoid
+                blocking due to a full pipe.
+            pass_fds (tuple):
+                The file descriptors to keep open in the subprocess, like the
+                ones of memory files passed via `/proc/self/fd/<fd>`.
         Returns:
             subprocess.Popen: The object of the spawned subprocess.
         """
@@ -834,22 +1504,35 @@ class GitGutterHandler(object):
         if self._git_wsl:
             args.insert(0, "wsl")
 
-        # update private environment
-        if self._git_env is None:
-            self._git_env = os.environ.copy()
-            for key, value in self.settings.get('env', {}).items():
-                if value is None:
-                    del self._git_env[key]
-                else:
-                    self._git_env[key] = str(value)
-
+        metrics.count('git.spawned')
         return subprocess.Popen(
             args=args,
             cwd=self._git_tree,
-            env=self._git_env,
+            env=self.environment(),
             bufsize=_BUFSIZE,
             startupinfo=startupinfo,
             stdin=subprocess.PIPE,   # python 3.3 bug on Win7
-            stderr=subprocess.PIPE,
-            stdout=stdout
+            stderr=stderr,
+            stdout=stdout,
+            pass_fds=pass_fds
         )
+
+
+def _git_command(args):
+    """Return the name of the git command to run.
+
+    Arguments:
+        args (list): The command line arguments used to run git.
+
+    Returns:
+        string: The git command like 'status' or None if not found.
+    """
+    skip = False
+    for arg in args[1:]:
+        if skip:
+            skip = False
+        elif arg in ('-c', '-C'):
+            skip = True
+        elif not arg.startswith('-'):
+            return arg
+    return None
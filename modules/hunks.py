@@ -0,0 +1,286 @@
+"""An index of the hunks of a unified diff and the changed lines.
+
+The output of `git diff -U0` is kept as it is returned by the diff engine.
+The line numbers of all hunks and the offsets of their headers are parsed
+once into arrays. Looking up the hunk of a row bisects them instead of
+scanning the whole diff and only the hunk a popup or revert needs is
+decoded.
+
+The changed lines of the view are stored as runs of lines per hunk.
+"""
+import codecs
+import re
+
+from array import array
+from bisect import bisect_left
+
+# The regex to parse the line numbers of a hunk header.
+_HUNK_HEADER_RE = re.compile(
+    br'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@', re.MULTILINE)
+
+
+def decode(data, encoding):
+    """Decode a part of the diff with the encoding of the view.
+
+    Falls back to utf-8 if the encoding is unknown or the data is not valid
+    in the view's encoding.
+
+    Arguments:
+        data (bytes): The part of the diff to decode.
+        encoding (string): The python codec of the view's encoding.
+
+    Returns:
+        string: The decoded data or an empty string, if it can't be decoded.
+    """
+    try:
+        return data.decode(encoding)
+    except UnicodeError:
+        try:
+            return data.decode('utf-8')
+        except UnicodeDecodeError:
+            return ''
+    except LookupError:
+        try:
+            return codecs.decode(data)
+        except UnicodeDecodeError:
+            return ''
+
+
+class Hunks(object):
+    """The hunks of a unified diff with 0 lines of context.
+
+    Hunk range info format:
+      @@ -3,2 +4,0 @@
+        Hunk originally starting at line 3, and occupying 2 lines, now
+        starts at line 4, and occupies 0 lines, i.e. it was deleted.
+      @@ -9 +10,2 @@
+        Hunk size can be omitted, and defaults to one line.
+    """
+
+    __slots__ = (
+        '_diff', '_encoding', '_offsets', '_old_starts', '_old_sizes',
+        '_starts', '_sizes', '_ends')
+
+    def __init__(self, diff=b'', encoding='utf-8'):
+        """Initialize Hunks object and parse the hunk headers of the diff.
+
+        Arguments:
+            diff (bytes): The output of `git diff -U0`.
+            encoding (string): The python codec to decode hunks with.
+        """
+        self._diff = diff
+        self._encoding = encoding
+        # the offsets of the hunk headers in the diff
+        self._offsets = offsets = array('l')
+        # the line numbers and sizes in the compare target
+        self._old_starts = old_starts = array('l')
+        self._old_sizes = old_sizes = array('l')
+        # the line numbers and sizes in the view
+        self._starts = starts = array('l')
+        self._sizes = sizes = array('l')
+        # the last row each hunk is displayed at in the view
+        self._ends = ends = array('l')
+        for match in _HUNK_HEADER_RE.finditer(diff):
+            old_start, old_size, start, size = match.groups()
+            start = int(start)
+            size = int(size or 1)
+            offsets.append(match.start())
+            old_starts.append(int(old_start))
+            old_sizes.append(int(old_size or 1))
+            starts.append(start)
+            sizes.append(size)
+            # a deleted hunk is displayed at the lines around the deletion
+            ends.append(start + max(size, 1))
+
+    def __len__(self):
+        """Return the number of hunks."""
+        return len(self._starts)
+
+    def __getitem__(self, index):
+        """Return the line numbers of a hunk.
+
+        Arguments:
+            index (int): The index of the hunk.
+
+        Returns:
+            tuple: (old_start, old_size, start, size) of the hunk.
+        """
+        return (
+            self._old_starts[index], self._old_sizes[index],
+            self._starts[index], self._sizes[index])
+
+    def __iter__(self):
+        """Iterate the line numbers of all hunks.
+
+        Returns:
+            iterator: The tuples (old_start, old_size, start, size) of all
+                hunks.
+        """
+        return zip(
+            self._old_starts, self._old_sizes, self._starts, self._sizes)
+
+    @property
+    def starts(self):
+        """The first rows of all hunks in the view."""
+        return self._starts
+
+    def find(self, row):
+        """Find the hunk displayed at a row of the view.
+
+        A hunk of deleted lines is displayed at the rows above and below.
+
+        Arguments:
+            row (int): The 1-based row to find the hunk of.
+
+        Returns:
+            int: The index of the hunk or -1, if the row is unchanged.
+        """
+        index = bisect_left(self._ends, row)
+        if index < len(self._starts) and self._starts[index] <= row:
+            return index
+        return -1
+
+    def lines(self, index):
+        """Decode the deleted and added lines of a hunk.
+
+        Arguments:
+            index (int): The index of the hunk.
+
+        Returns:
+            tuple: (deleted_lines, added_lines) as lists of strings
+                without the leading '-' or '+'.
+        """
+        begin = self._offsets[index]
+        if index + 1 < len(self._offsets):
+            end = self._offsets[index + 1]
+        else:
+            end = len(self._diff)
+        hunk_lines = decode(
+            self._diff[begin:end], self._encoding).splitlines()[1:]
+        deleted_lines = [
+            line[1:] for line in hunk_lines if line.startswith('-')]
+        added_lines = [
+            line[1:] for line in hunk_lines if line.startswith('+')]
+        return deleted_lines, added_lines
+
+
+# The kinds of changed lines.
+INSERTED = 0
+MODIFIED = 1
+DELETED = 2
+
+
+class Changes(object):
+    """The changed lines of the view as runs of (start, length, kind).
+
+    A hunk is stored as one run of lines instead of a list of all its line
+    numbers, so the memory and time needed don't depend on the size of
+    hunks. The number of changed lines of each kind is summed up while
+    adding the runs.
+
+    Dealing with ambiguous hunks:
+      "A\\nB\\n" -> "C\\n"
+      Was 'A' modified, and 'B' deleted? Or 'B' modified, 'A' deleted?
+      Or both deleted? To minimize confusion, let's simply mark the
+      hunk as modified.
+
+    For compatibility the object can be indexed and unpacked like the tuple
+    (first, last, [inserted], [modified], [deleted]), whose lists of line
+    numbers are created on access only.
+    """
+
+    __slots__ = ('first', 'last', '_starts', '_lengths', '_kinds', '_counts')
+
+    def __init__(self, hunks=()):
+        """Initialize Changes object with the runs of changed lines of hunks.
+
+        Arguments:
+            hunks (iterable): The tuples (old_start, old_size, start, size)
+                of the hunks of a diff.
+        """
+        # first and last changed line in the view
+        self.first = self.last = 0
+        self._starts = starts = array('l')
+        self._lengths = lengths = array('l')
+        self._kinds = kinds = array('b')
+        self._counts = counts = [0, 0, 0]
+        for _, old_size, start, size in hunks:
+            if self.first == 0:
+                self.first = max(1, start)
+            if not old_size:
+                kind = INSERTED
+            elif not size:
+                # the deletion is displayed at the line below
+                kind, start, size = DELETED, start + 1, 1
+            else:
+                kind = MODIFIED
+            self.last = start if kind == DELETED else start + size
+            starts.append(start)
+            lengths.append(size)
+            kinds.append(kind)
+            counts[kind] += size
+
+    def __len__(self):
+        return 5
+
+    def __getitem__(self, index):
+        """Return an item of the tuple (first, last, [ins], [mod], [del])."""
+        if isinstance(index, slice):
+            return tuple(self)[index]
+        if index < 0:
+            index += 5
+        if index == 0:
+            return self.first
+        if index == 1:
+            return self.last
+        if 2 <= index <= 4:
+            return self.lines(index - 2)
+        raise IndexError('Changes index out of range')
+
+    def __iter__(self):
+        yield self.first
+        yield self.last
+        for kind in (INSERTED, MODIFIED, DELETED):
+            yield self.lines(kind)
+
+    def __repr__(self):
+        return repr(tuple(self))
+
+    def count(self, kind):
+        """Return the number of changed lines of a kind.
+
+        Arguments:
+            kind (int): One of INSERTED, MODIFIED or DELETED.
+
+        Returns:
+            int: The number of lines, with each deletion counting as one.
+        """
+        return self._counts[kind]
+
+    def runs(self, kind):
+        """Iterate the runs of changed lines of a kind.
+
+        Arguments:
+            kind (int): One of INSERTED, MODIFIED or DELETED.
+
+        Returns:
+            iterator: The tuples (start, length) of the runs in order.
+        """
+        return (
+            (start, length) for start, length, run_kind
+            in zip(self._starts, self._lengths, self._kinds)
+            if run_kind == kind)
+
+    def lines(self, kind):
+        """Return the numbers of changed lines of a kind.
+
+        Arguments:
+            kind (int): One of INSERTED, MODIFIED or DELETED.
+
+        Returns:
+            list: The line numbers in ascending order.
+        """
+        lines = []
+        for start, length in self.runs(kind):
+            lines += range(start, start + length)
+        return lines
@@ -0,0 +1,317 @@
+"""A pure python reader of git's index file.
+
+The index (`.git/index`) records the blob id and the stat data of each file
+of the working tree as it was when git last looked at it. A file, whose stat
+data still matches its index entry, has the content of the entry's blob.
+This way it can be detected without spawning git, that a file is unchanged.
+
+Index versions 2 to 4 are supported, including the path prefix compression
+of version 4. Entries of split indexes are stored in a shared index file,
+which is not read, so those are reported as unsupported. Repositories using
+SHA-256 object ids are not supported either.
+"""
+import binascii
+import mmap
+import os
+import struct
+import threading
+
+# The signature of index files.
+_SIGNATURE = b'DIRC'
+# The supported versions of the index file format.
+_VERSIONS = (2, 3, 4)
+# The signature of the split index extension.
+_EXT_LINK = b'link'
+# The size of a SHA-1 object id.
+_OID_SIZE = 20
+
+# The header of the index file: signature, version, number of entries.
+_HEADER = struct.Struct('>4sII')
+# The fixed size part of an entry: ctime, mtime, dev, ino, mode, uid, gid,
+# size, object id and flags.
+_ENTRY = struct.Struct('>IIIIIIIIII20sH')
+
+# The flags of an entry.
+_FLAG_ASSUME_VALID = 0x8000
+_FLAG_EXTENDED = 0x4000
+_FLAG_STAGE = 0x3000
+_FLAG_NAME_MASK = 0x0fff
+# The extended flags of an entry (version 3+).
+_FLAG_SKIP_WORKTREE = 0x4000
+_FLAG_INTENT_TO_ADD = 0x2000
+
+
+class IndexEntry(object):
+    """The blob id and stat data of a file in the index."""
+
+    __slots__ = (
+        'ctime', 'mtime', 'dev', 'ino', 'mode', 'uid', 'gid', 'size', 'oid',
+        'flags', 'extended_flags')
+
+    def __init__(self, fields, extended_flags=0):
+        """Initialize IndexEntry object.
+
+        Arguments:
+            fields (tuple): The unpacked fixed size part of the entry.
+            extended_flags (int): The extended flags of version 3+ entries.
+        """
+        (ctime, ctime_ns, mtime, mtime_ns, self.dev, self.ino, self.mode,
+         self.uid, self.gid, self.size, oid, self.flags) = fields
+        self.ctime = (ctime, ctime_ns)
+        self.mtime = (mtime, mtime_ns)
+        self.oid = binascii.hexlify(oid).decode('ascii')
+        self.extended_flags = extended_flags
+
+    @property
+    def stage(self):
+        """The merge stage of the entry, which is 0 if not conflicted."""
+        return (self.flags & _FLAG_STAGE) >> 12
+
+    def is_trusted(self):
+        """Check whether the stat data describes the working tree file.
+
+        Stat data of conflicted entries, entries flagged assume-unchanged,
+        skip-worktree or intent-to-add don't describe the file's content.
+        """
+        if self.flags & (_FLAG_ASSUME_VALID | _FLAG_STAGE):
+            return False
+        return not self.extended_flags & (
+            _FLAG_SKIP_WORKTREE | _FLAG_INTENT_TO_ADD)
+
+    def matches_stat(self, stat):
+        """Check whether a file's stat matches the entry's stat data.
+
+        Only the fields which change with the file's content are compared.
+        As the index stores 32 bit values, the stat values are truncated.
+        Nanoseconds and inodes are ignored, if git didn't record them.
+
+        Arguments:
+            stat (os.stat_result): The stat of the working tree file.
+
+        Returns:
+            bool: True if the file is most likely unchanged.
+        """
+        mtime, mtime_ns = divmod(stat.st_mtime_ns, 1000000000)
+        if self.mtime[0] != mtime & 0xffffffff:
+            return False
+        if self.mtime[1] and self.mtime[1] != mtime_ns:
+            return False
+        if self.ino and self.ino != stat.st_ino & 0xffffffff:
+            return False
+        return self.size == stat.st_size & 0xffffffff
+
+
+class Index(object):
+    """The index file of a git directory."""
+
+    def __init__(self, file_name):
+        """Initialize Index object.
+
+        Arguments:
+            file_name (string): The path of the index file.
+        """
+        self.file_name = file_name
+        self._lock = threading.Lock()
+        # the map of paths and their stage 0 entries
+        self._entries = None
+        # the stat of the index file the entries were read from
+        self._stamp = None
+        # the modification time of the index file in nanoseconds
+        self._mtime_ns = 0
+
+    def is_current(self):
+        """Check whether the file was parsed since it last changed.
+
+        Returns:
+            bool: True if `entries()` returns without parsing the file.
+        """
+        stamp = _stamp(self._stat())
+        with self._lock:
+            return stamp == self._stamp
+
+    def entries(self, parse=True):
+        """Return the map of paths and their entries.
+
+        The file is parsed again only, if its stat changed.
+
+        Arguments:
+            parse (bool): If False, a changed file is not parsed but None is
+                returned, as parsing a large index takes a while.
+
+        Returns:
+            dict: The map of slash separated paths and their IndexEntry
+                objects or None if the index can't be read.
+        """
+        stat = self._stat()
+        if stat is None:
+            return None
+        stamp = _stamp(stat)
+        with self._lock:
+            if stamp == self._stamp:
+                return self._entries
+        if not parse:
+            return None
+        # parse without holding the lock to not block other readers
+        try:
+            entries = self._read()
+        except (OSError, ValueError, struct.error):
+            entries = None
+        with self._lock:
+            self._entries = entries
+            self._stamp = stamp
+            self._mtime_ns = stat.st_mtime_ns
+        return entries
+
+    def entry(self, file_path, parse=True):
+        """Return the entry of a file.
+
+        Arguments:
+            file_path (string): The slash separated path relative to the
+                working tree.
+            parse (bool): If False, a changed file is not parsed.
+
+        Returns:
+            IndexEntry: The file's stage 0 entry or None if it doesn't exist
+                or the index can't be read.
+        """
+        entries = self.entries(parse)
+        return entries.get(file_path) if entries else None
+
+    def unchanged_entry(self, file_path, stat, parse=True):
+        """Return the entry of a file, if the file matches it.
+
+        A file modified within the same timestamp granularity as the index
+        file was written might have changed after git recorded its stat, so
+        such racily clean entries are not reported.
+
+        Arguments:
+            file_path (string): The slash separated path relative to the
+                working tree.
+            stat (os.stat_result): The stat of the working tree file.
+            parse (bool): If False, a changed file is not parsed.
+
+        Returns:
+            IndexEntry: The file's entry if the file's content is the one of
+                the entry's blob or None otherwise.
+        """
+        entry = self.entry(file_path, parse)
+        if entry is None or not entry.is_trusted() or \
+                not entry.matches_stat(stat) or \
+                stat.st_mtime_ns >= self._mtime_ns:
+            return None
+        return entry
+
+    def _stat(self):
+        """Return the stat of the index file or None if it doesn't exist."""
+        try:
+            return os.stat(self.file_name)
+        except OSError:
+            return None
+
+    def _read(self):
+        """Parse the index file.
+
+        Returns:
+            dict: The map of paths and their stage 0 entries or None if the
+                index format is not supported.
+
+        Raises:
+            OSError: if the file can't be read.
+            ValueError: if the file is corrupt.
+        """
+        with open(self.file_name, 'rb') as file:
+            if not os.fstat(file.fileno()).st_size:
+                return None
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return _parse(data)
+        finally:
+            data.close()
+
+
+def _stamp(stat):
+    """Return the stat data which changes whenever the index is written."""
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino) if stat else None
+
+
+def _parse(data):
+    """Parse the content of an index file.
+
+    Arguments:
+        data (mmap.mmap): The content of the index file.
+
+    Returns:
+        dict: The map of paths and their stage 0 entries or None if the index
+            format is not supported.
+
+    Raises:
+        ValueError: if the content is corrupt.
+    """
+    signature, version, count = _HEADER.unpack_from(data, 0)
+    if signature != _SIGNATURE or version not in _VERSIONS:
+        return None
+
+    entries = {}
+    offset = _HEADER.size
+    name = b''
+    for _ in range(count):
+        fields = _ENTRY.unpack_from(data, offset)
+        flags = fields[-1]
+        start = offset
+        offset += _ENTRY.size
+        extended_flags = 0
+        if flags & _FLAG_EXTENDED:
+            if version < 3:
+                raise ValueError('extended flags in index version 2')
+            extended_flags = struct.unpack_from('>H', data, offset)[0]
+            offset += 2
+
+        if version == 4:
+            # the name is stored as the number of bytes to remove from the
+            # end of the previous name followed by the suffix to append
+            strip, offset = _read_varint(data, offset)
+            end = data.find(b'\0', offset)
+            if end < 0 or strip > len(name):
+                raise ValueError('invalid path in index')
+            name = name[:len(name) - strip] + data[offset:end]
+            offset = end + 1
+        else:
+            length = flags & _FLAG_NAME_MASK
+            if length == _FLAG_NAME_MASK:
+                end = data.find(b'\0', offset)
+                if end < 0:
+                    raise ValueError('invalid path in index')
+            else:
+                end = offset + length
+            name = data[offset:end]
+            # entries are padded with 1 to 8 NUL bytes
+            offset = start + ((end - start + 8) & ~7)
+
+        if not flags & _FLAG_STAGE:
+            entries[name.decode('utf-8', 'surrogateescape')] = \
+                IndexEntry(fields, extended_flags)
+
+    # the entries of a split index are stored in the shared index
+    size = len(data) - _OID_SIZE
+    while offset + 8 <= size:
+        signature, length = struct.unpack_from('>4sI', data, offset)
+        if signature == _EXT_LINK:
+            return None
+        offset += 8 + length
+    return entries
+
+
+def _read_varint(data, offset):
+    """Read a variable length integer as used by index version 4.
+
+    Returns:
+        tuple: (value, offset) with offset pointing behind the integer.
+    """
+    byte = data[offset]
+    offset += 1
+    value = byte & 0x7f
+    while byte & 0x80:
+        byte = data[offset]
+        offset += 1
+        value = ((value + 1) << 7) | (byte & 0x7f)
+    return value, offset
@@ -0,0 +1,238 @@
+"""Low overhead performance metrics.
+
+The module provides a global registry of counters and latency histograms to
+find out where time is spent. Histograms use logarithmic buckets with four
+buckets per octave, so recording a value costs a logarithm and a list index
+and percentiles are reported with an error of less than 20 percent.
+
+Metrics are named by dotted strings like `stage.process_diff` or
+`git.status`. The first part is used to group them in reports.
+"""
+import functools
+import math
+import threading
+
+from time import perf_counter
+
+from .promise import Promise
+
+# The smallest latency in milliseconds with its own bucket.
+_MIN_MS = 0.01
+# The number of buckets per doubling of the latency.
+_BUCKETS_PER_OCTAVE = 4
+# The number of buckets covering latencies from 0.01ms up to about 170s.
+_NUM_BUCKETS = 24 * _BUCKETS_PER_OCTAVE + 1
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+
+class Histogram(object):
+    """A histogram of latencies with logarithmic buckets."""
+
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        """Initialize Histogram object."""
+        self.buckets = [0] * _NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        """Add a latency.
+
+        Arguments:
+            value (float): The latency in milliseconds.
+        """
+        if value > _MIN_MS:
+            index = min(_NUM_BUCKETS - 1, 1 + int(
+                math.log2(value / _MIN_MS) * _BUCKETS_PER_OCTAVE))
+        else:
+            index = 0
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """Return the approximated latency below which percent of values are.
+
+        Arguments:
+            percent (float): The percentile like 50, 95 or 99.
+
+        Returns:
+            float: The upper bound of the bucket containing the percentile
+                in milliseconds, but not more than the maximum latency.
+        """
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100.0
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                if index == _NUM_BUCKETS - 1:
+                    # the last bucket has no upper bound
+                    return self.max
+                bound = _MIN_MS * 2 ** (index / _BUCKETS_PER_OCTAVE)
+                return min(bound, self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        """The average latency in milliseconds."""
+        return self.total / self.count if self.count else 0.0
+
+
+def record(name, seconds):
+    """Add a latency to the histogram `name`.
+
+    Arguments:
+        name (string): The name of the metric.
+        seconds (float): The latency in seconds as returned by perf_counter.
+    """
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.add(seconds * 1000.0)
+
+
+def count(name, value=1):
+    """Increment the counter `name`.
+
+    Arguments:
+        name (string): The name of the counter.
+        value (int): The value to add.
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def hit(name, is_hit):
+    """Count a hit or miss of the cache `name`.
+
+    Arguments:
+        name (string): The name of the cache.
+        is_hit (bool): True if the cache was hit.
+    """
+    count(name + ('.hit' if is_hit else '.miss'))
+
+
+class timer(object):
+    """A context manager to record the latency of a block of code.
+
+    Example:
+
+        with metrics.timer('stage.render'):
+            render()
+    """
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        record(self.name, perf_counter() - self.start)
+
+
+def timed(name):
+    """Decorate a function to record its latency.
+
+    If the function returns a Promise, the time until the Promise is resolved
+    is recorded. Promises, which are never resolved, are not recorded.
+
+    Arguments:
+        name (string): The name of the metric.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            result = func(*args, **kwargs)
+            if isinstance(result, Promise):
+                def on_resolve(value):
+                    record(name, perf_counter() - start)
+                result.then(on_resolve)
+            else:
+                record(name, perf_counter() - start)
+            return result
+        return wrapper
+    return decorator
+
+
+def reset():
+    """Clear all recorded metrics."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def report():
+    """Format all metrics as text table.
+
+    Returns:
+        string: The report with a line per histogram and counter.
+    """
+    with _lock:
+        histograms = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+
+    lines = ['%-32s %8s %9s %9s %9s %9s %9s' % (
+        'latency (ms)', 'count', 'mean', 'p50', 'p95', 'p99', 'max')]
+    group = None
+    for name, histogram in histograms:
+        if group != name.split('.', 1)[0]:
+            group = name.split('.', 1)[0]
+            lines.append('')
+        lines.append('%-32s %8d %9.2f %9.2f %9.2f %9.2f %9.2f' % (
+            name, histogram.count, histogram.mean,
+            histogram.percentile(50), histogram.percentile(95),
+            histogram.percentile(99), histogram.max))
+
+    caches = {}
+    lines += ['', '%-32s %8s' % ('counter', 'value')]
+    for name, value in counters:
+        lines.append('%-32s %8d' % (name, value))
+        base, _, kind = name.rpartition('.')
+        if kind in ('hit', 'miss'):
+            caches.setdefault(base, {})[kind] = value
+
+    if caches:
+        lines += ['', '%-32s %8s' % ('cache', 'hit rate')]
+        for name, value in sorted(caches.items()):
+            hits, misses = value.get('hit', 0), value.get('miss', 0)
+            lines.append('%-32s %7.1f%%' % (
+                name, 100.0 * hits / max(1, hits + misses)))
+    return '\n'.join(lines)
+
+
+def summary(names=('stage.diff', 'stage.update_git_file', 'stage.run_diff')):
+    """Format a short summary of the most relevant metrics.
+
+    Arguments:
+        names (tuple): The names of the histograms to include.
+
+    Returns:
+        string: A line per histogram with the number of samples, p50 and p95.
+    """
+    with _lock:
+        histograms = [(name, _histograms.get(name)) for name in names]
+        git = [h for name, h in _histograms.items() if name.startswith('git.')]
+    lines = []
+    for name, histogram in histograms:
+        if histogram:
+            lines.append('%s: %d, p50 %.1f ms, p95 %.1f ms' % (
+                name, histogram.count, histogram.percentile(50),
+                histogram.percentile(95)))
+    lines.append('git commands: %d' % sum(h.count for h in git))
+    return '\n'.join(lines)
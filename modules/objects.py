@@ -0,0 +1,543 @@
+"""A pure python reader of git objects.
+
+Reading a blob via `git cat-file` requires a git process. This module reads
+loose objects and objects stored in packfiles directly from the repository's
+object database instead.
+
+Pack indexes (version 2) are memory-mapped and binary-searched. Objects
+stored as OFS_DELTA or REF_DELTA are resolved by applying the chain of
+deltas to their base objects, which are kept in a small cache as consecutive
+lookups often share the same bases.
+
+Repositories using SHA-256 object ids are not supported. Any object which
+can't be read is reported as missing, so the caller can fall back to git.
+"""
+import binascii
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from collections import OrderedDict
+
+from . import metrics
+
+# The object types used in pack files.
+_OBJ_COMMIT = 1
+_OBJ_TREE = 2
+_OBJ_BLOB = 3
+_OBJ_TAG = 4
+_OBJ_OFS_DELTA = 6
+_OBJ_REF_DELTA = 7
+_TYPE_NAMES = {
+    _OBJ_COMMIT: 'commit',
+    _OBJ_TREE: 'tree',
+    _OBJ_BLOB: 'blob',
+    _OBJ_TAG: 'tag'
+}
+
+# The magic number and version of pack index files.
+_IDX_MAGIC = b'\377tOc'
+_IDX_VERSION = 2
+# The size of a SHA-1 object id.
+_OID_SIZE = 20
+
+# The maximum number of bytes of delta bases to keep in memory.
+_DELTA_CACHE_SIZE = 16 * 1024 * 1024
+# The maximum length of a delta chain to resolve.
+_MAX_DELTA_DEPTH = 10000
+# The size of chunks of compressed data to feed zlib with.
+_CHUNK_SIZE = 16 * 1024
+
+
+class PackIndex(object):
+    """A memory-mapped pack index file of version 2."""
+
+    def __init__(self, file_name):
+        """Initialize PackIndex object.
+
+        Arguments:
+            file_name (string): The path of the `*.idx` file.
+
+        Raises:
+            OSError: if the file can't be opened or has an unsupported format.
+        """
+        with open(file_name, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:4] != _IDX_MAGIC or \
+                struct.unpack('>I', self._map[4:8])[0] != _IDX_VERSION:
+            self.close()
+            raise OSError('unsupported pack index: ' + file_name)
+        self._fanout = struct.unpack('>256I', self._map[8:8 + 1024])
+        self.count = self._fanout[255]
+        self._oids = 8 + 1024
+        self._offsets = self._oids + self.count * (_OID_SIZE + 4)
+        self._large_offsets = self._offsets + self.count * 4
+
+    def close(self):
+        """Unmap the index file."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def find(self, oid):
+        """Find the offset of an object in the pack file.
+
+        Arguments:
+            oid (bytes): The binary object id.
+
+        Returns:
+            int: The offset of the object in the pack or None if not found.
+        """
+        first = oid[0]
+        low = self._fanout[first - 1] if first else 0
+        high = self._fanout[first]
+        while low < high:
+            mid = (low + high) // 2
+            pos = self._oids + mid * _OID_SIZE
+            value = self._map[pos:pos + _OID_SIZE]
+            if value < oid:
+                low = mid + 1
+            elif value > oid:
+                high = mid
+            else:
+                pos = self._offsets + mid * 4
+                offset = struct.unpack('>I', self._map[pos:pos + 4])[0]
+                if offset & 0x80000000:
+                    pos = self._large_offsets + (offset & 0x7fffffff) * 8
+                    offset = struct.unpack('>Q', self._map[pos:pos + 8])[0]
+                return offset
+        return None
+
+
+class Pack(object):
+    """A memory-mapped pack file and its index."""
+
+    def __init__(self, base_name):
+        """Initialize Pack object.
+
+        Arguments:
+            base_name (string): The path of the pack without extension.
+
+        Raises:
+            OSError: if the pack or its index can't be opened.
+        """
+        self.name = base_name
+        self.index = PackIndex(base_name + '.idx')
+        try:
+            with open(base_name + '.pack', 'rb') as file:
+                self._map = mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self.index.close()
+            raise OSError('unable to open pack: ' + base_name)
+
+    def close(self):
+        """Unmap the pack and its index."""
+        self.index.close()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def read_header(self, offset):
+        """Read the type and size of the object at offset.
+
+        Returns:
+            tuple: (type, size, data_offset)
+        """
+        data = self._map
+        byte = data[offset]
+        offset += 1
+        kind = (byte >> 4) & 7
+        size = byte & 15
+        shift = 4
+        while byte & 0x80:
+            byte = data[offset]
+            offset += 1
+            size |= (byte & 0x7f) << shift
+            shift += 7
+        return kind, size, offset
+
+    def read_ofs_delta_base(self, offset):
+        """Read the negative offset of an OFS_DELTA's base.
+
+        Returns:
+            tuple: (distance, data_offset)
+        """
+        data = self._map
+        byte = data[offset]
+        offset += 1
+        distance = byte & 0x7f
+        while byte & 0x80:
+            byte = data[offset]
+            offset += 1
+            distance = ((distance + 1) << 7) | (byte & 0x7f)
+        return distance, offset
+
+    def read_oid(self, offset):
+        """Read the binary object id of a REF_DELTA's base."""
+        return self._map[offset:offset + _OID_SIZE]
+
+    def inflate(self, offset, size):
+        """Decompress the zlib stream starting at offset.
+
+        Arguments:
+            offset (int): The position of the compressed data in the pack.
+            size (int): The size of the uncompressed data.
+
+        Returns:
+            bytes: The uncompressed data.
+
+        Raises:
+            zlib.error: if the data is corrupt.
+        """
+        decompressor = zlib.decompressobj()
+        chunks = []
+        end = len(self._map)
+        while not decompressor.eof and offset < end:
+            chunks.append(decompressor.decompress(
+                self._map[offset:offset + _CHUNK_SIZE]))
+            offset += _CHUNK_SIZE
+        result = b''.join(chunks)
+        if len(result) != size:
+            raise zlib.error('size mismatch in pack: ' + self.name)
+        return result
+
+
+def hash_blob(content):
+    """Return the id git assigns to a content stored as blob.
+
+    Arguments:
+        content (bytes): The content of the blob.
+
+    Returns:
+        string: The hexadecimal SHA-1 of the blob object.
+    """
+    sha = hashlib.sha1(('blob %d\0' % len(content)).encode('ascii'))
+    sha.update(content)
+    return sha.hexdigest()
+
+
+def apply_delta(base, delta):
+    """Create an object by applying a delta to its base object.
+
+    Arguments:
+        base (bytes): The content of the base object.
+        delta (bytes): The delta instructions.
+
+    Returns:
+        bytes: The content of the resulting object.
+
+    Raises:
+        ValueError: if the delta doesn't match the base.
+    """
+    def read_size(pos):
+        size = shift = 0
+        while True:
+            byte = delta[pos]
+            pos += 1
+            size |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                return size, pos
+
+    base_size, pos = read_size(0)
+    if base_size != len(base):
+        raise ValueError('delta base size mismatch')
+    result_size, pos = read_size(pos)
+
+    result = bytearray()
+    end = len(delta)
+    while pos < end:
+        cmd = delta[pos]
+        pos += 1
+        if cmd & 0x80:
+            # copy a range of the base object
+            offset = size = 0
+            for shift in (0, 8, 16, 24):
+                if cmd & (1 << (shift // 8)):
+                    offset |= delta[pos] << shift
+                    pos += 1
+            for shift in (0, 8, 16):
+                if cmd & (0x10 << (shift // 8)):
+                    size |= delta[pos] << shift
+                    pos += 1
+            result += base[offset:offset + (size or 0x10000)]
+        elif cmd:
+            # insert new data
+            result += delta[pos:pos + cmd]
+            pos += cmd
+        else:
+            raise ValueError('invalid delta opcode')
+
+    if len(result) != result_size:
+        raise ValueError('delta result size mismatch')
+    return bytes(result)
+
+
+class ObjectStore(object):
+    """Read objects from a repository's object database."""
+
+    def __init__(self, objects_dir):
+        """Initialize ObjectStore object.
+
+        Arguments:
+            objects_dir (string): The repository's `objects` directory.
+        """
+        self.objects_dir = objects_dir
+        self._lock = threading.RLock()
+        # the object directories including alternates
+        self._dirs = None
+        # the map of pack base names and Pack objects
+        self._packs = OrderedDict()
+        # the cache of delta bases by (pack name, offset)
+        self._cache = OrderedDict()
+        self._cache_size = 0
+
+    def close(self):
+        """Unmap all packs."""
+        with self._lock:
+            for pack in self._packs.values():
+                pack.close()
+            self._packs.clear()
+            self._cache.clear()
+            self._cache_size = 0
+            self._dirs = None
+
+    def _object_dirs(self):
+        """Return the object directory and all its alternates."""
+        if self._dirs is None:
+            dirs = [self.objects_dir]
+            try:
+                with open(os.path.join(
+                        self.objects_dir, 'info', 'alternates'),
+                        encoding='utf-8') as file:
+                    for line in file:
+                        line = line.strip()
+                        if line and not line.startswith('#'):
+                            dirs.append(os.path.normpath(
+                                os.path.join(self.objects_dir, line)))
+            except OSError:
+                pass
+            self._dirs = dirs
+        return self._dirs
+
+    def _scan_packs(self):
+        """Open new packs and close removed ones.
+
+        Returns:
+            bool: True if the list of packs changed.
+        """
+        names = []
+        for objects_dir in self._object_dirs():
+            pack_dir = os.path.join(objects_dir, 'pack')
+            try:
+                for name in os.listdir(pack_dir):
+                    if name.endswith('.idx'):
+                        names.append(os.path.join(pack_dir, name[:-4]))
+            except OSError:
+                pass
+
+        changed = False
+        for name in list(self._packs):
+            if name not in names:
+                self._packs.pop(name).close()
+                changed = True
+        for name in names:
+            if name not in self._packs:
+                try:
+                    self._packs[name] = Pack(name)
+                    changed = True
+                except (OSError, ValueError):
+                    pass
+        return changed
+
+    def _find(self, oid):
+        """Find the pack and offset of an object.
+
+        Returns:
+            tuple: (pack, offset) or (None, None) if not packed.
+        """
+        for pack in self._packs.values():
+            offset = pack.index.find(oid)
+            if offset is not None:
+                return pack, offset
+        return None, None
+
+    def _read_loose(self, hex_oid):
+        """Read a loose object.
+
+        Returns:
+            tuple: (type name, content) or None if not found.
+        """
+        for objects_dir in self._object_dirs():
+            file_name = os.path.join(objects_dir, hex_oid[:2], hex_oid[2:])
+            try:
+                with open(file_name, 'rb') as file:
+                    data = zlib.decompress(file.read())
+            except (OSError, zlib.error):
+                continue
+            header, _, content = data.partition(b'\0')
+            kind, _, size = header.decode('ascii').partition(' ')
+            if int(size) != len(content):
+                return None
+            return kind, content
+        return None
+
+    def _read_packed(self, pack, offset, depth=0):
+        """Read and undeltify an object from a pack.
+
+        Returns:
+            tuple: (type, content) with type being the numeric pack type.
+        """
+        key = (pack.name, offset)
+        cached = self._cache.get(key)
+        if depth:
+            metrics.hit('cache.delta_base', cached is not None)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return cached
+
+        kind, size, data_offset = pack.read_header(offset)
+        if kind == _OBJ_OFS_DELTA:
+            distance, data_offset = pack.read_ofs_delta_base(data_offset)
+            base_pack, base_offset = pack, offset - distance
+        elif kind == _OBJ_REF_DELTA:
+            base_oid = pack.read_oid(data_offset)
+            data_offset += _OID_SIZE
+            base_pack, base_offset = self._find(base_oid)
+            if base_pack is None:
+                raise ValueError('missing delta base')
+        else:
+            return kind, pack.inflate(data_offset, size)
+
+        if depth > _MAX_DELTA_DEPTH:
+            raise ValueError('delta chain too long')
+        base_kind, base = self._read_packed(base_pack, base_offset, depth + 1)
+        result = (base_kind, apply_delta(base, pack.inflate(data_offset, size)))
+        self._cache_add((base_pack.name, base_offset), (base_kind, base))
+        return result
+
+    def _cache_add(self, key, value):
+        """Add a delta base to the cache and evict the least recently used."""
+        size = len(value[1])
+        if key in self._cache or size > _DELTA_CACHE_SIZE // 4:
+            return
+        self._cache[key] = value
+        self._cache_size += size
+        while self._cache_size > _DELTA_CACHE_SIZE:
+            _, (_, evicted) = self._cache.popitem(last=False)
+            self._cache_size -= len(evicted)
+
+    def read(self, hex_oid):
+        """Read an object.
+
+        Arguments:
+            hex_oid (string): The full hexadecimal object id.
+
+        Returns:
+            tuple: (type name, content) or None if the object can't be read.
+        """
+        if len(hex_oid) != 2 * _OID_SIZE:
+            return None
+        try:
+            oid = bytes.fromhex(hex_oid)
+        except ValueError:
+            return None
+
+        with self._lock:
+            try:
+                for retry in (True, False):
+                    if not self._packs:
+                        self._scan_packs()
+                    pack, offset = self._find(oid)
+                    if pack:
+                        kind, content = self._read_packed(pack, offset)
+                        return _TYPE_NAMES.get(kind), content
+                    result = self._read_loose(hex_oid)
+                    if result:
+                        return result
+                    # look for packs created by fetch, gc or repack
+                    if not retry or not self._scan_packs():
+                        return None
+            except (IndexError, OSError, ValueError, zlib.error):
+                return None
+
+    def peel(self, hex_oid, kind):
+        """Read an object and peel tags until an object of kind is found.
+
+        Arguments:
+            hex_oid (string): The object id to start with.
+            kind (string): The type of object to return ('commit' or 'tree').
+
+        Returns:
+            bytes: The content of the object or None if not found.
+        """
+        for _ in range(10):
+            obj = self.read(hex_oid)
+            if obj is None:
+                return None
+            obj_kind, content = obj
+            if obj_kind == kind:
+                return content
+            if obj_kind == 'tag':
+                hex_oid = content[7:47].decode('ascii')
+            elif obj_kind == 'commit' and kind == 'tree':
+                hex_oid = content[5:45].decode('ascii')
+            else:
+                return None
+        return None
+
+    def blob_id(self, commit, file_path):
+        """Look up the id of a file in a commit's tree.
+
+        Arguments:
+            commit (string): The full hexadecimal id of a commit or tag.
+            file_path (string): The slash separated path relative to the root.
+
+        Returns:
+            string: The blob's object id, an empty string if the file does not
+                exist in the commit or None if an object can't be read.
+        """
+        tree = self.peel(commit, 'tree')
+        names = file_path.encode('utf-8').split(b'/')
+        for index, name in enumerate(names):
+            if tree is None:
+                return None
+            try:
+                entry = _tree_entry(tree, name)
+            except ValueError:
+                return None
+            if entry is None:
+                return ''
+            mode, oid = entry
+            if index == len(names) - 1:
+                # files and symlinks only
+                if mode.startswith(b'40') or mode == b'160000':
+                    return ''
+                return binascii.hexlify(oid).decode('ascii')
+            if not mode.startswith(b'40'):
+                return ''
+            obj = self.read(binascii.hexlify(oid).decode('ascii'))
+            tree = obj[1] if obj and obj[0] == 'tree' else None
+        return None
+
+
+def _tree_entry(tree, name):
+    """Find an entry of a tree object by name.
+
+    Tree entries have the format `<mode> <name>\\0<binary oid>`.
+
+    Returns:
+        tuple: (mode, binary oid) or None if not found.
+    """
+    pos, end = 0, len(tree)
+    while pos < end:
+        space = tree.index(b' ', pos)
+        nul = tree.index(b'\0', space)
+        if tree[space + 1:nul] == name:
+            return tree[pos:space], tree[nul + 1:nul + 1 + _OID_SIZE]
+        pos = nul + 1 + _OID_SIZE
+    return None
@@ -94,6 +94,44 @@ def split_work_tree(file_path):
     return (None, None)
 
 
+def git_dirs(work_tree):
+    """Return the git directory and the common directory of a working tree.
+
+    The '.git' of a working tree created by `git worktree add` or a submodule
+    is a file pointing to the real git directory via 'gitdir: <path>'. The git
+    directory of a linked working tree contains HEAD, index and rebase state,
+    while refs and packed-refs are located in the directory named by the
+    'commondir' file.
+
+    Arguments:
+        work_tree (string): The real path of the working tree.
+
+    Returns:
+        tuple: (git_dir, common_dir) or (None, None) if not a working tree.
+    """
+    git_dir = os.path.join(work_tree, '.git')
+    try:
+        if os.path.isfile(git_dir):
+            with open(git_dir, encoding='utf-8') as file:
+                content = file.read().strip()
+            if not content.startswith('gitdir:'):
+                return (None, None)
+            git_dir = os.path.normpath(
+                os.path.join(work_tree, content[7:].strip()))
+        elif not os.path.isdir(git_dir):
+            return (None, None)
+    except OSError:
+        return (None, None)
+
+    try:
+        with open(os.path.join(git_dir, 'commondir'), encoding='utf-8') as file:
+            common_dir = os.path.normpath(
+                os.path.join(git_dir, file.read().strip()))
+    except OSError:
+        common_dir = git_dir
+    return (git_dir, common_dir)
+
+
 def is_translatable_to_wsl(path):
     return path and (
         path.startswith('\\\\wsl.localhost\\')
@@ -0,0 +1,338 @@
+"""A pure python reader of git references.
+
+Resolving references like `HEAD`, `master` or `origin/master` via
+`git rev-parse` requires a process to be spawned for each lookup. This module
+reads `HEAD`, loose refs, `packed-refs` and symbolic refs directly from the
+repository's git directory instead, including the `commondir` indirection of
+linked working trees.
+
+Anything which can't be handled here like revision expressions (`HEAD~1`,
+`master^`, `@{upstream}`), abbreviated hashes or repositories using the
+reftable backend is reported as unresolved, so the caller can fall back to
+the git binary.
+"""
+import os
+import re
+import time
+
+# A full SHA-1 or SHA-256 object id.
+_OID_RE = re.compile(r'^(?:[0-9a-f]{40}|[0-9a-f]{64})$')
+
+# Characters which indicate a revision expression rather than a plain ref.
+_REVISION_CHARS = frozenset('~^:@{}*?[\\ ')
+
+# The refs stored per working tree rather than in the common directory.
+_PER_WORKTREE_PREFIXES = ('refs/bisect/', 'refs/worktree/', 'refs/rewritten/')
+
+# The rules git uses to expand an abbreviated ref name (see: git-rev-parse).
+_EXPAND_RULES = (
+    '%s',
+    'refs/%s',
+    'refs/tags/%s',
+    'refs/heads/%s',
+    'refs/remotes/%s',
+    'refs/remotes/%s/HEAD'
+)
+
+# The maximum depth of symbolic refs to follow.
+_MAX_SYMREF_DEPTH = 5
+
+# The default and minimum length of abbreviated object ids.
+_DEFAULT_ABBREV = 7
+_MIN_ABBREV = 4
+
+# A section header or a variable of a git config file.
+_CONFIG_SECTION_RE = re.compile(r'^\s*\[\s*([^\]\s"]+)[^\]]*\]')
+_CONFIG_VALUE_RE = re.compile(r'^\s*([A-Za-z][\w-]*)\s*=\s*([^#;]*)')
+
+# The weekday and month names of git's default date format.
+_WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = (
+    'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+    'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+class RefReader(object):
+    """Read the references of a git repository from disk."""
+
+    def __init__(self, git_dir, common_dir):
+        """Initialize RefReader object.
+
+        Arguments:
+            git_dir (string): The git directory of the working tree.
+            common_dir (string): The directory containing refs and objects.
+        """
+        self.git_dir = git_dir
+        self.common_dir = common_dir or git_dir
+        # the parsed packed-refs and the file's stat they belong to
+        self._packed = {}
+        self._packed_stat = None
+
+    def is_supported(self):
+        """Check whether the refs of the repository can be read natively."""
+        return bool(self.git_dir) and not os.path.exists(
+            os.path.join(self.common_dir, 'reftable'))
+
+    def _ref_path(self, name):
+        """Return the path of a loose ref file."""
+        if name.startswith('refs/') and not name.startswith(
+                _PER_WORKTREE_PREFIXES):
+            return os.path.join(self.common_dir, name)
+        return os.path.join(self.git_dir, name)
+
+    def packed_refs(self):
+        """Return the map of packed ref names and their (oid, peeled) tuples.
+
+        The file is parsed again only, if its stat changed.
+        """
+        file_name = os.path.join(self.common_dir, 'packed-refs')
+        try:
+            stat = os.stat(file_name)
+        except OSError:
+            self._packed, self._packed_stat = {}, None
+            return self._packed
+        stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if stamp == self._packed_stat:
+            return self._packed
+
+        packed = {}
+        last = None
+        with open(file_name, encoding='utf-8', errors='replace') as file:
+            for line in file:
+                line = line.rstrip('\n')
+                if not line or line[0] == '#':
+                    continue
+                if line[0] == '^':
+                    # the peeled object id of the previous annotated tag
+                    if last:
+                        packed[last] = (packed[last][0], line[1:])
+                    continue
+                oid, _, name = line.partition(' ')
+                packed[name] = (oid, None)
+                last = name
+        self._packed, self._packed_stat = packed, stamp
+        return packed
+
+    def read_ref(self, name):
+        """Read a single fully qualified ref and follow symbolic refs.
+
+        Arguments:
+            name (string): The full ref name like `HEAD` or `refs/heads/x`.
+
+        Returns:
+            string: The object id or None if the ref does not exist.
+        """
+        for _ in range(_MAX_SYMREF_DEPTH):
+            try:
+                with open(self._ref_path(name), encoding='utf-8') as file:
+                    content = file.read().strip()
+            except (OSError, UnicodeDecodeError):
+                entry = self.packed_refs().get(name)
+                return entry[0] if entry else None
+            if content.startswith('ref:'):
+                name = content[4:].strip()
+                continue
+            return content if _OID_RE.match(content) else None
+        return None
+
+    def symbolic_ref(self, name='HEAD'):
+        """Return the ref a symbolic ref points to.
+
+        Returns:
+            string: The full ref name, an empty string if the ref is detached
+                or None if it can't be read.
+        """
+        try:
+            with open(self._ref_path(name), encoding='utf-8') as file:
+                content = file.read().strip()
+        except (OSError, UnicodeDecodeError):
+            return None
+        if content.startswith('ref:'):
+            return content[4:].strip()
+        return ''
+
+    def resolve(self, name):
+        """Resolve a ref name to an object id like `git rev-parse` does.
+
+        Arguments:
+            name (string): A full object id or a (abbreviated) ref name.
+
+        Returns:
+            string: The object id or None if the name can't be resolved
+                natively.
+        """
+        if not name or not self.is_supported():
+            return None
+        if _OID_RE.match(name):
+            return name
+        if _REVISION_CHARS.intersection(name) or '..' in name or \
+                name.startswith('/') or name.endswith(('/', '.lock')):
+            return None
+        for rule in _EXPAND_RULES:
+            oid = self.read_ref(rule % name)
+            if oid:
+                return oid
+        return None
+
+    def branch_name(self):
+        """Return the abbreviated name of HEAD like `rev-parse --abbrev-ref`.
+
+        Returns:
+            string: The branch name, 'HEAD' if detached or None if HEAD
+                can't be read.
+        """
+        if not self.is_supported():
+            return None
+        ref = self.symbolic_ref('HEAD')
+        if ref is None:
+            return None
+        if ref.startswith('refs/heads/'):
+            return ref[11:]
+        return ref or 'HEAD'
+
+    def abbrev_length(self):
+        """Return the length of abbreviated object ids like `core.abbrev`.
+
+        The global and the repository's config files are read. If the length
+        isn't configured, git's minimum of 7 characters is used, as the
+        length git scales with the number of objects isn't calculated here.
+
+        Returns:
+            int: The number of characters to abbreviate object ids to.
+        """
+        length = _DEFAULT_ABBREV
+        config_home = os.environ.get('XDG_CONFIG_HOME') or os.path.join(
+            os.path.expanduser('~'), '.config')
+        for file_name in (
+                os.path.join(config_home, 'git', 'config'),
+                os.path.join(os.path.expanduser('~'), '.gitconfig'),
+                os.path.join(self.common_dir, 'config')):
+            value = _read_config(file_name, 'core', 'abbrev')
+            if value is None:
+                continue
+            value = value.strip().lower()
+            if value in ('no', 'false', 'off'):
+                length = 64
+            elif value.isdigit():
+                length = max(_MIN_ABBREV, int(value))
+            else:
+                length = _DEFAULT_ABBREV
+        return length
+
+    def list_refs(self, prefix):
+        """List all refs starting with prefix.
+
+        Arguments:
+            prefix (string): The prefix like `refs/heads/` to list refs of.
+
+        Returns:
+            dict: The map of full ref names and their object ids.
+        """
+        result = {
+            name: entry[0] for name, entry in self.packed_refs().items()
+            if name.startswith(prefix)
+        }
+        base = self._ref_path(prefix)
+        for dir_name, _, file_names in os.walk(base):
+            for file_name in file_names:
+                if file_name.endswith('.lock'):
+                    continue
+                full_path = os.path.join(dir_name, file_name)
+                name = prefix + os.path.relpath(
+                    full_path, base).replace(os.sep, '/')
+                oid = self.read_ref(name)
+                if oid:
+                    result[name] = oid
+        return result
+
+
+def _read_config(file_name, section, key):
+    """Read the last value of a variable from a git config file.
+
+    Only plain `key = value` lines are supported, which is sufficient for
+    simple variables like `core.abbrev`.
+
+    Arguments:
+        file_name (string): The path of the config file.
+        section (string): The name of the section like `core`.
+        key (string): The name of the variable like `abbrev`.
+
+    Returns:
+        string: The value or None if the variable is not set.
+    """
+    try:
+        with open(file_name, encoding='utf-8', errors='replace') as file:
+            lines = file.readlines()
+    except OSError:
+        return None
+    current = None
+    value = None
+    for line in lines:
+        match = _CONFIG_SECTION_RE.match(line)
+        if match:
+            current = match.group(1).lower()
+            line = line[match.end():]
+        if current != section:
+            continue
+        match = _CONFIG_VALUE_RE.match(line)
+        if match and match.group(1).lower() == key:
+            value = match.group(2).strip()
+    return value
+
+
+def parse_object(content):
+    """Parse the headers and message of a commit or tag object.
+
+    Arguments:
+        content (bytes): The raw content of the object.
+
+    Returns:
+        tuple: (headers, subject) with headers being a dictionary of the first
+            value of each header and subject the first paragraph of the
+            message joined to a single line.
+    """
+    text = content.decode('utf-8', 'replace')
+    head, _, message = text.partition('\n\n')
+    headers = {}
+    for line in head.split('\n'):
+        # skip continuation lines of multi-line headers like gpgsig
+        if line and line[0] != ' ':
+            key, _, value = line.partition(' ')
+            headers.setdefault(key, value)
+    subject = ' '.join(
+        line.strip() for line in message.split('\n\n', 1)[0].split('\n')
+        if line.strip())
+    return headers, subject
+
+
+def parse_ident(ident):
+    """Parse an ident like `Name <email> 1234567890 +0200`.
+
+    Returns:
+        tuple: (name, '<email>', timestamp, date) with date in git's default
+            format or ('', '', 0, '') if ident is invalid.
+    """
+    match = re.match(r'^(.*?) ?(<[^>]*>) (\d+) ([+-]\d{4})$', ident or '')
+    if not match:
+        return ('', '', 0, '')
+    name, email, timestamp, tz = match.groups()
+    timestamp = int(timestamp)
+    return (name, email, timestamp, format_date(timestamp, tz))
+
+
+def format_date(timestamp, tz):
+    """Format a timestamp like git's default date format.
+
+    Arguments:
+        timestamp (int): The seconds since epoch.
+        tz (string): The time zone offset like `+0200`.
+
+    Returns:
+        string: The date like `Thu Apr 7 15:13:13 2005 -0700`.
+    """
+    sign = -1 if tz[0] == '-' else 1
+    offset = sign * (int(tz[1:3]) * 3600 + int(tz[3:5]) * 60)
+    tm = time.gmtime(timestamp + offset)
+    return '%s %s %d %02d:%02d:%02d %d %s' % (
+        _WEEKDAYS[tm.tm_wday], _MONTHS[tm.tm_mon - 1], tm.tm_mday,
+        tm.tm_hour, tm.tm_min, tm.tm_sec, tm.tm_year, tz)
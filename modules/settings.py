@@ -113,6 +113,17 @@ class ViewSettings(object):
         width = self.get('show_in_minimap', 1)
         return width if width >= 0 else 100000
 
+    @property
+    def viewport_margin(self):
+        """The number of lines around the viewport to bind regions for.
+
+        Returns:
+            int: The number of lines or None to bind regions for all lines.
+        """
+        if not self.get('viewport_regions', False):
+            return None
+        return max(0, self.get('viewport_regions_margin', 500))
+
     @property
     def theme_path(self):
         """Read 'theme' setting and return path to gutter icons."""
@@ -166,3 +177,36 @@ class ViewSettings(object):
                 or None if setting is invalid.
         """
         return self._DIFF_ALGORITHM.get(self.get('diff_algorithm'))
+
+    @property
+    def diff_engine(self):
+        """The engine used to compare the view against the git file.
+
+        Returns:
+            string:
+                'python' to use the built-in xdiff port
+                or 'git' to run `git diff --no-index`.
+        """
+        return 'python' if self.get('diff_engine') == 'python' else 'git'
+
+    @property
+    def object_reader(self):
+        """The backend used to read blobs from the repository.
+
+        Returns:
+            string:
+                'python' to read the object database directly
+                or 'git' to use `git cat-file`.
+        """
+        return 'python' if self.get('object_reader') == 'python' else 'git'
+
+    @property
+    def diff_transport(self):
+        """The way contents are passed to `git diff`.
+
+        Returns:
+            string:
+                'memory' to use anonymous files in memory
+                or 'file' to write temporary files.
+        """
+        return 'memory' if self.get('diff_transport') == 'memory' else 'file'
@@ -1,9 +1,54 @@
+from itertools import chain
+from itertools import repeat
+from operator import sub
+
 import sublime
 
+from . import metrics
+from .hunks import DELETED
+from .hunks import INSERTED
+from .hunks import MODIFIED
+from .hunks import Changes
+
+
+def update_viewport(git_gutter, **kwargs):
+    """Bind the gutter regions of the lines scrolled into the viewport.
+
+    Arguments:
+        git_gutter (GitGutterCommand):
+            The main command object, which represents GitGutter.
+        kwargs (dict):
+            The arguments received from the `run_command`.
+            This argument is declared to create a common interface being used
+            by the GitGutterCommand object.
+    """
+    git_gutter.show_diff_handler.update_viewport()
+
+
+def _clip_runs(runs, first_line, last_line):
+    """Clip runs of lines to a range of rows.
+
+    Arguments:
+        runs (iterable): The tuples (start, length) of the runs of lines.
+        first_line (int): The first row to keep.
+        last_line (int): The last row to keep.
+
+    Returns:
+        iterator: The tuples (start, length) of the clipped runs.
+    """
+    for start, length in runs:
+        end = min(start + length, last_line + 1)
+        start = max(start, first_line)
+        if start < end:
+            yield start, end - start
+
 
 class GitGutterShowDiff(object):
     region_names = ('deleted_top', 'deleted_bottom', 'deleted_dual',
                     'inserted', 'changed', 'untracked', 'ignored')
+    # the regions marking all changes in the minimap, if regions are bound
+    # for the viewport only
+    minimap_names = ('deleted_top', 'inserted', 'changed')
 
     def __init__(self, git_handler, status_bar):
         """Initialize GitGutterShowDiff object."""
@@ -12,8 +57,12 @@ class GitGutterShowDiff(object):
         self._line_height = 0
         self._minimap_size = 1
         self._mini_diff = False
-        # True if diff is running
-        self._busy = False
+        # the recent diff result, if regions are bound for the viewport only
+        self._contents = None
+        # the rows (first, last) the regions of the recent diff are bound for
+        self._bound_rows = None
+        # the fingerprints of the regions bound to each region name
+        self._fingerprints = {}
 
     def __del__(self):
         """Delete GitGutterShowDiff object.
@@ -25,25 +74,26 @@ class GitGutterShowDiff(object):
     def clear(self):
         """Remove all gutter icons and status messages."""
         self.git_handler.view.erase_status('00_git_gutter')
+        self._contents = None
         self._clear_regions()
 
     def run(self):
-        """Run diff and update gutter icons and status message."""
-        if not self._busy:
-            self._busy = True
-            self.git_handler.diff().then(self._check_ignored_or_untracked)
+        """Run diff and update gutter icons and status message.
+
+        A diff, which is still queued or running for an outdated state of the
+        view, is cancelled by the git handler, once a new one is queued.
+        """
+        self.git_handler.diff().then(self._check_ignored_or_untracked)
 
     def _check_ignored_or_untracked(self, contents):
         """Check diff result and invoke gutter and status message update.
 
         Arguments:
-            contents (tuble): The result of git_handler.diff(), with the
+            contents (Changes): The result of git_handler.diff(), with the
                 information about the modifications of the file.
-                Scheme: (first, last, [inserted], [modified], [deleted])
         """
         # nothing to update
         if contents is None:
-            self._busy = False
             return
 
         # cache settings
@@ -53,6 +103,7 @@ class GitGutterShowDiff(object):
         self._mini_diff = view.settings().get("mini_diff", False)
 
         if not self.git_handler.in_repo():
+            self._contents = None
 
             show_untracked = not self._mini_diff and self.git_handler.settings.get(
                 'show_markers_on_untracked_file', False)
@@ -60,13 +111,13 @@ class GitGutterShowDiff(object):
             def bind_ignored_or_untracked(is_ignored):
                 if is_ignored:
                     event = 'ignored'
-                    self._update_status(event, (0, 0, [], [], []))
+                    self._update_status(event, Changes())
                     if show_untracked:
                         self._bind_files(event)
                 else:
                     def bind_untracked(is_untracked):
                         event = 'untracked' if is_untracked else 'inserted'
-                        self._update_status(event, (0, 0, [], [], []))
+                        self._update_status(event, Changes())
                         if show_untracked:
                             self._bind_files(event)
                     self.git_handler.untracked().then(bind_untracked)
@@ -78,45 +129,103 @@ class GitGutterShowDiff(object):
         """Update gutter icons for modified files.
 
         Arguments:
-            contents (tuble): The result of git_handler.diff(), with the
+            contents (Changes): The result of git_handler.diff(), with the
                 information about the modifications of the file.
-                Scheme: (first, last, [inserted], [modified], [deleted])
         """
         try:
-            regions = self._contents_to_regions(contents)
-            if not self.git_handler.view_cache.is_changed():
-                for name, region in zip(self.region_names, regions):
-                    self._bind_regions(name, region)
-                self.git_handler.view.erase_regions('git_gutter_ignored')
-                self.git_handler.view.erase_regions('git_gutter_untracked')
+            self._bind_contents(contents)
             self._update_status(
-                'modified' if contents[0] else 'committed', contents)
+                'modified' if contents.first else 'committed', contents)
         except IndexError:
             # Fail silently and don't update ui if _content_to_regions raises
             # index error as the result wouldn't be valid anyway.
             pass
-        finally:
-            self._busy = False
+
+    def update_viewport(self):
+        """Bind the regions of the lines scrolled into the viewport.
+
+        If regions are bound for the viewport only, the recent diff result is
+        kept to bind the regions of the new viewport, once it is scrolled
+        beyond the rows regions are bound for.
+        """
+        contents, rows = self._contents, self._bound_rows
+        if contents is None or \
+                self.git_handler.settings.viewport_margin is None:
+            return
+        first, last = self._viewport_rows(0)
+        if rows[0] <= max(first, contents.first) and \
+                min(last, contents.last) <= rows[1]:
+            return
+        try:
+            self._bind_contents(contents)
+        except IndexError:
+            pass
+
+    def _bind_contents(self, contents):
+        """Bind the regions of the changed lines.
+
+        If the "viewport_regions" setting is enabled, only the regions of
+        the visible rows and the rows within the margin around them are
+        bound.
+
+        Arguments:
+            contents (Changes): The result of git_handler.diff(), with the
+                information about the modifications of the file.
+
+        Raises:
+            IndexError: If the view changed, so the regions are invalid.
+        """
+        margin = self.git_handler.settings.viewport_margin
+        rows = None if margin is None else self._viewport_rows(margin)
+        regions = self._contents_to_regions(contents, rows)
+        if rows is None or not self._minimap_size:
+            minimap_regions = ([], [], [])
+        else:
+            minimap_regions = self._contents_to_minimap_regions(contents)
+        if self.git_handler.view_cache.is_changed():
+            return
+        for name, region in zip(self.region_names, regions):
+            self._bind_regions(name, region)
+        self._bind_regions('ignored', [])
+        self._bind_regions('untracked', [])
+        for name, region in zip(self.minimap_names, minimap_regions):
+            self._bind_regions(name, region, minimap=True)
+        self._contents = None if rows is None else contents
+        self._bound_rows = rows
+
+    def _viewport_rows(self, margin):
+        """Return the rows of the viewport extended by a margin.
+
+        Arguments:
+            margin (int): The number of rows to add above and below.
+
+        Returns:
+            tuple: (first, last) 1-based rows.
+        """
+        view = self.git_handler.view
+        visible = view.visible_region()
+        first = view.rowcol(visible.begin())[0] + 1 - margin
+        last = view.rowcol(visible.end())[0] + 1 + margin
+        return (max(1, first), last)
 
     def _update_status(self, file_state, contents):
         """Update status message.
 
         Arguments:
             file_state (string): The git status of the open file.
-            contents (tuble): The result of git_handler.diff(), with the
+            contents (Changes): The result of git_handler.diff(), with the
                 information about the modifications of the file.
-                Scheme: (first, last, [inserted], [modified], [deleted])
         """
         if self.status_bar.is_enabled():
-            _, _, inserted, modified, deleted = contents
             self.status_bar.update(
                 state=file_state,
-                deleted=len(deleted),
-                inserted=len(inserted),
-                modified=len(modified),
+                deleted=contents.count(DELETED),
+                inserted=contents.count(INSERTED),
+                modified=contents.count(MODIFIED),
             )
 
-    def _contents_to_regions(self, contents):
+    @metrics.timed('stage.contents_to_regions')
+    def _contents_to_regions(self, contents, rows=None):
         """Convert the diff contents to gutter regions.
 
         The returned tuple has the same format as `region_names`.
@@ -126,29 +235,78 @@ class GitGutterShowDiff(object):
         first. All other lines are mapped normally.
 
         Arguments:
-            contents (tuple): The result of git_handler.diff(), with the
+            contents (Changes): The result of git_handler.diff(), with the
                 information about the modifications of the file.
-                Scheme: (first, last, [inserted], [modified], [deleted])
+            rows (tuple): The rows (first, last) to return regions for or
+                None to return the regions of all changed lines.
         """
-        first_line, last_line, ins_lines, mod_lines, del_lines = contents
+        empty = ([], [], [], [], [], [], [])
+        first_line, last_line = contents.first, contents.last
         # Return empty regions, if diff result is empty
         if first_line == 0:
-            return ([], [], [], [], [], [], [])
+            return empty
+        del_lines = contents.lines(DELETED)
+        ins_runs = contents.runs(INSERTED)
+        mod_runs = contents.runs(MODIFIED)
+        if rows:
+            first_line = max(first_line, rows[0])
+            last_line = min(last_line, rows[1])
+            if first_line > last_line:
+                return empty
+            # the line below the last row decides about its deleted region
+            del_lines = [
+                line for line in del_lines
+                if first_line <= line <= last_line + 1]
+            ins_runs = _clip_runs(ins_runs, first_line, last_line)
+            mod_runs = _clip_runs(mod_runs, first_line, last_line)
         # initiate the lines to regions map
         lines_regions = self._get_modified_region(first_line, last_line)
         protected = self._get_protected_regions()
+        # deleted regions
+        regions = self._deleted_lines_to_regions(
+            first_line, last_line, del_lines, lines_regions, protected)
+        # inserted regions
+        regions.append(self._runs_to_regions(
+            first_line, ins_runs, lines_regions, protected))
+        # modified regions
+        regions.append(self._runs_to_regions(
+            first_line, mod_runs, lines_regions, protected))
+        # untracked / ignored regions
+        regions += [[], []]
+        return regions
+
+    def _contents_to_minimap_regions(self, contents):
+        """Convert the diff contents to regions marking changes in the minimap.
+
+        The minimap shows the changes of the whole view, even if the gutter
+        icons are added to the lines of the viewport only. A run of changed
+        lines is marked by a single region, so this is cheap for any number
+        of changed lines.
+
+        Arguments:
+            contents (Changes): The result of git_handler.diff(), with the
+                information about the modifications of the file.
+
+        Returns:
+            tuple: The lists of deleted, inserted and modified regions in the
+                order of `minimap_names`.
+        """
+        view_cache = self.git_handler.view_cache
+        minimap_size = self._minimap_size
+
+        def runs_to_regions(runs):
+            regions = []
+            for start, length in runs:
+                line = view_cache.line(start + length - 2)
+                begin = view_cache.text_point(start - 1, 0)
+                end = min(line.end(), line.begin() + minimap_size)
+                regions.append(sublime.Region(begin, end))
+            return regions
+
         return (
-            # deleted regions
-            self._deleted_lines_to_regions(
-                first_line, del_lines, lines_regions, protected) +
-            # inserted regions
-            [self._lines_to_regions(
-                first_line, ins_lines, lines_regions, protected)] +
-            # modified regions
-            [self._lines_to_regions(
-                first_line, mod_lines, lines_regions, protected)] +
-            # untracked / ignored regions
-            [] + [])
+            runs_to_regions(contents.runs(DELETED)),
+            runs_to_regions(contents.runs(INSERTED)),
+            runs_to_regions(contents.runs(MODIFIED)))
 
     def _get_modified_region(self, first_line, last_line):
         """Create a list of all line start points in the modified Region.
@@ -157,9 +315,9 @@ class GitGutterShowDiff(object):
         the last one.
 
         Note:
-            The points are calculated directly on the buffer string as
-            view.lines(...) takes up to 3 times longer, what hurts especially
-            with larger files.
+            The points are taken from the line start points of the view
+            cache as view.lines(...) takes up to 3 times longer, what hurts
+            especially with larger files.
 
         Arguments:
             first_line(int): The line to start reading with
@@ -168,15 +326,14 @@ class GitGutterShowDiff(object):
         Returns:
             list: The list of text positions of each line start
         """
-        start = self.git_handler.view.text_point(first_line - 1, 0)
-        end = self.git_handler.view.text_point(last_line, 0)
-        lines = [start]
-        for line in self.git_handler.view_cache[start:end].splitlines():
-            start += len(line) + 1
-            lines.append(start)
+        view_cache = self.git_handler.view_cache
+        lines = view_cache.line_starts()[first_line - 1:last_line + 1].tolist()
+        # the line after the last one starts behind the end of file
+        if len(lines) < last_line - first_line + 2:
+            lines.append(view_cache.text_point(last_line, 0) + 1)
         # Add one more dummy line to avoid IndexError due to deleted_bottom
         # regions at the end of file.
-        lines.append(start + 1)
+        lines.append(lines[-1] + 1)
         return lines
 
     def _get_protected_regions(self):
@@ -193,97 +350,132 @@ class GitGutterShowDiff(object):
         return frozenset(
             view.line(reg).a for key in keys for reg in view.get_regions(key))
 
-    def _deleted_lines_to_regions(self, first_line, lines, lines_regions, protected):
+    def _deleted_lines_to_regions(
+            self, first_line, last_line, lines, lines_regions, protected):
         """Convert the list of deleted lines' numbers to three deleted regions.
 
         Arguments:
             first_line (int): The line number hold by lines_region[0]
-            lines (list): The list of line numbers to add gutter icons to
+            last_line (int): The last line to add gutter icons to
+            lines (list): The sorted list of line numbers to add gutter icons
+                to, which may contain the line below last_line
             lines_regions(dict): A map used to translate lines to regions
             protected(list): The list of line start points to exclude
         """
         deleted_top, deleted_dual, deleted_bottom = [], [], []
-        # convert deleted lines to regions
-        if lines:
-            bottom_lines = [line - 1 for line in lines if line > 1]
-            for line in lines:
-                index = line - first_line
-                start = lines_regions[index]
+        minimap_size = self._minimap_size
+        # A deleted line is marked 'dual', if the line below is deleted, too,
+        # as it marks the deletions above and below it then. The line above a
+        # deleted one is marked 'bottom', unless it is a deleted line itself.
+        # As the lines are sorted, only the neighbours need to be compared.
+        prev_line = None
+        for index, line in enumerate(lines):
+            next_line = lines[index + 1] if index + 1 < len(lines) else None
+            if line > first_line and prev_line != line - 1:
+                start = lines_regions[line - first_line - 1]
                 if start not in protected:
-                    end = lines_regions[index + 1]
-                    region = sublime.Region(
-                        start, min(end, start + self._minimap_size))
-                    if line in bottom_lines:
-                        deleted_dual.append(region)
-                        bottom_lines.remove(line)
-                    else:
-                        deleted_top.append(region)
-            deleted_bottom = self._lines_to_regions(
-                first_line, bottom_lines, lines_regions, protected)
+                    end = lines_regions[line - first_line]
+                    deleted_bottom.append(
+                        sublime.Region(start, min(end, start + minimap_size)))
+            prev_line = line
+            if line > last_line:
+                break
+            start = lines_regions[line - first_line]
+            if start not in protected:
+                end = lines_regions[line - first_line + 1]
+                region = sublime.Region(start, min(end, start + minimap_size))
+                if next_line == line + 1:
+                    deleted_dual.append(region)
+                else:
+                    deleted_top.append(region)
         return [deleted_top, deleted_bottom, deleted_dual]
 
-    def _lines_to_regions(self, first_line, lines, lines_regions, protected):
-        """Convert the list of line numbers to regions.
+    def _runs_to_regions(self, first_line, runs, lines_regions, protected):
+        """Convert the runs of changed lines to regions.
 
         Arguments:
             first_line (int): The line number hold by lines_region[0]
-            lines (list): The list of line numbers to add gutter icons to
+            runs (iterable): The tuples (start, length) of the runs of lines
+                to add gutter icons to
             lines_regions(dict): A map used to translate lines to regions
             protected(list): The list of line start points to exclude
         """
         regions = []
-        for line in lines:
-            index = line - first_line
-            start = lines_regions[index]
-            if start not in protected:
-                end = lines_regions[index + 1]
-                region = sublime.Region(
-                    start, min(end, start + self._minimap_size))
-                regions.append(region)
+        minimap_size = self._minimap_size
+        for start, length in runs:
+            index = start - first_line
+            if index + length >= len(lines_regions):
+                raise IndexError('line out of range')
+            for start, end in zip(
+                    lines_regions[index:index + length],
+                    lines_regions[index + 1:index + length + 1]):
+                if start not in protected:
+                    regions.append(
+                        sublime.Region(start, min(end, start + minimap_size)))
         return regions
 
     def _bind_files(self, event):
         """Add gutter icons to each line in the view.
 
-        The regions are calculated directly on the buffer string as
-        view.lines(...) takes up to 3 times longer, what hurts especially
-        with larger files.
+        The regions are calculated from the line start points of the view
+        cache as view.lines(...) takes up to 3 times longer, what hurts
+        especially with larger files.
 
         Arguments:
             event (string): The element of self.region_names to bind
         """
         view = self.git_handler.view
-        start = 0
+        view_cache = self.git_handler.view_cache
+        starts = view_cache.line_starts()
+        size = view_cache.text_point(len(starts), 0)
+        # lines end before the next one starts, the last one at end of file
+        ends = chain(map(sub, starts[1:], repeat(1)), (size,))
+        # an empty last line gets no icon
+        if starts[-1] == size:
+            starts = starts[:-1]
         regions = []
         protected = self._get_protected_regions()
-        for line in self.git_handler.view_cache.text.splitlines():
-            end = start + len(line)
+        for start, end in zip(starts, ends):
             if start not in protected:
                 region = sublime.Region(
                     start, min(end, start + self._minimap_size))
                 regions.append(region)
-            start = end + 1
         self._line_height = view.line_height()
         self._minimap_size = self.git_handler.settings.show_in_minimap
         self._bind_regions(event, regions)
         self._clear_regions(event)
-        self._busy = False
 
-    def _bind_regions(self, event, regions):
+    @metrics.timed('stage.bind_regions')
+    def _bind_regions(self, event, regions, minimap=False):
         """Add gutter icons to all lines defined by their regions.
 
+        The Sublime Text API is called only, if the regions or the way they
+        are drawn changed since they were bound last time. This is the common
+        case if the view is diffed again without being modified, e.g. after
+        activation or changes of the repository.
+
+        Sublime Text moves or collapses the bound regions when the text is
+        modified. So if the view was modified since, the regions are compared
+        with the bound ones as moved by Sublime Text instead, which are equal
+        unless the modification changed the diff result.
+
         Arguments:
             event (string): The element of self.region_names to bind
             regions(list): A list of sublime.Region objects to add icons to.
+            minimap (bool): True to bind the regions marking changes in the
+                minimap without gutter icons.
         """
-        region_name = 'git_gutter_%s' % event
+        if minimap:
+            region_name = 'git_gutter_minimap_%s' % event
+        else:
+            region_name = 'git_gutter_%s' % event
         if regions:
             if event.startswith('del'):
                 scope = 'markup.deleted.git_gutter'
             else:
                 scope = 'markup.%s.git_gutter' % event
 
-            if self._mini_diff:
+            if self._mini_diff or minimap:
                 icon = ''
             else:
                 icon = self._icon_path(event)
@@ -297,10 +489,26 @@ class GitGutterShowDiff(object):
                 # supported as of ST4160
                 flags |= sublime.NO_UNDO
 
-            self.git_handler.view.add_regions(
-                region_name, regions, scope, icon, flags)
+            view = self.git_handler.view
+            change_count = view.change_count()
+            style = (scope, icon, flags)
+            fingerprint = (
+                change_count, style, len(regions),
+                hash(tuple((region.a, region.b) for region in regions)))
+            bound = self._fingerprints.get(region_name)
+            unchanged = bound == fingerprint
+            if not unchanged and bound and bound[1] == style:
+                if bound[0] != change_count:
+                    # compare with the bound regions moved by modifications
+                    unchanged = view.get_regions(region_name) == regions
+            if unchanged:
+                metrics.count('ui.regions_unchanged')
+                self._remember_regions(region_name, fingerprint)
+                return
+            view.add_regions(region_name, regions, scope, icon, flags)
+            self._remember_regions(region_name, fingerprint)
         else:
-            self.git_handler.view.erase_regions(region_name)
+            self._erase_regions(region_name)
 
     def _clear_regions(self, exclude=[]):
         """Remove all gutter icons.
@@ -310,7 +518,35 @@ class GitGutterShowDiff(object):
         """
         for name in self.region_names:
             if name not in exclude:
-                self.git_handler.view.erase_regions('git_gutter_%s' % name)
+                self._erase_regions('git_gutter_%s' % name)
+        for name in self.minimap_names:
+            self._erase_regions('git_gutter_minimap_%s' % name)
+
+    def _erase_regions(self, region_name):
+        """Remove the regions of a name, unless known to be erased already.
+
+        Arguments:
+            region_name (string): The name of the regions to remove.
+        """
+        if self._fingerprints.get(region_name, False) is None:
+            metrics.count('ui.regions_unchanged')
+            return
+        self.git_handler.view.erase_regions(region_name)
+        self._remember_regions(region_name, None)
+
+    def _remember_regions(self, region_name, fingerprint):
+        """Remember the fingerprint of the regions bound to a name.
+
+        Regions are restored by undo without NO_UNDO flag, so the bound ones
+        are unknown then and are always bound again.
+
+        Arguments:
+            region_name (string): The name of the bound regions.
+            fingerprint (tuple): The fingerprint of the bound regions or None
+                if they were erased.
+        """
+        if hasattr(sublime, 'NO_UNDO'):
+            self._fingerprints[region_name] = fingerprint
 
     def _icon_path(self, event):
         """Built the full path to the icon to show for the event.
@@ -1,6 +1,7 @@
 import sublime
 
 from . import blame
+from . import metrics
 from . import templates
 
 
@@ -160,5 +161,6 @@ class GitGutterStatusBar(object):
                 want_update = True
 
         if want_update:
-            self.view.set_status(
-                '00_git_gutter', self.template.render(**self.vars))
+            with metrics.timer('stage.status_bar'):
+                self.view.set_status(
+                    '00_git_gutter', self.template.render(**self.vars))
@@ -10,6 +10,8 @@ import textwrap
 import sublime
 import sublime_plugin
 
+from . import metrics
+
 # get absolute path of the package
 try:
     PACKAGE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__spec__.origin)))
@@ -123,6 +125,27 @@ class GitGutterSupportInfoCommand(sublime_plugin.ApplicationCommand):
             - jinja2 %(jinja)s
             """ % info
         )
+        msg += '\nPerformance:\n' + ''.join(
+            '- %s\n' % line for line in metrics.summary().splitlines())
 
         sublime.message_dialog(msg + '\nInfo has been copied to clipboard.')
         sublime.set_clipboard(msg)
+
+
+class GitGutterPerformanceReportCommand(sublime_plugin.WindowCommand):
+    """Print the recorded performance metrics to an output panel."""
+
+    def run(self, reset=False):
+        """Run command.
+
+        Arguments:
+            reset (bool): If True clear all metrics after printing them.
+        """
+        panel = self.window.create_output_panel('GitGutter Performance')
+        panel.settings().set('word_wrap', False)
+        panel.run_command('append', {
+            'characters': metrics.report(), 'force': True})
+        self.window.run_command(
+            'show_panel', {'panel': 'output.GitGutter Performance'})
+        if reset:
+            metrics.reset()
@@ -1,16 +1,38 @@
+import heapq
+import itertools
 import traceback
 
-from queue import Empty
-from queue import Queue
+from threading import Condition
+from threading import Lock
 from threading import Thread
+from threading import local
+from time import perf_counter
 
+from . import metrics
+from . import settings
 from .promise import Promise
 
+# The number of worker threads if not configured by settings.
+DEFAULT_WORKERS = 4
+
+# The priorities of tasks. Tasks with lower values run first.
+# Requests the user actively waits for like blame or quick panels.
+PRIORITY_INTERACTIVE = 0
+# Updates of the gutter.
+PRIORITY_NORMAL = 1
+# Updates of the status bar and other informational background work.
+PRIORITY_BACKGROUND = 2
+
 
 class Task(object):
 
     """
     Task runs a python function `target` when called.
+
+    A task can be cancelled at any time. If it is still queued it is dropped.
+    If it is already running, all subprocesses attached to it are killed and
+    the target can check `is_cancelled()` to stop early. The Promise of a
+    cancelled task is never resolved, but its `on_cancel` function is called.
     """
 
     def __init__(self, target, *args, **kwargs):
@@ -18,66 +40,262 @@ class Task(object):
         self.target = target
         self.args = args
         self.kwargs = kwargs
+        self.cancelled = False
+        # the time the task was queued at
+        self.queued = 0.0
+        # the key of tasks this one is superseded by
+        self.supersede = None
+        # the subprocesses to kill if the task is cancelled while running
+        self.processes = []
+        # the function to call without arguments, once the task is cancelled
+        self.on_cancel = None
+
+    def cancel(self):
+        """Cancel the task and kill all its attached subprocesses."""
+        if not self.cancelled:
+            metrics.count('tasks.cancelled')
+        self.cancelled = True
+        for proc in self.processes:
+            try:
+                proc.kill()
+            except OSError:
+                pass
 
     def run(self):
         self.target(*self.args, **self.kwargs)
 
 
-class TaskQueue(Thread):
+class TaskPool(object):
 
     """
-    A background thread to start all queued processes one after another.
+    A pool of background threads to run queued tasks.
+
+    Tasks are queued with a key, which is usually the working tree they
+    operate on. All tasks with the same key run one after another, while tasks
+    with different keys run concurrently. This way a slow git command in one
+    repository doesn't block the others, but two commands never run in the
+    same repository at the same time.
+
+    Tasks without a key don't depend on each other and may run concurrently.
+
+    Each task has a priority. Queued tasks with higher priority (lower value)
+    run before the others, tasks with the same priority in queued order.
+
+    A task may be queued with a supersede key. Queuing another task with the
+    same supersede key cancels the former one, as its result is outdated.
     """
 
-    def __init__(self):
-        super().__init__(daemon=True)
-        self.queue = Queue()
-        self.active_task = None
-        self.running = False
+    def __init__(self, size):
+        """Initialize the TaskPool object.
 
-    def __del__(self):
-        self.running = False
+        Arguments:
+            size (int): The maximum number of worker threads.
+        """
+        self.size = max(1, size)
+        self.workers = []
+        self.lock = Condition()
+        # the sequence number of queued tasks to keep queued order
+        self.counter = itertools.count()
+        # the map of keys and the heap of their queued tasks
+        self.queues = {}
+        # the heap of keys with queued tasks, which may contain outdated items
+        self.ready = []
+        # the map of keys and their running task
+        self.active = {}
+        # the map of supersede keys and the latest task queued with them
+        self.latest = {}
 
-    def execute(self, task):
-        self.queue.put(task)
+    def execute(self, task, key=None, priority=PRIORITY_NORMAL,
+                supersede=None):
+        """Queue a task to be run by the next idle worker.
+
+        Arguments:
+            task (Task): The task to run.
+            key (any): The hashable key of the serialized task queue.
+            priority (int): One of the PRIORITY_... constants.
+            supersede (any): The hashable key of tasks to be cancelled by
+                this one.
+        """
+        if key is None:
+            key = task
+        former = None
+        with self.lock:
+            if supersede is not None:
+                former = self.latest.get(supersede)
+                if former:
+                    former.cancel()
+                self.latest[supersede] = task
+                task.supersede = supersede
+            task.queued = perf_counter()
+            item = (priority, next(self.counter), task)
+            queue = self.queues.setdefault(key, [])
+            heapq.heappush(queue, item)
+            if key not in self.active and queue[0] is item:
+                heapq.heappush(self.ready, item[:2] + (key,))
+            if len(self.workers) < min(
+                    self.size, len(self.queues) + len(self.active)):
+                worker = Thread(target=self.run, daemon=True)
+                self.workers.append(worker)
+                worker.start()
+            self.lock.notify()
+        if former:
+            _notify_cancelled([former])
 
     def cancel_all(self):
-        try:
-            while not self.Empty():
-                self.queue.get_nowait()
-                self.queue.task_done()
-        except Empty:
-            pass
+        """Cancel all queued and running tasks."""
+        with self.lock:
+            cancelled = [
+                task for queue in self.queues.values() for _, _, task in queue]
+            cancelled.extend(self.active.values())
+            for task in cancelled:
+                task.cancel()
+            self.queues.clear()
+            self.ready.clear()
+            self.latest.clear()
+        _notify_cancelled(cancelled)
 
     def busy(self):
-        return self.active_task is not None
+        return bool(self.active)
+
+    def _next(self):
+        """Pop the next task to run from the queues.
+
+        Must be called with the lock held.
+
+        Returns:
+            tuple: (key, task) or (None, None) if no task is ready to run.
+        """
+        while self.ready:
+            _, _, key = heapq.heappop(self.ready)
+            if key in self.active:
+                continue
+            queue = self.queues.get(key)
+            while queue:
+                _, _, task = heapq.heappop(queue)
+                if not task.cancelled:
+                    break
+            else:
+                self.queues.pop(key, None)
+                continue
+            if queue:
+                heapq.heappush(self.ready, queue[0][:2] + (key,))
+            else:
+                del self.queues[key]
+            return key, task
+        return None, None
 
     def run(self):
-        self.running = True
-        while self.running:
-            task = self.queue.get()
-            self.active_task = task
+        while True:
+            with self.lock:
+                key, task = self._next()
+                while task is None:
+                    self.lock.wait()
+                    key, task = self._next()
+                self.active[key] = task
+            metrics.record('tasks.wait', perf_counter() - task.queued)
+            _current.task = task
             try:
                 task.run()
             except:
                 traceback.print_exc()
             finally:
-                self.queue.task_done()
-                self.active_task = None
+                _current.task = None
+                with self.lock:
+                    del self.active[key]
+                    if self.latest.get(task.supersede) is task:
+                        del self.latest[task.supersede]
+                    queue = self.queues.get(key)
+                    if queue:
+                        heapq.heappush(self.ready, queue[0][:2] + (key,))
+                        self.lock.notify()
+
 
+def _notify_cancelled(cancelled):
+    """Call the `on_cancel` functions of cancelled tasks.
 
-_tasks = TaskQueue()
-_tasks.start()
+    They are called without holding the pool's lock, as they may acquire
+    locks of their own, which are held while queuing tasks.
+
+    Arguments:
+        cancelled (list): The Task objects, which were cancelled.
+    """
+    for task in cancelled:
+        if task.on_cancel:
+            try:
+                task.on_cancel()
+            except:
+                traceback.print_exc()
+
+
+_tasks = None
+_tasks_lock = Lock()
+
+# The task running on the current thread.
+_current = local()
+
+
+def _pool():
+    """Return the TaskPool and create it with the first task queued."""
+    global _tasks
+    with _tasks_lock:
+        if _tasks is None:
+            try:
+                size = int(settings.get('worker_threads', DEFAULT_WORKERS))
+            except (TypeError, ValueError):
+                size = DEFAULT_WORKERS
+            _tasks = TaskPool(size)
+        return _tasks
 
 
 def busy():
-    return _tasks.busy()
+    return _tasks is not None and _tasks.busy()
+
+
+def execute_async(func, *args, key=None, priority=PRIORITY_NORMAL,
+                  supersede=None, on_cancel=None, **kwargs):
+    """Run a function in background and return a Promise.
+
+    Arguments:
+        func (callable): The function to call with the Promise's resolve
+            function as first argument followed by `args` and `kwargs`.
+        key (any): The hashable key to serialize tasks with, usually the
+            working tree. Tasks with the same key run one after another.
+        priority (int): One of the PRIORITY_... constants.
+        supersede (any): The hashable key to cancel the formerly queued task
+            with the same key, e.g. an outdated diff of a view.
+        on_cancel (callable): The function to call, if the task is cancelled,
+            as the promise is never resolved then.
+
+    Returns:
+        Promise: The promise to be resolved by `func`.
+    """
+    def queue(resolve_fn):
+        task = Task(func, resolve_fn, *args, **kwargs)
+        task.on_cancel = on_cancel
+        _pool().execute(task, key, priority, supersede)
+
+    return Promise(queue)
+
+
+def attach(proc):
+    """Attach a subprocess to the running task to kill it on cancellation.
+
+    Arguments:
+        proc (subprocess.Popen): The process started by the running task.
+    """
+    task = getattr(_current, 'task', None)
+    if task:
+        task.processes.append(proc)
+        if task.cancelled:
+            proc.kill()
 
 
-def execute_async(func, *args, **kwargs):
-    return Promise(lambda resolve_fn: _tasks.execute(
-        Task(func, resolve_fn, *args, **kwargs)))
+def is_cancelled():
+    """Return True if the task running on the current thread was cancelled."""
+    task = getattr(_current, 'task', None)
+    return task is not None and task.cancelled
 
 
 def cancel_all():
-    _tasks.cancel_all()
+    if _tasks is not None:
+        _tasks.cancel_all()
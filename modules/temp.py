@@ -112,3 +112,66 @@ class TempFile(object):
 
     def tell(self):
         return self._file.tell()
+
+
+class MemoryFile(object):
+    """An anonymous file in memory to pass content to child processes.
+
+    The file is created by `memfd_create`, which is available on Linux only,
+    so no data is written to disk even if TEMP_DIR is not a tmpfs. A child
+    process accesses it via `/proc/self/fd/<fd>`, if the file descriptor is
+    passed to it via `pass_fds`.
+
+    It provides the same interface as TempFile with mode 'wb'. Each time the
+    file is opened, its content is truncated.
+    """
+
+    def __init__(self):
+        """Initialize MemoryFile object.
+
+        Raises:
+            OSError: if the file can't be created.
+        """
+        self.fd = os.memfd_create('GitGutter', os.MFD_CLOEXEC)
+        self.name = '/proc/self/fd/%d' % self.fd
+        self._file = None
+        # Cache close to keep it available in __del__().
+        self._close = os.close
+
+    def __del__(self):
+        """Destroy the MemoryFile object and release its memory."""
+        try:
+            self.close()
+            self._close(self.fd)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        """`With` statement support."""
+        return self.open()
+
+    def __exit__(self, exc, value, tb):
+        """`With` statement support."""
+        self.close()
+
+    def open(self):
+        """Truncate the file and open it for writing."""
+        if self._file is None:
+            os.ftruncate(self.fd, 0)
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            self._file = open(self.fd, mode='wb', closefd=False)
+        return self._file
+
+    def close(self):
+        """Close the file object, but keep the file descriptor open."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def tell(self):
+        return self._file.tell()
+
+
+def memory_files_supported():
+    """Return True if MemoryFile is available on this platform."""
+    return hasattr(os, 'memfd_create') and os.path.isdir('/proc/self/fd')
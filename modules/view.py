@@ -1,7 +1,18 @@
 import codecs
+import os
+import threading
+import weakref
+
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from itertools import chain
+from itertools import repeat
+from operator import add
 
 import sublime
 
+from . import metrics
 from .temp import TempFile
 
 
@@ -42,6 +53,25 @@ ENCODING_MAP = {
     'Vietnamese (Windows 1258)': 'cp1258',
 }
 
+# The encodings of the view content, which can be patched with text changes.
+_PATCHABLE_ENCODINGS = ('utf-8', 'utf-8-sig')
+
+# The map of view ids and view caches to patch with text changes.
+_view_caches = weakref.WeakValueDictionary()
+
+
+def apply_text_changes(view, changes):
+    """Patch the encoded content of a view's cache with text changes.
+
+    Arguments:
+        view (sublime.View): The view whose buffer was changed.
+        changes (list): The `sublime.TextChange` objects describing the
+            changes in the order they were applied.
+    """
+    view_cache = _view_caches.get(view.id())
+    if view_cache is not None:
+        view_cache.apply_changes(changes)
+
 
 class GitGutterViewCache(TempFile):
 
@@ -56,6 +86,25 @@ class GitGutterViewCache(TempFile):
         self._size = None
         # the text content
         self._text = None
+        # the encoded text content
+        self._content = None
+        # the encoded text content was written to the temporary file
+        self._written = False
+        # the path of the view's file, if it is the encoded text content
+        self._content_file = None
+        # the encoded text content patched with the view's text changes
+        self._mirror = None
+        # the view's change count the mirror is up to date with
+        self._mirror_change_count = -1
+        # the number of characters of the mirrored text
+        self._mirror_size = 0
+        # the byte offsets of the first lines in the mirror
+        self._mirror_rows = None
+        self._mirror_lock = threading.Lock()
+        # the view's change count, the start points of all lines and the
+        # number of characters they were read at
+        self._line_index_cache = (-1, None, 0)
+        _view_caches[view.id()] = self
 
     def __getitem__(self, arg):
         if isinstance(arg, sublime.Region):
@@ -77,61 +126,314 @@ class GitGutterViewCache(TempFile):
             self._text = self.view.substr(sublime.Region(0, self.size))
         return self._text
 
+    @property
+    def content(self):
+        """Return the encoded content of the view."""
+        return self._content
+
+    def line_starts(self):
+        """Return the start points of all lines of the view.
+
+        The points are calculated once per change count of the view from the
+        text, summing up the lengths of lines without running python code per
+        line. They are meant for converting many rows and points at once like
+        building gutter regions. A single conversion on the UI thread should
+        call the view's API, as reading the whole text is more expensive.
+
+        Returns:
+            array: The start point of each row.
+        """
+        return self._line_index()[0]
+
+    def _line_index(self):
+        """Return the line start points and the text size of the view.
+
+        Both are stored as one tuple with the change count they belong to,
+        so a thread never reads start points and size of different texts.
+
+        Returns:
+            tuple: (starts, size) The line start points and the number of
+                characters of the view.
+        """
+        change_count = self.view.change_count()
+        line_index = self._line_index_cache
+        if line_index[0] != change_count:
+            if self._change_count == change_count:
+                text = self.text
+            else:
+                text = self.view.substr(sublime.Region(0, self.view.size()))
+            lines = text.split('\n')
+            starts = array('l', accumulate(chain(
+                (0,), map(add, map(len, lines[:-1]), repeat(1)))))
+            line_index = self._line_index_cache = (
+                change_count, starts, len(text))
+        return line_index[1:]
+
+    def text_point(self, row, col):
+        """Return the point of a row and column like `view.text_point()`.
+
+        Arguments:
+            row (int): The zero based row.
+            col (int): The zero based column.
+
+        Returns:
+            int: The point clipped to the text.
+        """
+        starts, size = self._line_index()
+        if row >= len(starts):
+            return size
+        return min(starts[max(0, row)] + col, size)
+
+    def rowcol(self, point):
+        """Return the row and column of a point like `view.rowcol()`.
+
+        Arguments:
+            point (int): The point to return row and column for.
+
+        Returns:
+            tuple: (row, col) The zero based row and column.
+        """
+        starts = self._line_index()[0]
+        row = max(0, bisect_right(starts, point) - 1)
+        return (row, point - starts[row])
+
+    def line(self, row):
+        """Return the region of a row without the newline character.
+
+        Arguments:
+            row (int): The zero based row.
+
+        Returns:
+            sublime.Region: The region of the row.
+        """
+        starts, size = self._line_index()
+        if row >= len(starts):
+            return sublime.Region(size, size)
+        start = starts[max(0, row)]
+        if 0 <= row < len(starts) - 1:
+            end = starts[row + 1] - 1
+        else:
+            end = size
+        return sublime.Region(start, end)
+
     def invalidate(self):
-        """Reset change_count and force writing the view cache file.
+        """Reset change_count and force encoding the view's content.
 
-        The view content is written to a temporary file for use with git diff,
-        if the view.change_count() has changed. This method forces the update
-        on the next call of update_view_file().
+        The view content is encoded for use with git diff, if the
+        view.change_count() has changed. This method forces the update
+        on the next call of update().
         """
         self._change_count = -1
         self._size = None
         self._text = None
+        self._content = None
+        self._written = False
+        self._content_file = None
+        self._mirror = None
 
     def is_changed(self):
         """Check whether the content of the view changed."""
         return self._change_count != self.view.change_count()
 
+    @metrics.timed('stage.view_cache_update')
     def update(self):
-        """Write view's content to a temporary file as source for git diff.
+        """Encode the view's content as source for git diff.
+
+        The content is updated only if the view.change_count() has changed.
+        It is written to the temporary file on demand by `write()` only, as
+        the diff engines are passed the differing sections of it.
 
-        The file is updated only if the view.change_count() has changed to
-        reduce the number of required disk writes.
+        If the view is not dirty, its file on disk is read instead of
+        encoding the text, as it is the encoded content. If the mirror of the
+        encoded content was patched with all text changes since the last
+        update, a copy of it is used.
 
         Returns:
-            bool: True indicates updated file.
-                  False is returned if file is up to date.
+            bool: True indicates updated content.
+                  False is returned if content is up to date.
         """
-        # write view buffer to file only, if changed
+        # encode view buffer only, if changed
         change_count = self.view.change_count()
+        metrics.hit('cache.view_file', self._change_count == change_count)
         if self._change_count == change_count:
             return False
 
+        content = None
+        with self._mirror_lock:
+            mirror = self._mirror
+            if mirror is not None and \
+                    self._mirror_change_count == change_count and \
+                    self._mirror_size == self.view.size():
+                content = bytes(mirror)
+
         # invalidate internal cache
         self.invalidate()
 
+        if content is not None:
+            metrics.count('view.patched')
+            self._mirror = mirror
+            self._change_count = change_count
+            self._content = content
+            return True
+
+        content = self._read_file(change_count)
+        if content is not None:
+            metrics.count('view.read_from_disk')
+            self._change_count = change_count
+            self._content = content
+            return True
+
         # Try conversion
         encoding = self.python_friendly_encoding()
+        # Note: The utf-8-sig codec prepends the byte order mark itself.
         try:
             encoded = self.text.encode(encoding)
         except (LookupError, UnicodeError):
             # Fallback to utf8-encoding
             encoded = self.text.encode('utf-8')
 
-        # Write the encoded content to file
-        try:
-            with self as file:
-                if encoding == 'utf-8-sig':
-                    file.write(codecs.BOM_UTF8)
-                file.write(encoded)
-        except OSError as error:
-            print('GitGutter failed to create view cache: %s' % error)
-            return False
-
         # Update internal change counter after job is done
         self._change_count = change_count
+        self._content = encoded
+        if encoding in _PATCHABLE_ENCODINGS:
+            with self._mirror_lock:
+                self._mirror = bytearray(encoded)
+                self._mirror_change_count = change_count
+                self._mirror_size = self.size
+                # the text follows the byte order marks
+                self._mirror_rows = [
+                    len(codecs.BOM_UTF8) if encoding == 'utf-8-sig' else 0]
         return True
 
+    def apply_changes(self, changes):
+        """Patch the mirror of the encoded content with text changes.
+
+        The mirror is a copy of the encoded content, which is kept up to date
+        with the view by rewriting the byte ranges of changed text only. It
+        is used as content by the next `update()` instead of encoding the
+        whole text again.
+
+        The mirror is dropped, if the changes can't be applied. The next
+        `update()` encodes the whole text then.
+
+        Text changes don't report the change count they result in, but are
+        reported on the UI thread right after the buffer was modified, so the
+        patched mirror is tagged with the view's change count. If the view's
+        size differs from the mirrored text's, the view already contains
+        further modifications and the mirror is dropped.
+
+        Arguments:
+            changes (list): The `sublime.TextChange` objects describing the
+                changes of the view's buffer in the order they were applied.
+        """
+        with self._mirror_lock:
+            mirror = self._mirror
+            if mirror is None:
+                return
+            try:
+                for change in changes:
+                    begin, end = change.a, change.b
+                    start = self._mirror_offset(begin.row) + begin.col_utf8
+                    stop = self._mirror_offset(end.row) + end.col_utf8
+                    if stop < start or stop > len(mirror):
+                        raise ValueError('change out of range')
+                    mirror[start:stop] = change.str.encode('utf-8')
+                    # offsets of rows after the changed one are invalid now
+                    del self._mirror_rows[begin.row + 1:]
+                    self._mirror_size += len(change.str) - (end.pt - begin.pt)
+            except (AttributeError, IndexError, ValueError, UnicodeError):
+                self._mirror = None
+                return
+            if self._mirror_size != self.view.size():
+                self._mirror = None
+                return
+            self._mirror_change_count = self.view.change_count()
+
+    def _mirror_offset(self, row):
+        """Return the byte offset of a row of the mirror.
+
+        The offsets of rows are calculated on demand and kept until a change
+        of a row before them.
+
+        Arguments:
+            row (int): The zero based row to return the offset for.
+
+        Returns:
+            int: The offset of the first byte of the row in the mirror.
+
+        Raises:
+            IndexError: If the mirror doesn't contain the row.
+        """
+        rows = self._mirror_rows
+        while len(rows) <= row:
+            offset = self._mirror.find(b'\n', rows[-1])
+            if offset < 0:
+                raise IndexError('row out of range')
+            rows.append(offset + 1)
+        return rows[row]
+
+    def _read_file(self, change_count):
+        """Read the view's file, if it contains the view's encoded content.
+
+        The file is trusted to contain the encoded text without decoding it
+        again, if the view is not dirty, uses Unix line endings and UTF-8,
+        which doesn't convert the text on load, and the file's size matches
+        the number of characters of the view. So files containing multi byte
+        characters are not read, as their encoded size is not known without
+        encoding the text.
+
+        Arguments:
+            change_count (int): The view's change count the content is read
+                for.
+
+        Returns:
+            bytes: The file's content or None if it can't be used.
+        """
+        file_name = self.view.file_name()
+        if not file_name or self.view.is_dirty() or \
+                self.view.line_endings() != 'Unix' or \
+                self.view.encoding() == 'Hexadecimal':
+            return None
+        encoding = self.python_friendly_encoding()
+        if encoding not in _PATCHABLE_ENCODINGS:
+            return None
+        size = self.size
+        if encoding == 'utf-8-sig':
+            size += len(codecs.BOM_UTF8)
+        try:
+            with open(file_name, 'rb') as file:
+                if os.fstat(file.fileno()).st_size != size:
+                    return None
+                content = file.read()
+        except OSError:
+            return None
+        # the file or view might have been modified in the meantime
+        if len(content) != size or self.view.is_dirty() or \
+                self.view.change_count() != change_count:
+            return None
+        self._content_file = file_name
+        return content
+
+    def write(self):
+        """Write the encoded content to the temporary file, if not yet done.
+
+        Returns:
+            string: The path of the file containing the recent content, which
+                is the view's file if it was read from disk, or None if the
+                temporary file can't be written.
+        """
+        if self._content_file:
+            return self._content_file
+        if not self._written and self._content is not None:
+            try:
+                with self as file:
+                    file.write(self._content)
+            except OSError as error:
+                print('GitGutter failed to create view cache: %s' % error)
+                return None
+            self._written = True
+        return self.name if self._written else None
+
     def python_friendly_encoding(self):
         """Read view encoding and transform it for use with python.
 
@@ -0,0 +1,491 @@
+"""Watch the state of git repositories to avoid querying git on each event.
+
+A repository's state, which GitGutter caches, is described by the files
+`HEAD`, `index`, `packed-refs`, the loose refs in `refs/` and the rebase
+directories of its git directory. This module maintains one `Watcher` per
+working tree, which monitors these files and increments a generation counter
+whenever one of them changes. Cached git state is invalidated by comparing
+the generation it was created with against the current one.
+
+On Linux the files are watched via inotify. On other platforms or if inotify
+is not available, the modification times of the files and directories are
+polled once a second by a background thread.
+
+Visible views of a repository are refreshed shortly after its state changed,
+so commits made in an external terminal update the gutter without the view
+being activated.
+"""
+import ctypes
+import ctypes.util
+import errno
+import functools
+import os
+import select
+import struct
+import threading
+import time
+
+import sublime
+
+from . import path
+from .index import Index
+from .objects import ObjectStore
+from .refs import RefReader
+
+# The names within the git directory describing the repository state.
+_GIT_DIR_NAMES = frozenset((
+    'HEAD', 'index', 'packed-refs', 'rebase-merge', 'rebase-apply'))
+# The names within the common directory of a linked working tree.
+_COMMON_DIR_NAMES = frozenset(('packed-refs',))
+# The directories indicating an active rebase.
+_REBASE_DIRS = ('rebase-merge', 'rebase-apply')
+# The marker of watches of the pack directory, which don't change the
+# repository state but release the memory-mapped packs.
+_PACKS = object()
+# The extensions of pack files, which are mapped into memory.
+_PACK_EXTENSIONS = ('.idx', '.pack')
+
+# The interval in seconds to poll the state of repositories without inotify.
+_POLL_INTERVAL = 1.0
+# The time in seconds to wait for a burst of changes to settle.
+_SETTLE_DELAY = 0.2
+
+# The inotify constants (see: linux/inotify.h).
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_CLOEXEC = 0o2000000
+_IN_NONBLOCK = 0o4000
+_IN_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+_IN_MASK |= _IN_CREATE | _IN_DELETE
+_IN_EVENT = struct.Struct('iIII')
+
+
+class Inotify(object):
+    """A thin ctypes wrapper around Linux' inotify API."""
+
+    def __init__(self):
+        """Initialize Inotify object.
+
+        Raises:
+            OSError: if inotify is not available.
+        """
+        if not sublime.platform() == 'linux':
+            raise OSError('inotify is not available')
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (
+            ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+    def close(self):
+        """Close the inotify file descriptor."""
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def add_watch(self, dir_name):
+        """Watch a directory and return the watch descriptor.
+
+        Raises:
+            OSError: if the directory can't be watched.
+        """
+        wd = self._add_watch(self.fd, os.fsencode(dir_name), _IN_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch failed')
+        return wd
+
+    def rm_watch(self, wd):
+        """Remove a watch descriptor."""
+        self._rm_watch(self.fd, wd)
+
+    def read(self):
+        """Read all pending events.
+
+        Returns:
+            list: A list of (wd, mask, name) tuples.
+        """
+        try:
+            data = os.read(self.fd, 65536)
+        except OSError as error:
+            if error.errno == errno.EAGAIN:
+                return []
+            raise
+        result = []
+        offset = 0
+        while offset + _IN_EVENT.size <= len(data):
+            wd, mask, _, size = _IN_EVENT.unpack_from(data, offset)
+            offset += _IN_EVENT.size
+            name = data[offset:offset + size].rstrip(b'\0')
+            offset += size
+            result.append((wd, mask, os.fsdecode(name)))
+        return result
+
+
+class Watcher(object):
+    """The watched state of a working tree's repository."""
+
+    def __init__(self, work_tree):
+        """Initialize Watcher object.
+
+        Arguments:
+            work_tree (string): The real path of the working tree.
+        """
+        self.work_tree = work_tree
+        self.git_dir, self.common_dir = path.git_dirs(work_tree)
+        # the reader of the repository's references
+        self.refs = RefReader(self.git_dir, self.common_dir)
+        # the reader of the repository's object database, created on demand
+        self._objects = None
+        # the reader of the working tree's index file
+        self.index = Index(
+            os.path.join(self.git_dir, 'index')) if self.git_dir else None
+        # the counter which is incremented whenever the repository changed
+        self.generation = 0
+        # a rebase operation is on the fly
+        self.rebase_active = self._is_rebase_active()
+        # the watch descriptors if watched via inotify
+        self.wds = set()
+        # the state of all watched files, if polled
+        self.stamp = None
+        # the state of the pack directory, if polled
+        self.pack_stamp = None
+
+    @property
+    def objects(self):
+        """The reader of the repository's object database."""
+        if self._objects is None and self.common_dir:
+            self._objects = ObjectStore(
+                os.path.join(self.common_dir, 'objects'))
+        return self._objects
+
+    @property
+    def pack_dir(self):
+        """The directory of the repository's pack files."""
+        return os.path.join(self.common_dir, 'objects', 'pack')
+
+    def close(self):
+        """Release the memory-mapped files of the object database."""
+        if self._objects:
+            self._objects.close()
+            self._objects = None
+
+    def release_packs(self):
+        """Unmap all packs, once packs were added or removed.
+
+        Mapped files can't be deleted on Windows, so `git gc` or `git repack`
+        would fail to remove superseded packs otherwise. Packs are mapped
+        again on demand by the next lookup.
+        """
+        if self._objects:
+            self._objects.close()
+
+    def _is_rebase_active(self):
+        """Check whether one of the rebase directories exists."""
+        return bool(self.git_dir) and any(
+            os.path.isdir(os.path.join(self.git_dir, name))
+            for name in _REBASE_DIRS)
+
+    def changed(self):
+        """Increment the generation to invalidate cached git state."""
+        self.rebase_active = self._is_rebase_active()
+        self.generation += 1
+
+    def refs_dirs(self, refs_dir=None):
+        """Return the list of all directories containing loose refs."""
+        result = []
+        for dir_name, _, _ in os.walk(
+                refs_dir or os.path.join(self.common_dir, 'refs')):
+            result.append(dir_name)
+        return result
+
+    def poll(self):
+        """Read the state of all watched files and directories.
+
+        Git updates files by renaming a lock file, which changes the inode of
+        the file and the modification time of its directory.
+
+        Returns:
+            bool: True if the state changed since the last call.
+        """
+        stamp = []
+        names = [os.path.join(self.git_dir, name) for name in _GIT_DIR_NAMES]
+        if self.common_dir != self.git_dir:
+            names += [os.path.join(self.common_dir, name)
+                      for name in _COMMON_DIR_NAMES]
+        for name in names + self.refs_dirs():
+            try:
+                stat = os.stat(name)
+                stamp.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+            except OSError:
+                stamp.append(None)
+        stamp = tuple(stamp)
+        self.poll_packs()
+        if self.stamp == stamp:
+            return False
+        self.stamp = stamp
+        return True
+
+    def poll_packs(self):
+        """Release the mapped packs, if the pack directory changed."""
+        try:
+            stat = os.stat(self.pack_dir)
+            stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        except OSError:
+            stamp = None
+        if self.pack_stamp != stamp:
+            self.pack_stamp = stamp
+            self.release_packs()
+
+
+class WatcherThread(threading.Thread):
+    """The background thread monitoring all watched repositories."""
+
+    def __init__(self):
+        """Initialize WatcherThread object."""
+        super().__init__(daemon=True)
+        self._lock = threading.Lock()
+        # the watchers of all working trees
+        self._watchers = set()
+        # the watchers with pending changes and the time of the last change
+        self._pending = {}
+        # the inotify object or None, if not available
+        try:
+            self._inotify = Inotify()
+        except (AttributeError, OSError, TypeError):
+            self._inotify = None
+        # the map of watch descriptors and (watcher, names, dir_name) tuples
+        self._wds = {}
+        self.running = True
+
+    def add(self, watcher):
+        """Start watching a repository."""
+        with self._lock:
+            self._watchers.add(watcher)
+            if watcher.git_dir and self._inotify:
+                try:
+                    self._add_watch(watcher, watcher.git_dir, _GIT_DIR_NAMES)
+                    if watcher.common_dir != watcher.git_dir:
+                        self._add_watch(
+                            watcher, watcher.common_dir, _COMMON_DIR_NAMES)
+                    for dir_name in watcher.refs_dirs():
+                        self._add_watch(watcher, dir_name, None)
+                    try:
+                        self._add_watch(watcher, watcher.pack_dir, _PACKS)
+                    except OSError:
+                        pass
+                    return
+                except OSError:
+                    # fall back to polling if running out of watches
+                    self._remove_watches(watcher)
+            if watcher.git_dir:
+                watcher.poll()
+
+    def remove(self, watcher):
+        """Stop watching a repository.
+
+        Returns:
+            bool: True if no more repositories are watched.
+        """
+        with self._lock:
+            self._watchers.discard(watcher)
+            self._pending.pop(watcher, None)
+            self._remove_watches(watcher)
+            return not self._watchers
+
+    def close(self):
+        """Stop watching all repositories and terminate the thread."""
+        with self._lock:
+            for watcher in self._watchers:
+                self._remove_watches(watcher)
+            self._watchers.clear()
+            self.running = False
+
+    def _add_watch(self, watcher, dir_name, names):
+        wd = self._inotify.add_watch(dir_name)
+        watcher.wds.add(wd)
+        self._wds.setdefault(wd, []).append((watcher, names, dir_name))
+
+    def _remove_watches(self, watcher):
+        for wd in watcher.wds:
+            entries = [
+                entry for entry in self._wds.get(wd, ())
+                if entry[0] is not watcher]
+            if entries:
+                self._wds[wd] = entries
+            else:
+                self._wds.pop(wd, None)
+                self._inotify.rm_watch(wd)
+        watcher.wds.clear()
+
+    def _read_events(self):
+        """Read inotify events and mark the affected watchers as changed."""
+        now = time.time()
+        for wd, mask, name in self._inotify.read():
+            if mask & _IN_Q_OVERFLOW:
+                # events were dropped, so consider everything changed
+                for watcher in self._watchers:
+                    if watcher.wds:
+                        self._pending[watcher] = now
+                continue
+            if mask & _IN_IGNORED or name.endswith('.lock'):
+                continue
+            for watcher, names, dir_name in list(self._wds.get(wd, ())):
+                if names is _PACKS:
+                    if name.endswith(_PACK_EXTENSIONS):
+                        watcher.release_packs()
+                    continue
+                if names is None:
+                    # a loose ref or a directory of refs changed
+                    if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                        self._watch_refs_dir(
+                            watcher, os.path.join(dir_name, name))
+                elif name not in names:
+                    continue
+                self._pending[watcher] = now
+
+    def _watch_refs_dir(self, watcher, refs_dir):
+        """Watch a new directory of refs and all its sub directories."""
+        for dir_name in watcher.refs_dirs(refs_dir):
+            try:
+                self._add_watch(watcher, dir_name, None)
+            except OSError:
+                pass
+
+    def run(self):
+        """Monitor all watched repositories until there is none left."""
+        last_poll = 0.0
+        while self.running:
+            now = time.time()
+            timeout = max(0.0, last_poll + _POLL_INTERVAL - now)
+            if self._pending:
+                timeout = min(timeout, _SETTLE_DELAY)
+            if self._inotify:
+                readable, _, _ = select.select(
+                    [self._inotify.fd], [], [], timeout)
+            else:
+                readable = None
+                time.sleep(timeout)
+
+            with self._lock:
+                if not self.running:
+                    break
+                if readable:
+                    self._read_events()
+
+                now = time.time()
+                if now >= last_poll + _POLL_INTERVAL:
+                    last_poll = now
+                    for watcher in self._watchers:
+                        if watcher.git_dir and not watcher.wds and \
+                                watcher.poll():
+                            self._pending[watcher] = now
+
+                settled = [
+                    watcher for watcher, changed in self._pending.items()
+                    if now - changed >= _SETTLE_DELAY]
+                for watcher in settled:
+                    del self._pending[watcher]
+                    watcher.changed()
+                    sublime.set_timeout(
+                        functools.partial(_refresh_views, watcher.work_tree))
+
+        if self._inotify:
+            self._inotify.close()
+
+
+def _refresh_views(work_tree):
+    """Run `git_gutter` for all visible views of a working tree."""
+    prefix = os.path.join(work_tree, '')
+    for window in sublime.windows():
+        for group in range(window.num_groups()):
+            view = window.active_view_in_group(group)
+            if view and view.settings().get('git_gutter_is_enabled'):
+                file_name = path.realpath(view.file_name())
+                if file_name and file_name.startswith(prefix):
+                    view.run_command('git_gutter')
+
+
+# The map of all working trees and their Watcher objects and reference counts.
+_watchers = {}
+_watchers_lock = threading.Lock()
+# The background thread monitoring all repositories.
+_thread = None
+
+
+def acquire(work_tree):
+    """Return the Watcher object of a working tree and increment its users.
+
+    Arguments:
+        work_tree (string): The real path of the working tree.
+
+    Returns:
+        Watcher: The shared Watcher object of the working tree.
+    """
+    global _thread
+    with _watchers_lock:
+        entry = _watchers.get(work_tree)
+        if entry is None:
+            entry = _watchers[work_tree] = [Watcher(work_tree), 0]
+            if _thread is None or not _thread.running:
+                _thread = WatcherThread()
+                _thread.start()
+            _thread.add(entry[0])
+        entry[1] += 1
+        return entry[0]
+
+
+def release(work_tree):
+    """Decrement the users of a working tree's Watcher and stop it if unused.
+
+    Arguments:
+        work_tree (string): The real path of the working tree.
+    """
+    global _thread
+    with _watchers_lock:
+        entry = _watchers.get(work_tree)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        del _watchers[work_tree]
+        if _thread and _thread.remove(entry[0]):
+            _thread.close()
+            _thread = None
+    entry[0].close()
+
+
+def touch(work_tree):
+    """Invalidate the cached git state of a working tree.
+
+    Arguments:
+        work_tree (string): The real path of the working tree.
+    """
+    with _watchers_lock:
+        entry = _watchers.get(work_tree)
+    if entry:
+        entry[0].changed()
+
+
+def close_all():
+    """Stop watching all repositories."""
+    global _thread
+    with _watchers_lock:
+        entries = list(_watchers.values())
+        _watchers.clear()
+        if _thread:
+            _thread.close()
+            _thread = None
+    for entry in entries:
+        entry[0].close()
@@ -0,0 +1,1353 @@
+"""A pure python port of git's xdiff library.
+
+The module creates the same zero context unified diff `git diff -U0 --no-index`
+creates, but without the need to spawn a process and write the compared
+contents to disk.
+
+Its structure follows git's xdiff sources (xdiffi.c, xprepare.c, xpatience.c
+and xhistogram.c) as close as possible to produce identical hunks, including
+the post processing of change groups with the indent heuristic.
+"""
+import re
+
+from collections import Counter
+
+# The whitespace characters recognized by git (XDL_ISSPACE).
+_WHITESPACE = b' \t\n\r'
+_WHITESPACE_RE = re.compile(b'[ \t\n\r]+')
+
+# The control characters git counts as non-printable to detect binary text.
+_NONPRINTABLE = bytes(
+    c for c in range(32) if c not in b'\b\t\033\014\n\r') + b'\177'
+
+# The amount of bytes to check for NUL characters to detect binary content.
+_FIRST_FEW_BYTES = 8000
+
+# xdiff's tuning parameters of the Myers algorithm.
+_MAX_COST_MIN = 256
+_HEUR_MIN_COST = 256
+_SNAKE_CNT = 20
+_K_HEUR = 4
+_MAX_EQLIMIT = 1024
+_SIMSCAN_WINDOW = 100
+_KPDIS_RUN = 4
+_LINE_MAX = (1 << 63) - 1
+
+# The maximum number of occurrences of a line used by histogram diff.
+_MAX_CHAIN_LENGTH = 64
+
+# The parameters of the indent heuristic.
+_MAX_INDENT = 200
+_MAX_BLANKS = 20
+_START_OF_FILE_PENALTY = 1
+_END_OF_FILE_PENALTY = 21
+_TOTAL_BLANK_WEIGHT = -30
+_POST_BLANK_WEIGHT = 6
+_RELATIVE_INDENT_PENALTY = -4
+_RELATIVE_INDENT_WITH_BLANK_PENALTY = 10
+_RELATIVE_OUTDENT_PENALTY = 24
+_RELATIVE_OUTDENT_WITH_BLANK_PENALTY = 17
+_RELATIVE_DEDENT_PENALTY = 23
+_RELATIVE_DEDENT_WITH_BLANK_PENALTY = 17
+_INDENT_WEIGHT = 60
+_INDENT_HEURISTIC_MAX_SLIDING = 100
+
+# The number of unchanged lines to surround the window of incremental diffs.
+_ANCHOR_LINES = 3
+# Diff the whole contents, if the window covers more than the ratio of lines.
+_MAX_WINDOW_RATIO = 0.5
+_MAX_WINDOW_MIN = 1000
+
+# The regex to parse the line numbers of a hunk header.
+_HUNK_HEADER_RE = re.compile(
+    br'^@@ -(\d+)((?:,\d+)?) \+(\d+)((?:,\d+)?) @@', re.MULTILINE)
+
+# The functions to normalize a line according to the ignore_whitespace setting.
+_LINE_KEYS = {
+    'none': None,
+    'cr': lambda line: (
+        line[:-2] if line.endswith(b'\r\n') else
+        line[:-1] if line.endswith(b'\n') else line),
+    'eol': lambda line: line.rstrip(_WHITESPACE),
+    'space': lambda line: _WHITESPACE_RE.sub(b' ', line).rstrip(_WHITESPACE),
+    'all': lambda line: _WHITESPACE_RE.sub(b'', line)
+}
+
+
+def diff(old, new, algorithm=None, whitespace=None):
+    """Compare two contents and return the unified diff without context.
+
+    The contents are treated like git treats files passed to
+    `git -c core.autocrlf=input diff -U0 --no-index`.
+
+    Arguments:
+        old (bytes):
+            The original content.
+        new (bytes):
+            The modified content.
+        algorithm (string):
+            One of (default, minimal, patience, histogram).
+            Any other value means 'default'.
+        whitespace (string):
+            One of (none, cr, eol, space, all) as described by the
+            `ignore_whitespace` setting. Any other value means 'none'.
+
+    Returns:
+        bytes: The hunks of the unified diff or an empty string, if the
+            contents are equal or binary.
+    """
+    if _is_binary(old) or _is_binary(new):
+        return b''
+    old = _crlf_to_git(old)
+    new = _crlf_to_git(new)
+    if old == new:
+        return b''
+    old, new = _trim_common_tail(old, new)
+    lines1 = split_lines(old)
+    lines2 = split_lines(new)
+    return format_hunks(
+        lines1, lines2, diff_lines(lines1, lines2, algorithm, whitespace))
+
+
+class Differ(object):
+    """Diff a changing content against a fixed one incrementally.
+
+    The object keeps the lines of both contents and the list of changes of the
+    most recent call in memory. If only the new content changed since then,
+    only the window of lines touched by the edit is diffed again. It is
+    widened to the nearest unchanged anchor lines and the result is spliced
+    into the list of changes. The whole contents are diffed, if the original
+    content or the options changed or if the window gets too large.
+    """
+
+    def __init__(self):
+        """Initialize Differ object."""
+        self.reset()
+
+    def reset(self):
+        """Drop all cached contents and changes."""
+        # the original content as passed by the caller
+        self._old = None
+        # the normalized original content
+        self._content1 = b''
+        # the lines of the original content
+        self._lines1 = []
+        # the normalized new content
+        self._new = None
+        # the lines of the new content
+        self._lines2 = []
+        # the (i1, i2, count1, count2) tuples of the most recent diff
+        self._changes = []
+        # the (algorithm, whitespace) options of the most recent diff
+        self._options = None
+
+    def diff(self, old, new, algorithm=None, whitespace=None):
+        """Compare two contents and return the unified diff without context.
+
+        Arguments:
+            old (bytes):
+                The original content.
+            new (bytes):
+                The modified content.
+            algorithm (string):
+                One of (default, minimal, patience, histogram).
+            whitespace (string):
+                One of (none, cr, eol, space, all).
+
+        Returns:
+            bytes: The hunks of the unified diff or an empty string, if the
+                contents are equal or binary.
+        """
+        if _is_binary(old) or _is_binary(new):
+            self.reset()
+            return b''
+
+        options = (algorithm, whitespace)
+        new = _crlf_to_git(new)
+        if old is self._old and options == self._options:
+            if new != self._new:
+                self._update(new, algorithm, whitespace)
+        else:
+            self._old = old
+            self._options = options
+            self._content1 = _crlf_to_git(old)
+            self._lines1 = split_lines(self._content1)
+            self._diff_all(new, algorithm, whitespace)
+
+        return format_hunks(self._lines1, self._lines2, self._changes)
+
+    def _diff_all(self, new, algorithm, whitespace):
+        """Diff the whole new content against the original one.
+
+        The identical leading and trailing lines are not passed to the diff
+        algorithm, but a few anchor lines are kept around the differing
+        section to let the heuristics slide change groups as usual.
+        """
+        lines1 = self._lines1
+        lines2 = split_lines(new)
+        n1, n2 = len(lines1), len(lines2)
+        head, tail = _common_lines(self._content1, new)
+        head = max(0, head - _ANCHOR_LINES)
+        tail = max(0, min(tail, n1 - head, n2 - head) - _ANCHOR_LINES)
+        self._new = new
+        self._lines2 = lines2
+        self._changes = [
+            (i1 + head, i2 + head, count1, count2)
+            for i1, i2, count1, count2 in diff_lines(
+                lines1[head:n1 - tail], lines2[head:n2 - tail],
+                algorithm, whitespace)
+        ]
+
+    def _update(self, new, algorithm, whitespace):
+        """Diff only the window of lines changed since the recent call."""
+        prev, prev_lines, changes = self._new, self._lines2, self._changes
+        lines2 = split_lines(new)
+        nprev, nnew = len(prev_lines), len(lines2)
+
+        # the window of touched lines in the previous content
+        start, tail = _common_lines(prev, new)
+        tail = min(tail, nprev - start, nnew - start)
+        end = nprev - tail
+
+        # widen the window to anchor lines, which belong to no change
+        start = max(0, start - _ANCHOR_LINES)
+        end = min(nprev, end + _ANCHOR_LINES)
+        first = 0
+        while first < len(changes) and \
+                changes[first][1] + changes[first][3] < start:
+            first += 1
+        last = first
+        while last < len(changes) and changes[last][1] <= end:
+            last += 1
+        if first < last:
+            start = min(start, changes[first][1])
+            end = max(end, changes[last - 1][1] + changes[last - 1][3])
+
+        # map the window to the lines of the original content
+        if first:
+            i1, i2, count1, count2 = changes[first - 1]
+            start1 = start + (i1 + count1) - (i2 + count2)
+        else:
+            start1 = start
+        end1 = start1 + (end - start) + sum(
+            count1 - count2 for _, _, count1, count2 in changes[first:last])
+
+        delta = nnew - nprev
+        if (end1 - start1) + (end + delta - start) > max(
+                _MAX_WINDOW_MIN, len(self._lines1) + nnew) * _MAX_WINDOW_RATIO:
+            self._diff_all(new, algorithm, whitespace)
+            return
+
+        window = diff_lines(
+            self._lines1[start1:end1], lines2[start:end + delta],
+            algorithm, whitespace)
+        self._new = new
+        self._lines2 = lines2
+        self._changes = changes[:first] + [
+            (i1 + start1, i2 + start, count1, count2)
+            for i1, i2, count1, count2 in window
+        ] + [
+            (i1, i2 + delta, count1, count2)
+            for i1, i2, count1, count2 in changes[last:]
+        ]
+
+
+def diff_lines(lines1, lines2, algorithm=None, whitespace=None):
+    """Compare two lists of lines and return the list of changes.
+
+    Arguments:
+        lines1 (list):
+            The original lines including line endings.
+        lines2 (list):
+            The modified lines including line endings.
+        algorithm (string):
+            One of (default, minimal, patience, histogram).
+        whitespace (string):
+            One of (none, cr, eol, space, all).
+
+    Returns:
+        list: The list of changes as tuples of (i1, i2, count1, count2) with
+            i1 and i2 being the zero based indexes of the first changed lines.
+    """
+    ha1, ha2 = _classify(lines1, lines2, _LINE_KEYS.get(whitespace))
+    if algorithm == 'patience':
+        rchg1, rchg2 = _patience(ha1, ha2)
+    elif algorithm == 'histogram':
+        rchg1, rchg2 = _histogram(ha1, ha2)
+    else:
+        rchg1, rchg2 = _classic(ha1, ha2, algorithm == 'minimal')
+    _change_compact(lines1, ha1, rchg1, rchg2)
+    _change_compact(lines2, ha2, rchg2, rchg1)
+    return _build_script(rchg1, rchg2, len(ha1), len(ha2))
+
+
+def split_lines(content):
+    """Split content into lines at LF only keeping the line endings.
+
+    Arguments:
+        content (bytes): The content to split.
+
+    Returns:
+        list: The lines of the content.
+    """
+    lines = content.split(b'\n')
+    last = lines.pop()
+    lines = [line + b'\n' for line in lines]
+    if last:
+        lines.append(last)
+    return lines
+
+
+def format_hunks(lines1, lines2, changes):
+    """Create the hunks of a unified diff without context.
+
+    Arguments:
+        lines1 (list): The original lines.
+        lines2 (list): The modified lines.
+        changes (list): The changes as returned by `diff_lines()`.
+
+    Returns:
+        bytes: The hunks in the format git prints them.
+    """
+    result = []
+    for i1, i2, count1, count2 in changes:
+        result.append(''.join((
+            '@@ -', _format_range(i1, count1),
+            ' +', _format_range(i2, count2), ' @@\n')).encode('ascii'))
+        for prefix, lines in ((b'-', lines1[i1:i1 + count1]),
+                              (b'+', lines2[i2:i2 + count2])):
+            for line in lines:
+                result.append(prefix)
+                result.append(line)
+                if not line.endswith(b'\n'):
+                    result.append(b'\n\\ No newline at end of file\n')
+    return b''.join(result)
+
+
+def trim_common_lines(old, new):
+    """Strip the identical leading and trailing lines of two contents.
+
+    The contents are normalized like git does with `core.autocrlf=input`
+    first, unless they are binary. A few anchor lines are kept around the
+    differing section to let the heuristics of the diff algorithms slide
+    change groups as usual.
+
+    Passing the returned sections to any diff engine and moving the hunks by
+    the number of stripped leading lines via `shift_hunks()` afterwards gives
+    the diff of the whole contents.
+
+    Arguments:
+        old (bytes): The original content.
+        new (bytes): The modified content.
+
+    Returns:
+        tuple: (lines, old, new) with lines being the number of stripped
+            leading lines and old and new the differing sections.
+    """
+    if _is_binary(old) or _is_binary(new):
+        return 0, old, new
+    old = _crlf_to_git(old)
+    new = _crlf_to_git(new)
+    size1, size2 = len(old), len(new)
+    size = min(size1, size2)
+
+    # the common prefix, cut at the start of its last line
+    low, high = 0, size
+    while low < high:
+        mid = (low + high + 1) // 2
+        if old[:mid] == new[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    start = old.rfind(b'\n', 0, low) + 1
+    for _ in range(_ANCHOR_LINES):
+        if not start:
+            break
+        start = old.rfind(b'\n', 0, start - 1) + 1
+
+    # the common suffix, which doesn't overlap the prefix
+    low, high = 0, size - start
+    while low < high:
+        mid = (low + high + 1) // 2
+        if old[size1 - mid:] == new[size2 - mid:]:
+            low = mid
+        else:
+            high = mid - 1
+    end1, end2 = size1 - low, size2 - low
+    # move the suffix to the beginning of a line in both contents
+    split1 = end1 > start and old[end1 - 1] != 10
+    split2 = end2 > start and new[end2 - 1] != 10
+    if low and (split1 or split2):
+        end1 = old.find(b'\n', end1) + 1 or size1
+    for _ in range(_ANCHOR_LINES):
+        if end1 == size1:
+            break
+        end1 = old.find(b'\n', end1) + 1 or size1
+    end2 = size2 - (size1 - end1)
+
+    return old.count(b'\n', 0, start), old[start:end1], new[start:end2]
+
+
+def shift_hunks(diff, lines):
+    """Move the line numbers of all hunk headers of a unified diff.
+
+    Arguments:
+        diff (bytes): The unified diff of the contents returned by
+            `trim_common_lines()`.
+        lines (int): The number of stripped leading lines.
+
+    Returns:
+        bytes: The unified diff of the whole contents.
+    """
+    if not lines or not diff:
+        return diff
+
+    def shift_header(match):
+        start1, count1, start2, count2 = match.groups()
+        return ('@@ -%d%s +%d%s @@' % (
+            int(start1) + lines, count1.decode('ascii'),
+            int(start2) + lines, count2.decode('ascii'))).encode('ascii')
+
+    return _HUNK_HEADER_RE.sub(shift_header, diff)
+
+
+def _format_range(start, count):
+    """Format the start and size of a hunk's side like xdl_emit_hunk_hdr."""
+    if count == 1:
+        return str(start + 1)
+    return '%d,%d' % (start + 1 if count else start, count)
+
+
+def _is_binary(content):
+    """Check if content is binary like git's buffer_is_binary()."""
+    return b'\0' in content[:_FIRST_FEW_BYTES]
+
+
+def _crlf_to_git(content):
+    """Convert CRLF to LF like git does with `core.autocrlf=input`.
+
+    Git doesn't convert contents with lone CR, NUL or too many non-printable
+    characters as they are considered binary.
+    """
+    crlf = content.count(b'\r\n')
+    if not crlf or crlf != content.count(b'\r'):
+        return content
+    nonprintable = len(content) - len(content.translate(None, _NONPRINTABLE))
+    if content.endswith(b'\032'):
+        nonprintable -= 1
+    printable = len(content) - nonprintable - crlf - content.count(b'\n')
+    if (printable >> 7) < nonprintable:
+        return content
+    return content.replace(b'\r\n', b'\n')
+
+
+def _trim_common_tail(old, new):
+    """Strip the common tail of both contents like git's trim_common_tail().
+
+    Git drops whole blocks of identical trailing bytes before diffing without
+    context, which affects the heuristics of the Myers algorithm as they
+    depend on the number of lines.
+    """
+    blk = 1024
+    size1, size2 = len(old), len(new)
+    smaller = min(size1, size2)
+    trimmed = 0
+    while blk + trimmed <= smaller and \
+            old[size1 - trimmed - blk:size1 - trimmed] == \
+            new[size2 - trimmed - blk:size2 - trimmed]:
+        trimmed += blk
+    if not trimmed:
+        return old, new
+    # recover the partial line at the beginning of the trimmed block
+    start = size1 - trimmed
+    end = old.find(b'\n', start)
+    recovered = trimmed if end < 0 else end + 1 - start
+    trimmed -= recovered
+    return old[:size1 - trimmed], new[:size2 - trimmed]
+
+
+def _common_lines(content1, content2):
+    """Count the identical leading and trailing lines of two contents.
+
+    The common prefix and suffix are found by bisection with slice compares,
+    which keeps the work on the C level.
+
+    Returns:
+        tuple: (head, tail) number of identical leading and trailing lines.
+    """
+    size = min(len(content1), len(content2))
+
+    low, high = 0, size
+    while low < high:
+        mid = (low + high + 1) // 2
+        if content1[:mid] == content2[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    head = content1.count(b'\n', 0, low)
+    # an identical last line without line ending
+    if low == len(content1) == len(content2):
+        head += not content1.endswith(b'\n')
+
+    low, high = 0, size - low
+    while low < high:
+        mid = (low + high + 1) // 2
+        if content1[-mid:] == content2[-mid:]:
+            low = mid
+        else:
+            high = mid - 1
+    tail = min(
+        _count_line_starts(content1, len(content1) - low),
+        _count_line_starts(content2, len(content2) - low))
+    return head, tail
+
+
+def _count_line_starts(content, offset):
+    """Count the lines of content, which start at or after offset."""
+    if offset >= len(content):
+        return 0
+    if offset == 0:
+        return 1 + content.count(b'\n', 0, len(content) - 1)
+    return content.count(b'\n', offset - 1, len(content) - 1)
+
+
+def _classify(lines1, lines2, key):
+    """Map each line to the id of its equivalence class.
+
+    Arguments:
+        lines1 (list): The original lines.
+        lines2 (list): The modified lines.
+        key (callable): The function to normalize whitespace or None.
+
+    Returns:
+        tuple: The lists of class ids of both sides.
+    """
+    classes = {}
+    result = []
+    for lines in (lines1, lines2):
+        if key:
+            lines = map(key, lines)
+        ha = []
+        for line in lines:
+            idx = classes.get(line)
+            if idx is None:
+                idx = classes[line] = len(classes)
+            ha.append(idx)
+        result.append(ha)
+    return result
+
+
+def _bogosqrt(n):
+    """Classical integer square root approximation using shifts."""
+    i = 1
+    while n > 0:
+        i <<= 1
+        n >>= 2
+    return i
+
+
+# ----------------------------------------------------------------------------
+# Myers
+# ----------------------------------------------------------------------------
+
+def _classic(ha1, ha2, need_min):
+    """Run the classic Myers algorithm like xdl_do_diff().
+
+    Arguments:
+        ha1 (list): The class ids of the original lines.
+        ha2 (list): The class ids of the modified lines.
+        need_min (bool): If True don't use heuristics to speed up diffing.
+
+    Returns:
+        tuple: Two bytearrays marking changed lines with 1. Both have an extra
+            element with 0 at their end as sentinel.
+    """
+    nrec1, nrec2 = len(ha1), len(ha2)
+    rchg1 = bytearray(nrec1 + 1)
+    rchg2 = bytearray(nrec2 + 1)
+
+    # xdl_trim_ends()
+    lim = min(nrec1, nrec2)
+    dstart = 0
+    while dstart < lim and ha1[dstart] == ha2[dstart]:
+        dstart += 1
+    lim -= dstart
+    i = 0
+    while i < lim and ha1[nrec1 - i - 1] == ha2[nrec2 - i - 1]:
+        i += 1
+    dend1 = nrec1 - i - 1
+    dend2 = nrec2 - i - 1
+
+    # xdl_cleanup_records()
+    rindex1, reff1 = _cleanup_records(
+        ha1, dstart, dend1, Counter(ha2), rchg1)
+    rindex2, reff2 = _cleanup_records(
+        ha2, dstart, dend2, Counter(ha1), rchg2)
+
+    nreff1, nreff2 = len(reff1), len(reff2)
+    ndiags = nreff1 + nreff2 + 3
+    # the diagonal vectors are indexed by k + offset as k may be negative
+    offset = nreff2 + 1
+    kvdf = [0] * ndiags
+    kvdb = [0] * ndiags
+    mxcost = max(_bogosqrt(ndiags), _MAX_COST_MIN)
+
+    stack = [(0, nreff1, 0, nreff2, need_min)]
+    while stack:
+        off1, lim1, off2, lim2, need_min = stack.pop()
+
+        # shrink the box by walking through each diagonal snake
+        while off1 < lim1 and off2 < lim2 and reff1[off1] == reff2[off2]:
+            off1 += 1
+            off2 += 1
+        while off1 < lim1 and off2 < lim2 and \
+                reff1[lim1 - 1] == reff2[lim2 - 1]:
+            lim1 -= 1
+            lim2 -= 1
+
+        if off1 == lim1:
+            for i in range(off2, lim2):
+                rchg2[rindex2[i]] = 1
+        elif off2 == lim2:
+            for i in range(off1, lim1):
+                rchg1[rindex1[i]] = 1
+        else:
+            i1, i2, min_lo, min_hi = _split(
+                reff1, off1, lim1, reff2, off2, lim2,
+                kvdf, kvdb, offset, need_min, mxcost)
+            stack.append((i1, lim1, i2, lim2, min_hi))
+            stack.append((off1, i1, off2, i2, min_lo))
+
+    return rchg1, rchg2
+
+
+def _cleanup_records(ha, dstart, dend, counts, rchg):
+    """Discard lines which can't match any line of the other side.
+
+    Lines without any match are changed for sure. Lines with lots of matches
+    are discarded, if they are surrounded by unmatched lines. The remaining
+    lines are passed to the Myers algorithm.
+
+    Returns:
+        tuple: The list of indexes and class ids of the remaining lines.
+    """
+    mlim = min(_bogosqrt(len(ha)), _MAX_EQLIMIT)
+    dis = bytearray(len(ha) + 1)
+    for i in range(dstart, dend + 1):
+        nm = counts.get(ha[i], 0)
+        dis[i] = 0 if nm == 0 else 2 if nm >= mlim else 1
+
+    rindex, reff = [], []
+    for i in range(dstart, dend + 1):
+        if dis[i] == 1 or (
+                dis[i] == 2 and not _clean_mmatch(dis, i, dstart, dend)):
+            rindex.append(i)
+            reff.append(ha[i])
+        else:
+            rchg[i] = 1
+    return rindex, reff
+
+
+def _clean_mmatch(dis, i, s, e):
+    """Check whether a multimatch line is surrounded by unmatched lines."""
+    if i - s > _SIMSCAN_WINDOW:
+        s = i - _SIMSCAN_WINDOW
+    if e - i > _SIMSCAN_WINDOW:
+        e = i + _SIMSCAN_WINDOW
+
+    r, rdis0, rpdis0 = 1, 0, 1
+    while i - r >= s:
+        if not dis[i - r]:
+            rdis0 += 1
+        elif dis[i - r] == 2:
+            rpdis0 += 1
+        else:
+            break
+        r += 1
+    if rdis0 == 0:
+        return False
+
+    r, rdis1, rpdis1 = 1, 0, 1
+    while i + r <= e:
+        if not dis[i + r]:
+            rdis1 += 1
+        elif dis[i + r] == 2:
+            rpdis1 += 1
+        else:
+            break
+        r += 1
+    if rdis1 == 0:
+        return False
+
+    rdis1 += rdis0
+    rpdis1 += rpdis0
+    return rpdis1 * _KPDIS_RUN < rpdis1 + rdis1
+
+
+def _split(ha1, off1, lim1, ha2, off2, lim2, kvdf, kvdb, offset,
+           need_min, mxcost):
+    """Find the middle snake of the box like xdl_split().
+
+    Returns:
+        tuple: (i1, i2, min_lo, min_hi) with the split point and whether the
+            lower and upper boxes need to be diffed minimal.
+    """
+    dmin, dmax = off1 - lim2, lim1 - off2
+    fmid, bmid = off1 - off2, lim1 - lim2
+    odd = (fmid - bmid) & 1
+    fmin = fmax = fmid
+    bmin = bmax = bmid
+
+    kvdf[fmid + offset] = off1
+    kvdb[bmid + offset] = lim1
+
+    ec = 0
+    while True:
+        ec += 1
+        got_snake = False
+
+        if fmin > dmin:
+            fmin -= 1
+            kvdf[fmin - 1 + offset] = -1
+        else:
+            fmin += 1
+        if fmax < dmax:
+            fmax += 1
+            kvdf[fmax + 1 + offset] = -1
+        else:
+            fmax -= 1
+
+        for d in range(fmax, fmin - 1, -2):
+            if kvdf[d - 1 + offset] >= kvdf[d + 1 + offset]:
+                i1 = kvdf[d - 1 + offset] + 1
+            else:
+                i1 = kvdf[d + 1 + offset]
+            prev1 = i1
+            i2 = i1 - d
+            while i1 < lim1 and i2 < lim2 and ha1[i1] == ha2[i2]:
+                i1 += 1
+                i2 += 1
+            if i1 - prev1 > _SNAKE_CNT:
+                got_snake = True
+            kvdf[d + offset] = i1
+            if odd and bmin <= d <= bmax and kvdb[d + offset] <= i1:
+                return i1, i2, True, True
+
+        if bmin > dmin:
+            bmin -= 1
+            kvdb[bmin - 1 + offset] = _LINE_MAX
+        else:
+            bmin += 1
+        if bmax < dmax:
+            bmax += 1
+            kvdb[bmax + 1 + offset] = _LINE_MAX
+        else:
+            bmax -= 1
+
+        for d in range(bmax, bmin - 1, -2):
+            if kvdb[d - 1 + offset] < kvdb[d + 1 + offset]:
+                i1 = kvdb[d - 1 + offset]
+            else:
+                i1 = kvdb[d + 1 + offset] - 1
+            prev1 = i1
+            i2 = i1 - d
+            while i1 > off1 and i2 > off2 and ha1[i1 - 1] == ha2[i2 - 1]:
+                i1 -= 1
+                i2 -= 1
+            if prev1 - i1 > _SNAKE_CNT:
+                got_snake = True
+            kvdb[d + offset] = i1
+            if not odd and fmin <= d <= fmax and i1 <= kvdf[d + offset]:
+                return i1, i2, True, True
+
+        if need_min:
+            continue
+
+        # If the edit cost is above the heuristic trigger and if we got a
+        # good snake, sample current diagonals to see if some of them have
+        # reached an "interesting" path.
+        if got_snake and ec > _HEUR_MIN_COST:
+            best = 0
+            for d in range(fmax, fmin - 1, -2):
+                dd = d - fmid if d > fmid else fmid - d
+                i1 = kvdf[d + offset]
+                i2 = i1 - d
+                v = (i1 - off1) + (i2 - off2) - dd
+                if v > _K_HEUR * ec and v > best and \
+                        off1 + _SNAKE_CNT <= i1 < lim1 and \
+                        off2 + _SNAKE_CNT <= i2 < lim2:
+                    k = 1
+                    while ha1[i1 - k] == ha2[i2 - k]:
+                        if k == _SNAKE_CNT:
+                            best = v
+                            spl1, spl2 = i1, i2
+                            break
+                        k += 1
+            if best > 0:
+                return spl1, spl2, True, False
+
+            best = 0
+            for d in range(bmax, bmin - 1, -2):
+                dd = d - bmid if d > bmid else bmid - d
+                i1 = kvdb[d + offset]
+                i2 = i1 - d
+                v = (lim1 - i1) + (lim2 - i2) - dd
+                if v > _K_HEUR * ec and v > best and \
+                        off1 < i1 <= lim1 - _SNAKE_CNT and \
+                        off2 < i2 <= lim2 - _SNAKE_CNT:
+                    k = 0
+                    while ha1[i1 + k] == ha2[i2 + k]:
+                        if k == _SNAKE_CNT - 1:
+                            best = v
+                            spl1, spl2 = i1, i2
+                            break
+                        k += 1
+            if best > 0:
+                return spl1, spl2, False, True
+
+        # Enough is enough. Collect the furthest reaching path.
+        if ec >= mxcost:
+            fbest = fbest1 = -1
+            for d in range(fmax, fmin - 1, -2):
+                i1 = min(kvdf[d + offset], lim1)
+                i2 = i1 - d
+                if lim2 < i2:
+                    i1, i2 = lim2 + d, lim2
+                if fbest < i1 + i2:
+                    fbest = i1 + i2
+                    fbest1 = i1
+
+            bbest = bbest1 = _LINE_MAX
+            for d in range(bmax, bmin - 1, -2):
+                i1 = max(off1, kvdb[d + offset])
+                i2 = i1 - d
+                if i2 < off2:
+                    i1, i2 = off2 + d, off2
+                if i1 + i2 < bbest:
+                    bbest = i1 + i2
+                    bbest1 = i1
+
+            if (lim1 + lim2) - bbest < fbest - (off1 + off2):
+                return fbest1, fbest - fbest1, True, False
+            return bbest1, bbest - bbest1, False, True
+
+
+def _fall_back_to_classic(ha1, ha2, rchg1, rchg2, line1, count1, line2, count2):
+    """Run Myers on a part of the contents like xdl_fall_back_diff().
+
+    Arguments:
+        line1 (int): The one based first line of the original part.
+        count1 (int): The number of lines of the original part.
+        line2 (int): The one based first line of the modified part.
+        count2 (int): The number of lines of the modified part.
+    """
+    sub1, sub2 = _classic(
+        ha1[line1 - 1:line1 - 1 + count1],
+        ha2[line2 - 1:line2 - 1 + count2], False)
+    rchg1[line1 - 1:line1 - 1 + count1] = sub1[:count1]
+    rchg2[line2 - 1:line2 - 1 + count2] = sub2[:count2]
+
+
+# ----------------------------------------------------------------------------
+# Patience
+# ----------------------------------------------------------------------------
+
+def _patience(ha1, ha2):
+    """Run the patience diff algorithm like xdl_do_patience_diff()."""
+    rchg1 = bytearray(len(ha1) + 1)
+    rchg2 = bytearray(len(ha2) + 1)
+    stack = [(1, len(ha1), 1, len(ha2))]
+    while stack:
+        line1, count1, line2, count2 = stack.pop()
+        if not count1:
+            rchg2[line2 - 1:line2 - 1 + count2] = b'\1' * count2
+            continue
+        if not count2:
+            rchg1[line1 - 1:line1 - 1 + count1] = b'\1' * count1
+            continue
+
+        # fill_hashmap(): unique lines of side 1 and their unique match
+        entries = {}
+        for line in range(line1, line1 + count1):
+            entry = entries.get(ha1[line - 1])
+            if entry is None:
+                entries[ha1[line - 1]] = [line, 0]
+            else:
+                entry[1] = -1
+        has_matches = False
+        for line in range(line2, line2 + count2):
+            entry = entries.get(ha2[line - 1])
+            if entry is not None:
+                has_matches = True
+                entry[1] = line if entry[1] == 0 else -1
+
+        if not has_matches:
+            rchg1[line1 - 1:line1 - 1 + count1] = b'\1' * count1
+            rchg2[line2 - 1:line2 - 1 + count2] = b'\1' * count2
+            continue
+
+        common = _longest_common_sequence(
+            sorted(entry for entry in entries.values() if entry[1] > 0))
+        if not common:
+            _fall_back_to_classic(
+                ha1, ha2, rchg1, rchg2, line1, count1, line2, count2)
+            continue
+
+        # walk_common_sequence()
+        end1, end2 = line1 + count1, line2 + count2
+        index = 0
+        while True:
+            if index < len(common):
+                next1, next2 = common[index]
+                while next1 > line1 and next2 > line2 and \
+                        ha1[next1 - 2] == ha2[next2 - 2]:
+                    next1 -= 1
+                    next2 -= 1
+            else:
+                next1, next2 = end1, end2
+            while line1 < next1 and line2 < next2 and \
+                    ha1[line1 - 1] == ha2[line2 - 1]:
+                line1 += 1
+                line2 += 1
+
+            if next1 > line1 or next2 > line2:
+                stack.append((line1, next1 - line1, line2, next2 - line2))
+
+            if index >= len(common):
+                break
+
+            while index + 1 < len(common) and \
+                    common[index + 1][0] == common[index][0] + 1 and \
+                    common[index + 1][1] == common[index][1] + 1:
+                index += 1
+
+            line1 = common[index][0] + 1
+            line2 = common[index][1] + 1
+            index += 1
+
+    return rchg1, rchg2
+
+
+def _longest_common_sequence(entries):
+    """Find the longest increasing sequence of matches using patience sorting.
+
+    Arguments:
+        entries (list): The sorted list of unique [line1, line2] pairs.
+
+    Returns:
+        list: The longest common sequence of [line1, line2] pairs.
+    """
+    sequence = []
+    previous = {}
+    for entry in entries:
+        # binary search for the last element with a smaller line2
+        left, right = -1, len(sequence)
+        while left + 1 < right:
+            middle = left + (right - left) // 2
+            if sequence[middle][1] > entry[1]:
+                right = middle
+            else:
+                left = middle
+        previous[id(entry)] = sequence[left] if left >= 0 else None
+        left += 1
+        if left == len(sequence):
+            sequence.append(entry)
+        else:
+            sequence[left] = entry
+
+    if not sequence:
+        return []
+    result = []
+    entry = sequence[-1]
+    while entry is not None:
+        result.append(entry)
+        entry = previous[id(entry)]
+    result.reverse()
+    return result
+
+
+# ----------------------------------------------------------------------------
+# Histogram
+# ----------------------------------------------------------------------------
+
+def _histogram(ha1, ha2):
+    """Run the histogram diff algorithm like xdl_do_histogram_diff()."""
+    rchg1 = bytearray(len(ha1) + 1)
+    rchg2 = bytearray(len(ha2) + 1)
+    stack = [(1, len(ha1), 1, len(ha2))]
+    while stack:
+        line1, count1, line2, count2 = stack.pop()
+        while True:
+            if count1 <= 0 and count2 <= 0:
+                break
+            if not count1:
+                rchg2[line2 - 1:line2 - 1 + count2] = b'\1' * count2
+                break
+            if not count2:
+                rchg1[line1 - 1:line1 - 1 + count1] = b'\1' * count1
+                break
+
+            lcs = _find_lcs(ha1, ha2, line1, count1, line2, count2)
+            if lcs is None:
+                _fall_back_to_classic(
+                    ha1, ha2, rchg1, rchg2, line1, count1, line2, count2)
+                break
+            begin1, end1, begin2, end2 = lcs
+            if begin1 == 0 and begin2 == 0:
+                rchg1[line1 - 1:line1 - 1 + count1] = b'\1' * count1
+                rchg2[line2 - 1:line2 - 1 + count2] = b'\1' * count2
+                break
+
+            stack.append((line1, begin1 - line1, line2, begin2 - line2))
+            count1 = line1 + count1 - 1 - end1
+            line1 = end1 + 1
+            count2 = line2 + count2 - 1 - end2
+            line2 = end2 + 1
+
+    return rchg1, rchg2
+
+
+def _find_lcs(ha1, ha2, line1, count1, line2, count2):
+    """Find the longest common sequence of rare lines like find_lcs().
+
+    Returns:
+        tuple: (begin1, end1, begin2, end2) of the one based lines of the
+            found region or None to fall back to Myers, if all common lines
+            occur too often. (0, 0, 0, 0) means there is no common line.
+    """
+    end_a = line1 + count1 - 1
+    end_b = line2 + count2 - 1
+
+    # scanA(): the occurrences of each line ordered by line number
+    counts = {}
+    first = {}
+    next_ptrs = {}
+    for ptr in range(end_a, line1 - 1, -1):
+        ha = ha1[ptr - 1]
+        if ha in first:
+            next_ptrs[ptr] = first[ha]
+            counts[ha] = counts[ha] + 1
+        else:
+            next_ptrs[ptr] = 0
+            counts[ha] = 1
+        first[ha] = ptr
+
+    begin1 = end1 = begin2 = end2 = 0
+    cnt = _MAX_CHAIN_LENGTH + 1
+    has_common = False
+
+    b_ptr = line2
+    while b_ptr <= end_b:
+        # try_lcs()
+        b_next = b_ptr + 1
+        ha = ha2[b_ptr - 1]
+        as_ = first.get(ha)
+        if as_ is not None:
+            rec_cnt = counts[ha]
+            if rec_cnt > cnt:
+                has_common = True
+            else:
+                has_common = True
+                while True:
+                    np = next_ptrs[as_]
+                    bs = b_ptr
+                    ae = as_
+                    be = bs
+                    rc = rec_cnt
+
+                    while line1 < as_ and line2 < bs and \
+                            ha1[as_ - 2] == ha2[bs - 2]:
+                        as_ -= 1
+                        bs -= 1
+                        if 1 < rc:
+                            rc = min(rc, counts[ha1[as_ - 1]])
+                    while ae < end_a and be < end_b and \
+                            ha1[ae] == ha2[be]:
+                        ae += 1
+                        be += 1
+                        if 1 < rc:
+                            rc = min(rc, counts[ha1[ae - 1]])
+
+                    if b_next <= be:
+                        b_next = be + 1
+                    if end1 - begin1 < ae - as_ or rc < cnt:
+                        begin1, end1, begin2, end2 = as_, ae, bs, be
+                        cnt = rc
+
+                    if np == 0:
+                        break
+                    while np <= ae:
+                        np = next_ptrs[np]
+                        if np == 0:
+                            break
+                    if np == 0:
+                        break
+                    as_ = np
+        b_ptr = b_next
+
+    if has_common and _MAX_CHAIN_LENGTH < cnt:
+        return None
+    return begin1, end1, begin2, end2
+
+
+# ----------------------------------------------------------------------------
+# Post processing
+# ----------------------------------------------------------------------------
+
+def _change_compact(lines, ha, rchg, rchgo):
+    """Slide change groups to produce a more intuitive diff.
+
+    Move each group of changed lines as far up as possible, then as far down
+    as possible and finally back up to either align with a group of changes
+    of the other side or to the position the indent heuristic likes best.
+
+    Note:
+        `rchg` and `rchgo` contain a trailing 0 as sentinel, which is also
+        accessed by index -1.
+
+    Arguments:
+        lines (list): The lines of the side to compact.
+        ha (list): The class ids of the side to compact.
+        rchg (bytearray): The change markers of the side to compact.
+        rchgo (bytearray): The change markers of the other side.
+    """
+    nrec = len(ha)
+    nreco = len(rchgo) - 1
+    indents = {}
+
+    def get_indent(i):
+        try:
+            return indents[i]
+        except KeyError:
+            indent = indents[i] = _get_indent(lines[i])
+            return indent
+
+    # group_init()
+    start = end = 0
+    while rchg[end]:
+        end += 1
+    ostart = oend = 0
+    while rchgo[oend]:
+        oend += 1
+
+    while True:
+        if end != start:
+            while True:
+                groupsize = end - start
+                end_matching_other = -1
+
+                # shift the group backward as much as possible
+                while start > 0 and ha[start - 1] == ha[end - 1]:
+                    start -= 1
+                    end -= 1
+                    rchg[start] = 1
+                    rchg[end] = 0
+                    while rchg[start - 1]:
+                        start -= 1
+                    # group_previous() of other side
+                    oend = ostart - 1
+                    ostart = oend
+                    while rchgo[ostart - 1]:
+                        ostart -= 1
+
+                earliest_end = end
+                if oend > ostart:
+                    end_matching_other = end
+
+                # shift the group forward as far as possible
+                while end < nrec and ha[start] == ha[end]:
+                    rchg[start] = 0
+                    rchg[end] = 1
+                    start += 1
+                    end += 1
+                    while rchg[end]:
+                        end += 1
+                    # group_next() of other side
+                    ostart = oend + 1
+                    oend = ostart
+                    while rchgo[oend]:
+                        oend += 1
+                    if oend > ostart:
+                        end_matching_other = end
+
+                if groupsize == end - start:
+                    break
+
+            if end == earliest_end:
+                pass
+            elif end_matching_other != -1:
+                # line up with the last group of changes of the other side
+                while oend == ostart:
+                    start -= 1
+                    end -= 1
+                    rchg[start] = 1
+                    rchg[end] = 0
+                    while rchg[start - 1]:
+                        start -= 1
+                    oend = ostart - 1
+                    ostart = oend
+                    while rchgo[ostart - 1]:
+                        ostart -= 1
+            else:
+                # indent heuristic
+                shift = max(
+                    earliest_end, end - groupsize - 1,
+                    end - _INDENT_HEURISTIC_MAX_SLIDING)
+                best_shift = -1
+                best_score = None
+                while shift <= end:
+                    score = [0, 0]
+                    _score_add_split(
+                        _measure_split(nrec, get_indent, shift), score)
+                    _score_add_split(
+                        _measure_split(nrec, get_indent, shift - groupsize),
+                        score)
+                    if best_shift == -1 or _score_cmp(score, best_score) <= 0:
+                        best_score = score
+                        best_shift = shift
+                    shift += 1
+
+                while end > best_shift:
+                    start -= 1
+                    end -= 1
+                    rchg[start] = 1
+                    rchg[end] = 0
+                    while rchg[start - 1]:
+                        start -= 1
+                    oend = ostart - 1
+                    ostart = oend
+                    while rchgo[ostart - 1]:
+                        ostart -= 1
+
+        # move past the just-processed group
+        if end == nrec:
+            break
+        start = end + 1
+        end = start
+        while rchg[end]:
+            end += 1
+        if oend == nreco:
+            break
+        ostart = oend + 1
+        oend = ostart
+        while rchgo[oend]:
+            oend += 1
+
+
+def _get_indent(line):
+    """Return the indentation of a line or -1 if it contains whitespace only."""
+    ret = 0
+    for c in line:
+        if c == 32:
+            ret += 1
+        elif c == 9:
+            ret += 8 - ret % 8
+        elif c not in (10, 13):
+            return ret
+        if ret >= _MAX_INDENT:
+            return _MAX_INDENT
+    return -1
+
+
+def _measure_split(nrec, get_indent, split):
+    """Measure the surroundings of a split like measure_split().
+
+    Returns:
+        tuple: (end_of_file, indent, pre_blank, pre_indent,
+                post_blank, post_indent)
+    """
+    if split >= nrec:
+        end_of_file = True
+        indent = -1
+    else:
+        end_of_file = False
+        indent = get_indent(split)
+
+    pre_blank = 0
+    pre_indent = -1
+    for i in range(split - 1, -1, -1):
+        pre_indent = get_indent(i)
+        if pre_indent != -1:
+            break
+        pre_blank += 1
+        if pre_blank == _MAX_BLANKS:
+            pre_indent = 0
+            break
+
+    post_blank = 0
+    post_indent = -1
+    for i in range(split + 1, nrec):
+        post_indent = get_indent(i)
+        if post_indent != -1:
+            break
+        post_blank += 1
+        if post_blank == _MAX_BLANKS:
+            post_indent = 0
+            break
+
+    return end_of_file, indent, pre_blank, pre_indent, post_blank, post_indent
+
+
+def _score_add_split(measurement, score):
+    """Add the badness of a split to score like score_add_split()."""
+    end_of_file, indent, pre_blank, pre_indent, post_blank, post_indent = \
+        measurement
+
+    if pre_indent == -1 and pre_blank == 0:
+        score[1] += _START_OF_FILE_PENALTY
+    if end_of_file:
+        score[1] += _END_OF_FILE_PENALTY
+
+    post_blank = 1 + post_blank if indent == -1 else 0
+    total_blank = pre_blank + post_blank
+
+    score[1] += _TOTAL_BLANK_WEIGHT * total_blank
+    score[1] += _POST_BLANK_WEIGHT * post_blank
+
+    if indent == -1:
+        indent = post_indent
+    any_blanks = total_blank != 0
+
+    score[0] += indent
+
+    if indent == -1 or pre_indent == -1:
+        pass
+    elif indent > pre_indent:
+        score[1] += _RELATIVE_INDENT_WITH_BLANK_PENALTY \
+            if any_blanks else _RELATIVE_INDENT_PENALTY
+    elif indent == pre_indent:
+        pass
+    elif post_indent != -1 and post_indent > indent:
+        score[1] += _RELATIVE_OUTDENT_WITH_BLANK_PENALTY \
+            if any_blanks else _RELATIVE_OUTDENT_PENALTY
+    else:
+        score[1] += _RELATIVE_DEDENT_WITH_BLANK_PENALTY \
+            if any_blanks else _RELATIVE_DEDENT_PENALTY
+
+
+def _score_cmp(score1, score2):
+    """Compare two split scores like score_cmp()."""
+    cmp_indents = (score1[0] > score2[0]) - (score1[0] < score2[0])
+    return _INDENT_WEIGHT * cmp_indents + (score1[1] - score2[1])
+
+
+def _build_script(rchg1, rchg2, nrec1, nrec2):
+    """Pair the groups of changed lines of both sides like xdl_build_script().
+
+    Returns:
+        list: The changes as (i1, i2, count1, count2) in ascending order.
+    """
+    changes = []
+    i1, i2 = nrec1, nrec2
+    while i1 >= 0 or i2 >= 0:
+        if (i1 > 0 and rchg1[i1 - 1]) or (i2 > 0 and rchg2[i2 - 1]):
+            l1, l2 = i1, i2
+            while i1 > 0 and rchg1[i1 - 1]:
+                i1 -= 1
+            while i2 > 0 and rchg2[i2 - 1]:
+                i2 -= 1
+            changes.append((i1, i2, l1 - i1, l2 - i2))
+        i1 -= 1
+        i2 -= 1
+    changes.reverse()
+    return changes
@@ -0,0 +1,51 @@
+"""
+Tests for the shared blob store.
+
+To run this unit test install UnitTesting package and choose
+"UnitTesting: Test current project" command.
+"""
+import os
+
+from unittest import TestCase
+
+from modules import blobs
+
+
+class TestBlobStore(TestCase):
+
+    def test_shared(self):
+        self.assertIsNone(blobs.acquire('test_shared'))
+        blob = blobs.add('test_shared', b'content\r\n')
+        self.assertIs(blobs.acquire('test_shared'), blob)
+        self.assertIs(blobs.add('test_shared', b'content\r\n'), blob)
+        self.assertEqual(blob.refs, 3)
+        self.assertEqual(blob.size, 9)
+        self.assertEqual(blob.text('utf-8'), 'content\n')
+        with open(blob.name, 'rb') as file:
+            self.assertEqual(file.read(), b'content\r\n')
+        for _ in range(3):
+            blobs.release(blob)
+
+    def test_leased_blobs_are_kept_in_memory(self):
+        blob = blobs.add('test_leased', b'content')
+        self.assertIsNone(blob._file)
+        blobs.release(blob)
+        self.assertIsNotNone(blob._file)
+
+    def test_unused_blobs_are_kept_on_disk(self):
+        blob = blobs.add('test_unused', b'content')
+        blobs.release(blob)
+        self.assertEqual(blob.refs, 0)
+        self.assertIs(blobs.acquire('test_unused'), blob)
+        self.assertEqual(blob.content, b'content')
+        blobs.release(blob)
+
+    def test_eviction(self):
+        blob = blobs.add('test_eviction', b'content')
+        name = blob.name
+        blobs.release(blob)
+        del blob
+        for index in range(blobs._MAX_UNUSED):
+            blobs.release(blobs.add(('test_eviction', index), b''))
+        self.assertIsNone(blobs.acquire('test_eviction'))
+        self.assertFalse(os.path.exists(name))
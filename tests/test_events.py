@@ -0,0 +1,38 @@
+"""
+Tests for attaching the text change listener to buffers.
+
+To run this unit test install UnitTesting package and choose
+"UnitTesting: Test current project" command.
+"""
+from unittest import TestCase
+from unittest import skipUnless
+
+import sublime
+import sublime_plugin
+
+from modules.events import TextChangeListener
+
+
+@skipUnless(
+    hasattr(sublime_plugin, 'TextChangeListener'), 'requires Sublime Text 4')
+class TestTextChangeListener(TestCase):
+
+    def setUp(self):
+        self.view = sublime.active_window().new_file()
+
+    def tearDown(self):
+        self.view.set_scratch(True)
+        self.view.close()
+
+    def test_is_applicable(self):
+        self.assertTrue(TextChangeListener.is_applicable(self.view.buffer()))
+
+    @skipUnless(
+        hasattr(sublime_plugin, 'text_change_listeners'),
+        'listeners are not tracked by the plugin host')
+    def test_listener_is_attached(self):
+        listeners = sublime_plugin.text_change_listeners.get(
+            self.view.buffer_id(), [])
+        self.assertIn(
+            TextChangeListener.__name__,
+            [type(listener).__name__ for listener in listeners])
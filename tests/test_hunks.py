@@ -0,0 +1,97 @@
+"""
+Tests for the hunk index of unified diffs.
+
+To run this unit test install UnitTesting package and choose
+"UnitTesting: Test current project" command.
+"""
+from unittest import TestCase
+
+from modules.hunks import DELETED
+from modules.hunks import INSERTED
+from modules.hunks import MODIFIED
+from modules.hunks import Changes
+from modules.hunks import Hunks
+
+DIFF = (
+    b'@@ -2 +1,0 @@ first\n'
+    b'-deleted\n'
+    b'@@ -5,2 +4,2 @@ second\n'
+    b'-old \xc3\xa4\n'
+    b'-old b\n'
+    b'+new \xc3\xb6\n'
+    b'+new b\n'
+    b'@@ -10,0 +10,3 @@\n'
+    b'+added a\n'
+    b'+added b\n'
+    b'+added c\n'
+)
+
+
+class TestHunks(TestCase):
+
+    def setUp(self):
+        self.hunks = Hunks(DIFF, 'utf-8')
+
+    def test_line_numbers(self):
+        self.assertEqual(len(self.hunks), 3)
+        self.assertEqual(
+            list(self.hunks), [(2, 1, 1, 0), (5, 2, 4, 2), (10, 0, 10, 3)])
+        self.assertEqual(self.hunks[1], (5, 2, 4, 2))
+        self.assertEqual(list(self.hunks.starts), [1, 4, 10])
+
+    def test_find(self):
+        expected = {
+            0: -1, 1: 0, 2: 0, 3: -1, 4: 1, 5: 1, 6: 1, 7: -1,
+            9: -1, 10: 2, 13: 2, 14: -1}
+        for row, index in expected.items():
+            self.assertEqual(self.hunks.find(row), index, row)
+
+    def test_lines(self):
+        self.assertEqual(self.hunks.lines(0), (['deleted'], []))
+        self.assertEqual(
+            self.hunks.lines(1), (['old ä', 'old b'], ['new ö', 'new b']))
+        self.assertEqual(
+            self.hunks.lines(2), ([], ['added a', 'added b', 'added c']))
+
+    def test_decode_fallback(self):
+        hunks = Hunks(DIFF, 'unknown-encoding')
+        self.assertEqual(hunks.lines(1)[0], ['old ä', 'old b'])
+        hunks = Hunks(DIFF, 'ascii')
+        self.assertEqual(hunks.lines(1)[1], ['new ö', 'new b'])
+        hunks = Hunks(b'@@ -1 +1 @@\n-\xff\n+\xfe\n', 'utf-8')
+        self.assertEqual(hunks.lines(0), ([], []))
+
+    def test_empty(self):
+        hunks = Hunks()
+        self.assertEqual(len(hunks), 0)
+        self.assertEqual(hunks.find(1), -1)
+
+
+class TestChanges(TestCase):
+
+    def setUp(self):
+        self.changes = Changes(Hunks(DIFF))
+
+    def test_runs(self):
+        self.assertEqual(list(self.changes.runs(INSERTED)), [(10, 3)])
+        self.assertEqual(list(self.changes.runs(MODIFIED)), [(4, 2)])
+        self.assertEqual(list(self.changes.runs(DELETED)), [(2, 1)])
+
+    def test_counts(self):
+        self.assertEqual(self.changes.count(INSERTED), 3)
+        self.assertEqual(self.changes.count(MODIFIED), 2)
+        self.assertEqual(self.changes.count(DELETED), 1)
+
+    def test_tuple_compatibility(self):
+        first, last, inserted, modified, deleted = self.changes
+        self.assertEqual((first, last), (1, 13))
+        self.assertEqual(inserted, [10, 11, 12])
+        self.assertEqual(modified, [4, 5])
+        self.assertEqual(deleted, [2])
+        self.assertEqual(self.changes[0], 1)
+        self.assertEqual(self.changes[-1], [2])
+        self.assertEqual(len(self.changes), 5)
+
+    def test_empty(self):
+        self.assertEqual(tuple(Changes()), (0, 0, [], [], []))
+        self.assertEqual(tuple(Changes(Hunks())), (0, 0, [], [], []))
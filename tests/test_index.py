@@ -0,0 +1,109 @@
+"""
+Tests for the native reader of git's index file.
+
+The tests compare the entries read from index files of all supported
+versions with the output of `git ls-files --stage`.
+
+To run this unit test install UnitTesting package and choose
+"UnitTesting: Test current project" command.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+
+from modules import index
+
+
+def git(*args, cwd=None):
+    proc = subprocess.Popen(
+        ('git',) + args, cwd=cwd,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return proc.communicate()[0]
+
+
+class TestIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        if not git('--version'):
+            raise unittest.SkipTest('git not available')
+
+    def setUp(self):
+        self.work_tree = tempfile.mkdtemp()
+        git('init', '-q', cwd=self.work_tree)
+        names = ['README.md', 'a/b/c.txt', 'a/b/d.txt', 'a/bc.txt'] + [
+            'deep/' * 20 + 'long%d.txt' % i for i in range(3)]
+        for name in names:
+            self.write(name, name * 3)
+        git('add', '.', cwd=self.work_tree)
+        self.index = index.Index(
+            os.path.join(self.work_tree, '.git', 'index'))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_tree, ignore_errors=True)
+
+    def write(self, name, content):
+        file_name = os.path.join(self.work_tree, name)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name, 'w') as file:
+            file.write(content)
+        return file_name
+
+    def stat(self, name):
+        return os.stat(os.path.join(self.work_tree, name))
+
+    def ls_files(self):
+        result = {}
+        output = git('ls-files', '--stage', '-z', cwd=self.work_tree)
+        for line in output.decode('utf-8').split('\0'):
+            if line:
+                info, name = line.split('\t', 1)
+                result[name] = info.split()[1]
+        return result
+
+    def test_versions(self):
+        for version in ('2', '3', '4'):
+            git('update-index', '--index-version', version,
+                cwd=self.work_tree)
+            with self.subTest(version=version):
+                entries = self.index.entries()
+                self.assertEqual(
+                    {name: entry.oid for name, entry in entries.items()},
+                    self.ls_files())
+
+    def test_extended_flags(self):
+        self.write('new.txt', 'new')
+        git('add', '--intent-to-add', 'new.txt', cwd=self.work_tree)
+        git('update-index', '--skip-worktree', 'a/bc.txt', cwd=self.work_tree)
+        entries = self.index.entries()
+        self.assertEqual(set(entries), set(self.ls_files()))
+        self.assertFalse(entries['new.txt'].is_trusted())
+        self.assertFalse(entries['a/bc.txt'].is_trusted())
+        self.assertTrue(entries['a/b/c.txt'].is_trusted())
+
+    def test_unchanged_entry(self):
+        # avoid racily clean entries
+        time.sleep(0.01)
+        git('update-index', '--really-refresh', cwd=self.work_tree)
+        self.assertIsNotNone(
+            self.index.unchanged_entry('README.md', self.stat('README.md')))
+        self.write('README.md', 'modified')
+        self.assertIsNone(
+            self.index.unchanged_entry('README.md', self.stat('README.md')))
+        self.assertIsNone(
+            self.index.unchanged_entry('missing', self.stat('a/bc.txt')))
+
+    def test_parse_on_demand(self):
+        self.assertFalse(self.index.is_current())
+        self.assertIsNone(self.index.entry('README.md', parse=False))
+        self.assertIsNotNone(self.index.entry('README.md'))
+        self.assertTrue(self.index.is_current())
+        self.assertIsNotNone(self.index.entry('README.md', parse=False))
+
+    def test_invalid(self):
+        with open(self.index.file_name, 'r+b') as file:
+            file.write(b'XXXX')
+        self.assertIsNone(self.index.entries())
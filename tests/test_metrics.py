@@ -0,0 +1,66 @@
+"""
+Tests for the performance metrics registry.
+
+To run this unit test install UnitTesting package and choose
+"UnitTesting: Test current project" command.
+"""
+from unittest import TestCase
+
+from modules import metrics
+from modules.promise import Promise
+
+
+class TestHistogram(TestCase):
+
+    def test_empty(self):
+        histogram = metrics.Histogram()
+        self.assertEqual(histogram.percentile(50), 0.0)
+        self.assertEqual(histogram.mean, 0.0)
+
+    def test_percentiles(self):
+        histogram = metrics.Histogram()
+        for value in range(1, 1001):
+            histogram.add(float(value))
+        self.assertEqual(histogram.count, 1000)
+        self.assertEqual(histogram.max, 1000.0)
+        for percent in (50, 95, 99):
+            expected = 10.0 * percent
+            actual = histogram.percentile(percent)
+            self.assertGreaterEqual(actual, expected)
+            self.assertLess(actual, expected * 1.2)
+        self.assertEqual(histogram.percentile(100), 1000.0)
+
+    def test_out_of_range(self):
+        histogram = metrics.Histogram()
+        histogram.add(0.0)
+        histogram.add(1e9)
+        self.assertEqual(histogram.percentile(50), 0.01)
+        self.assertEqual(histogram.percentile(100), 1e9)
+
+
+class TestRegistry(TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_timed_promise(self):
+        resolvers = []
+
+        @metrics.timed('stage.test')
+        def func():
+            return Promise(resolvers.append)
+
+        func()
+        self.assertNotIn('stage.test', metrics.report())
+        resolvers[0](None)
+        self.assertIn('stage.test', metrics.report())
+
+    def test_hit_rate(self):
+        for is_hit in (True, True, True, False):
+            metrics.hit('cache.test', is_hit)
+        report = metrics.report()
+        self.assertIn('cache.test.hit', report)
+        self.assertIn('75.0%', report)
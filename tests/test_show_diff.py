@@ -0,0 +1,283 @@
+"""
+Tests and benchmark of the conversion of changed lines to gutter regions.
+
+The benchmark compares the region builder with the former one, which
+searched and removed each deleted line in a list of lines. It is skipped
+unless the environment variable GITGUTTER_BENCHMARK is set.
+
+To run this unit test install UnitTesting package and choose
+"UnitTesting: Test current project" command.
+"""
+import os
+import random
+import time
+
+from unittest import TestCase
+from unittest import skipUnless
+
+import sublime
+
+from modules.hunks import Changes
+from modules.show_diff import GitGutterShowDiff
+from modules.view import GitGutterViewCache
+
+
+class View(object):
+
+    _next_id = 2000000
+
+    def __init__(self, text):
+        View._next_id += 1
+        self._id = View._next_id
+        self.text = text
+        self.calls = []
+        self.regions = {}
+        self._change_count = 0
+
+    def id(self):
+        return self._id
+
+    def change_count(self):
+        return self._change_count
+
+    def size(self):
+        return len(self.text)
+
+    def substr(self, region):
+        return self.text[region.begin():region.end()]
+
+    def line_height(self):
+        return 16
+
+    def erase_status(self, key):
+        pass
+
+    def add_regions(self, key, regions, scope, icon, flags):
+        self.calls.append(('add', key, icon))
+        self.regions[key] = list(regions)
+
+    def erase_regions(self, key):
+        self.calls.append(('erase', key))
+        self.regions.pop(key, None)
+
+    def get_regions(self, key):
+        return list(self.regions.get(key, []))
+
+
+class Settings(dict):
+
+    theme_path = 'Packages/GitGutter/themes/Default'
+    show_in_minimap = 1
+
+
+class Handler(object):
+
+    def __init__(self, text):
+        self.view = View(text)
+        self.view_cache = GitGutterViewCache(self.view)
+        self.settings = Settings()
+
+
+def deleted_lines_to_regions(
+        first_line, lines, lines_regions, protected, minimap_size):
+    """The former implementation of `_deleted_lines_to_regions()`."""
+    def lines_to_regions(lines):
+        regions = []
+        for line in lines:
+            index = line - first_line
+            start = lines_regions[index]
+            if start not in protected:
+                end = lines_regions[index + 1]
+                regions.append(
+                    sublime.Region(start, min(end, start + minimap_size)))
+        return regions
+
+    deleted_top, deleted_dual, deleted_bottom = [], [], []
+    if lines:
+        bottom_lines = [line - 1 for line in lines if line > 1]
+        for line in lines:
+            index = line - first_line
+            start = lines_regions[index]
+            if start not in protected:
+                end = lines_regions[index + 1]
+                region = sublime.Region(
+                    start, min(end, start + minimap_size))
+                if line in bottom_lines:
+                    deleted_dual.append(region)
+                    bottom_lines.remove(line)
+                else:
+                    deleted_top.append(region)
+        deleted_bottom = lines_to_regions(bottom_lines)
+    return [deleted_top, deleted_bottom, deleted_dual]
+
+
+def scattered_lines(rand, num_lines, num_deleted):
+    """Return sorted deleted lines with some adjacent ones."""
+    lines = set()
+    while len(lines) < num_deleted:
+        line = rand.randint(1, num_lines)
+        lines.add(line)
+        if rand.random() < 0.2 and line < num_lines:
+            lines.add(line + 1)
+    return sorted(lines)
+
+
+class TestShowDiff(TestCase):
+
+    def setUp(self):
+        self.text = ''.join('line %d\n' % i for i in range(1, 1001))
+        self.show_diff = GitGutterShowDiff(Handler(self.text), None)
+        self.show_diff._minimap_size = 1
+
+    def test_modified_region(self):
+        lines_regions = self.show_diff._get_modified_region(3, 5)
+        self.assertEqual(lines_regions[0], self.text.index('line 3\n'))
+        self.assertEqual(lines_regions[3], self.text.index('line 6\n'))
+        self.assertEqual(lines_regions[-1], lines_regions[-2] + 1)
+        self.assertEqual(len(lines_regions), 5)
+
+    def test_modified_region_at_end_of_file(self):
+        lines_regions = self.show_diff._get_modified_region(999, 1001)
+        self.assertEqual(lines_regions[0], self.text.index('line 999\n'))
+        self.assertEqual(lines_regions[2], len(self.text))
+        self.assertEqual(lines_regions[3], len(self.text) + 1)
+        self.assertEqual(lines_regions[4], len(self.text) + 2)
+
+    def test_file_regions(self):
+        for text, expected in (
+                ('ab\n\ncd\n', [(0, 1), (3, 3), (4, 5)]),
+                ('ab\ncd', [(0, 1), (3, 4)]),
+                ('', [])):
+            show_diff = GitGutterShowDiff(Handler(text), None)
+            bound = []
+            show_diff._bind_regions = lambda event, regions: bound.extend(
+                (region.begin(), region.end()) for region in regions)
+            show_diff._bind_files('untracked')
+            self.assertEqual(bound, expected)
+
+    def test_deleted_regions(self):
+        rand = random.Random(3)
+        lines_regions = self.show_diff._get_modified_region(1, 1000)
+        for _ in range(50):
+            lines = scattered_lines(rand, 999, rand.randint(0, 200))
+            first_line = lines[0] - 1 if lines and lines[0] > 1 else 1
+            protected = frozenset(
+                lines_regions[line - 1] for line in lines[::7])
+            regions = lines_regions[first_line - 1:]
+            self.assertEqual(
+                self.show_diff._deleted_lines_to_regions(
+                    first_line, 1000, lines, regions, protected),
+                deleted_lines_to_regions(
+                    first_line, lines, regions, protected, 1))
+
+    def test_viewport_regions(self):
+        rand = random.Random(4)
+        for _ in range(50):
+            hunks, line = [], 1
+            while True:
+                line += rand.randint(1, 20)
+                size = rand.randint(0, 2)
+                old_size = 0 if size == 0 else rand.randint(0, 2)
+                if line + size >= 1000:
+                    break
+                hunks.append((0, old_size or 1, line, size))
+                line += size
+            changes = Changes(hunks)
+            all_regions = self.show_diff._contents_to_regions(changes)
+            first = rand.randint(1, 1000)
+            last = rand.randint(first, 1000)
+            view_cache = self.show_diff.git_handler.view_cache
+            begin = view_cache.text_point(first - 1, 0)
+            end = view_cache.text_point(last, 0)
+            self.assertEqual(
+                list(self.show_diff._contents_to_regions(
+                    changes, (first, last)))[:5],
+                [[region for region in regions
+                  if begin <= region.begin() < end]
+                 for regions in all_regions][:5])
+
+    def test_minimap_regions(self):
+        changes = Changes([(0, 2, 3, 2), (0, 0, 10, 3), (0, 1, 20, 0)])
+        view_cache = self.show_diff.git_handler.view_cache
+        self.assertEqual(
+            [[(region.begin(), region.end()) for region in regions]
+             for regions in self.show_diff._contents_to_minimap_regions(
+                changes)],
+            [[(view_cache.text_point(20, 0), view_cache.text_point(20, 1))],
+             [(view_cache.text_point(9, 0), view_cache.text_point(11, 1))],
+             [(view_cache.text_point(2, 0), view_cache.text_point(3, 1))]])
+
+    @skipUnless(hasattr(sublime, 'NO_UNDO'), 'requires ST4160')
+    def test_unchanged_regions_are_not_bound(self):
+        view = self.show_diff.git_handler.view
+        regions = [sublime.Region(0, 1), sublime.Region(7, 8)]
+        self.show_diff._bind_regions('deleted_top', regions)
+        self.show_diff._bind_regions('deleted_top', list(regions))
+        self.show_diff._bind_regions('inserted', [])
+        self.show_diff._bind_regions('inserted', [])
+        self.assertEqual(view.calls, [
+            ('add', 'git_gutter_deleted_top',
+             'Packages/GitGutter/themes/Default/deleted_top.png'),
+            ('erase', 'git_gutter_inserted')])
+        # the icon changes with line height
+        del view.calls[:]
+        self.show_diff._line_height = 20
+        self.show_diff._bind_regions('deleted_top', regions)
+        self.assertEqual(view.calls, [
+            ('add', 'git_gutter_deleted_top',
+             'Packages/GitGutter/themes/Default/deleted_top_arrow.png')])
+        # modified views moved the bound regions along with the diff result
+        del view.calls[:]
+        view._change_count += 1
+        moved = [sublime.Region(2, 3), sublime.Region(9, 10)]
+        view.regions['git_gutter_deleted_top'] = list(moved)
+        self.show_diff._bind_regions('deleted_top', moved)
+        self.assertEqual(view.calls, [])
+        # modified views may have collapsed the bound regions
+        view._change_count += 1
+        view.regions['git_gutter_deleted_top'] = moved[:1]
+        self.show_diff._bind_regions('deleted_top', moved)
+        self.assertEqual(len(view.calls), 1)
+        # changed regions are bound again, erased ones are not erased again
+        del view.calls[:]
+        self.show_diff._bind_regions('deleted_top', regions[:1])
+        self.show_diff._clear_regions()
+        self.show_diff._clear_regions()
+        self.assertEqual(view.calls[0][0], 'add')
+        names = self.show_diff.region_names + self.show_diff.minimap_names
+        self.assertEqual(len(view.calls), len(names))
+        self.assertNotIn(('erase', 'git_gutter_inserted'), view.calls)
+
+
+@skipUnless(
+    os.environ.get('GITGUTTER_BENCHMARK'), 'GITGUTTER_BENCHMARK not set')
+class BenchmarkShowDiff(TestCase):
+
+    def test_benchmark(self):
+        num_lines = 100000
+        text = ''.join('line %d\n' % i for i in range(num_lines))
+        show_diff = GitGutterShowDiff(Handler(text), None)
+        show_diff._minimap_size = 1
+        lines = scattered_lines(random.Random(4), num_lines - 1, 10000)
+        protected = frozenset()
+
+        start = time.perf_counter()
+        lines_regions = show_diff._get_modified_region(1, num_lines)
+        regions = show_diff._deleted_lines_to_regions(
+            1, num_lines, lines, lines_regions, protected)
+        new_duration = time.perf_counter() - start
+
+        start = time.perf_counter()
+        former_lines_regions = [0]
+        for line in text.splitlines():
+            former_lines_regions.append(
+                former_lines_regions[-1] + len(line) + 1)
+        former_lines_regions.append(former_lines_regions[-1] + 1)
+        former_regions = deleted_lines_to_regions(
+            1, lines, former_lines_regions, protected, 1)
+        former_duration = time.perf_counter() - start
+
+        self.assertEqual(regions, former_regions)
+        print()
+        print('%-32s %8.2f ms' % ('former', former_duration * 1000.0))
+        print('%-32s %8.2f ms' % ('linear', new_duration * 1000.0))
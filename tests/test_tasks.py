@@ -0,0 +1,144 @@
+"""
+Tests for the background task pool.
+
+To run this unit test install UnitTesting package and choose
+"UnitTesting: Test current project" command.
+"""
+import threading
+import time
+
+from unittest import TestCase
+
+from modules import tasks
+from modules.tasks import Task
+from modules.tasks import TaskPool
+
+
+class TestTaskPool(TestCase):
+
+    def setUp(self):
+        self.pool = TaskPool(4)
+        self.lock = threading.Lock()
+        self.order = []
+
+    def run_tasks(self, items):
+        """Queue (key, name, delay) tuples and wait for all of them."""
+        events = []
+        for key, name, delay in items:
+            event = threading.Event()
+            events.append(event)
+
+            def target(key=key, name=name, delay=delay, event=event):
+                time.sleep(delay)
+                with self.lock:
+                    self.order.append((key, name))
+                event.set()
+
+            self.pool.execute(Task(target), key)
+        for event in events:
+            self.assertTrue(event.wait(5.0))
+
+    def test_same_key_runs_in_order(self):
+        self.run_tasks([('a', i, 0.05 if i % 2 else 0.0) for i in range(6)])
+        self.assertEqual(self.order, [('a', i) for i in range(6)])
+
+    def test_keys_run_concurrently(self):
+        self.run_tasks([
+            ('slow', 0, 0.3),
+            ('slow', 1, 0.0),
+            ('fast', 0, 0.0),
+            ('fast', 1, 0.0),
+        ])
+        self.assertEqual(
+            self.order, [('fast', 0), ('fast', 1), ('slow', 0), ('slow', 1)])
+
+    def test_pool_size(self):
+        self.run_tasks([(i, i, 0.05) for i in range(10)])
+        self.assertEqual(len(self.order), 10)
+        self.assertLessEqual(len(self.pool.workers), 4)
+
+    def block(self, key):
+        """Queue a task which blocks the key until the returned event is set."""
+        started, release = threading.Event(), threading.Event()
+
+        def target():
+            started.set()
+            release.wait(5.0)
+
+        self.pool.execute(Task(target), key)
+        self.assertTrue(started.wait(5.0))
+        return release
+
+    def test_priorities(self):
+        release = self.block('a')
+        done = threading.Event()
+        for name, priority in (
+                ('background', tasks.PRIORITY_BACKGROUND),
+                ('normal', tasks.PRIORITY_NORMAL),
+                ('interactive', tasks.PRIORITY_INTERACTIVE),
+                ('normal2', tasks.PRIORITY_NORMAL)):
+            self.pool.execute(
+                Task(self.order.append, name), 'a', priority)
+        self.pool.execute(
+            Task(done.set), 'a', tasks.PRIORITY_BACKGROUND)
+        release.set()
+        self.assertTrue(done.wait(5.0))
+        self.assertEqual(
+            self.order, ['interactive', 'normal', 'normal2', 'background'])
+
+    def test_supersede_queued(self):
+        release = self.block('a')
+        done = threading.Event()
+        for name in range(3):
+            self.pool.execute(
+                Task(self.order.append, name), 'a', supersede='diff')
+        self.pool.execute(Task(done.set), 'a')
+        release.set()
+        self.assertTrue(done.wait(5.0))
+        self.assertEqual(self.order, [2])
+
+    def test_supersede_running(self):
+        started, done = threading.Event(), threading.Event()
+
+        def target():
+            started.set()
+            while not tasks.is_cancelled():
+                time.sleep(0.01)
+            done.set()
+
+        self.pool.execute(Task(target), 'a', supersede='diff')
+        self.assertTrue(started.wait(5.0))
+        self.pool.execute(Task(self.order.append, 1), 'a', supersede='diff')
+        self.assertTrue(done.wait(5.0))
+
+    def test_cancel_all(self):
+        release = self.block('a')
+        self.pool.execute(Task(self.order.append, 1), 'a')
+        self.pool.cancel_all()
+        done = threading.Event()
+        self.pool.execute(Task(done.set), 'a')
+        release.set()
+        self.assertTrue(done.wait(5.0))
+        self.assertEqual(self.order, [])
+
+    def test_on_cancel_superseded(self):
+        release = self.block('a')
+        task = Task(self.order.append, 1)
+        task.on_cancel = lambda: self.order.append('cancelled')
+        self.pool.execute(task, 'a', supersede='diff')
+        self.pool.execute(Task(self.order.append, 2), 'a', supersede='diff')
+        self.assertEqual(self.order, ['cancelled'])
+        done = threading.Event()
+        self.pool.execute(Task(done.set), 'a')
+        release.set()
+        self.assertTrue(done.wait(5.0))
+        self.assertEqual(self.order, ['cancelled', 2])
+
+    def test_on_cancel_all(self):
+        release = self.block('a')
+        task = Task(self.order.append, 1)
+        task.on_cancel = lambda: self.order.append('cancelled')
+        self.pool.execute(task, 'a')
+        self.pool.cancel_all()
+        release.set()
+        self.assertEqual(self.order, ['cancelled'])
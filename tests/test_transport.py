@@ -0,0 +1,112 @@
+"""
+Tests and benchmark of the ways to pass contents to `git diff`.
+
+The benchmark compares passing both contents via temporary files with
+passing them via stdin and anonymous files in memory. It is skipped unless
+the environment variable GITGUTTER_BENCHMARK is set, as it takes a while.
+
+To run this unit test install UnitTesting package and choose
+"UnitTesting: Test current project" command.
+"""
+import os
+import subprocess
+import time
+import unittest
+
+from modules import temp
+
+GIT_DIFF = [
+    'git', 'diff', '-U0', '--no-color', '--no-index', '--no-ext-diff']
+
+
+def git_diff(old_name, new_name, stdin=None, pass_fds=()):
+    proc = subprocess.Popen(
+        GIT_DIFF + [old_name, new_name], pass_fds=pass_fds,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output = proc.communicate(stdin)[0]
+    # strip the diff header containing the file names
+    return output[output.find(b'\n@@ ') + 1:]
+
+
+def memory_files_readable():
+    """Check whether git reads memory files passed via `/proc/self/fd`."""
+    if not temp.memory_files_supported():
+        return False
+    old, new = temp.MemoryFile(), temp.MemoryFile()
+    for file, content in ((old, b'old\n'), (new, b'new\n')):
+        with file as stream:
+            stream.write(content)
+    output = git_diff(old.name, new.name, pass_fds=(old.fd, new.fd))
+    return b'\n-old\n+new\n' in b'\n' + output
+
+
+@unittest.skipUnless(temp.memory_files_supported(), 'memfd not available')
+class TestMemoryFile(unittest.TestCase):
+
+    def test_rewrite(self):
+        file = temp.MemoryFile()
+        for content in (b'first content\n', b'second\n', b''):
+            with file as stream:
+                stream.write(content)
+            with open(file.name, 'rb') as stream:
+                self.assertEqual(stream.read(), content)
+
+    def test_stdin_transport(self):
+        old = temp.TempFile(mode='wb')
+        with old as stream:
+            stream.write(b'a\nb\nc\n')
+        self.assertEqual(
+            git_diff(old.name, '-', stdin=b'a\nB\nc\n'),
+            b'@@ -2 +2 @@ a\n-b\n+B\n')
+
+
+@unittest.skipUnless(
+    os.environ.get('GITGUTTER_BENCHMARK'), 'GITGUTTER_BENCHMARK not set')
+class BenchmarkTransport(unittest.TestCase):
+
+    ROUNDS = 200
+
+    def setUp(self):
+        self.old = ''.join(
+            'line %d of the compare target\n' % i for i in range(2000)
+        ).encode('ascii')
+        self.new = self.old.replace(b'line 1000 ', b'changed line 1000 ')
+
+    def run_rounds(self, run):
+        start = time.perf_counter()
+        for _ in range(self.ROUNDS):
+            output = run()
+        self.assertIn(b'+changed line 1000', output)
+        return (time.perf_counter() - start) * 1000.0 / self.ROUNDS
+
+    def test_benchmark(self):
+        old_file, new_file = temp.TempFile('wb'), temp.TempFile('wb')
+
+        def file_transport():
+            with old_file as stream:
+                stream.write(self.old)
+            with new_file as stream:
+                stream.write(self.new)
+            return git_diff(old_file.name, new_file.name)
+
+        if memory_files_readable():
+            old_memory = temp.MemoryFile()
+            pass_fds = (old_memory.fd,)
+        else:
+            old_memory = temp.TempFile('wb')
+            pass_fds = ()
+
+        def memory_transport():
+            with old_memory as stream:
+                stream.write(self.old)
+            return git_diff(
+                old_memory.name, '-', stdin=self.new, pass_fds=pass_fds)
+
+        results = [
+            ('file', self.run_rounds(file_transport)),
+            ('memory (%s + stdin)' % type(old_memory).__name__,
+             self.run_rounds(memory_transport))
+        ]
+        print()
+        for name, duration in results:
+            print('%-32s %8.2f ms per diff' % (name, duration))
@@ -0,0 +1,272 @@
+"""
+Tests for patching the encoded content of a view with text changes.
+
+To run this unit test install UnitTesting package and choose
+"UnitTesting: Test current project" command.
+"""
+import codecs
+import os
+import random
+import tempfile
+
+from collections import namedtuple
+from unittest import TestCase
+
+from modules.view import GitGutterViewCache
+
+Position = namedtuple('Position', 'pt row col_utf8')
+Change = namedtuple('Change', 'a b str')
+
+
+class View(object):
+    """A view of an unsaved buffer, which reports its text changes."""
+
+    _next_id = 1000000
+
+    def __init__(self, text, encoding='UTF-8'):
+        View._next_id += 1
+        self._id = View._next_id
+        self._text = text
+        self._encoding = encoding
+        self._change_count = 0
+        self._settings = {}
+
+    def id(self):
+        return self._id
+
+    def change_count(self):
+        return self._change_count
+
+    def size(self):
+        return len(self._text)
+
+    def substr(self, region):
+        return self._text[region.begin():region.end()]
+
+    def settings(self):
+        return self._settings
+
+    def encoding(self):
+        return self._encoding
+
+    def file_name(self):
+        return None
+
+    def is_dirty(self):
+        return True
+
+    def line_endings(self):
+        return 'Unix'
+
+    def position(self, pt):
+        row = self._text.count('\n', 0, pt)
+        col = pt - (self._text.rfind('\n', 0, pt) + 1)
+        col_utf8 = len(self._text[pt - col:pt].encode('utf-8'))
+        return Position(pt, row, col_utf8)
+
+    def replace(self, begin, end, text):
+        """Replace text and return the change as ST's TextChangeListener."""
+        self._change_count += 1
+        change = Change(self.position(begin), self.position(end), text)
+        self._text = self._text[:begin] + text + self._text[end:]
+        return change
+
+
+class FileView(View):
+    """A view of a saved file."""
+
+    def __init__(self, text, file_name, encoding='UTF-8',
+                 line_endings='Unix'):
+        View.__init__(self, text, encoding)
+        self._file_name = file_name
+        self._line_endings = line_endings
+
+    def file_name(self):
+        return self._file_name
+
+    def is_dirty(self):
+        return False
+
+    def line_endings(self):
+        return self._line_endings
+
+
+class TestViewMirror(TestCase):
+
+    def assert_mirrored(self, view, view_cache, encoding='utf-8'):
+        self.assertTrue(view_cache.update())
+        expected = view._text.encode(encoding)
+        self.assertEqual(view_cache.content, expected)
+
+    def test_patched_content(self):
+        view = View('first line\nsecond line\nthird line\n')
+        view_cache = GitGutterViewCache(view)
+        self.assert_mirrored(view, view_cache)
+        edits = (
+            (0, 0, 'new first line\n'),          # insert at start
+            (15, 21, 'ünïcödé'),                 # replace multi byte
+            (view.size(), view.size(), 'tail'),  # append
+            (3, 30, ''),                         # delete across lines
+            (0, view.size(), ''),                # delete everything
+            (0, 0, 'a\n\nb\n€\n'),               # insert into empty view
+        )
+        for begin, end, text in edits:
+            end = min(end, view.size())
+            view_cache.apply_changes([view.replace(begin, end, text)])
+            self.assertIsNotNone(view_cache._mirror)
+            self.assert_mirrored(view, view_cache)
+
+    def test_batched_changes(self):
+        view = View('alpha\nbeta\ngamma\n')
+        view_cache = GitGutterViewCache(view)
+        self.assert_mirrored(view, view_cache)
+        changes = [
+            view.replace(6, 10, 'BETA'),
+            view.replace(0, 0, 'ä'),
+            view.replace(view.size(), view.size(), 'delta\n'),
+        ]
+        view_cache.apply_changes(changes)
+        self.assert_mirrored(view, view_cache)
+
+    def test_byte_order_mark(self):
+        view = View('ö\nü\n', 'UTF-8 with BOM')
+        view_cache = GitGutterViewCache(view)
+        self.assert_mirrored(view, view_cache, 'utf-8-sig')
+        self.assertEqual(
+            view_cache.content, codecs.BOM_UTF8 + 'ö\nü\n'.encode('utf-8'))
+        view_cache.apply_changes([view.replace(0, 1, 'o')])
+        view_cache.apply_changes([view.replace(2, 3, 'u')])
+        self.assertIsNotNone(view_cache._mirror)
+        self.assert_mirrored(view, view_cache, 'utf-8-sig')
+
+    def test_random_changes(self):
+        rand = random.Random(42)
+        alphabet = 'ab \n\nöß€\U0001F600'
+        view = View(''.join(rand.choice(alphabet) for _ in range(500)))
+        view_cache = GitGutterViewCache(view)
+        self.assert_mirrored(view, view_cache)
+        for _ in range(300):
+            begin = rand.randint(0, view.size())
+            end = rand.randint(begin, min(begin + 20, view.size()))
+            text = ''.join(
+                rand.choice(alphabet) for _ in range(rand.randint(0, 10)))
+            view_cache.apply_changes([view.replace(begin, end, text)])
+            if rand.random() < 0.3:
+                self.assert_mirrored(view, view_cache)
+        self.assert_mirrored(view, view_cache)
+
+    def test_missed_change_falls_back_to_encoding(self):
+        view = View('first\nsecond\n')
+        view_cache = GitGutterViewCache(view)
+        self.assert_mirrored(view, view_cache)
+        # the change is not reported to the view cache
+        view.replace(0, 5, 'FIRST')
+        self.assert_mirrored(view, view_cache)
+        self.assertIsNotNone(view_cache._mirror)
+
+    def test_change_out_of_range_drops_mirror(self):
+        view = View('first\n')
+        view_cache = GitGutterViewCache(view)
+        self.assert_mirrored(view, view_cache)
+        position = Position(20, 3, 0)
+        view_cache.apply_changes([Change(position, position, 'x')])
+        self.assertIsNone(view_cache._mirror)
+        view.replace(0, 0, 'x')
+        self.assert_mirrored(view, view_cache)
+
+    def test_pending_changes_drop_mirror(self):
+        view = View('first\nsecond\n')
+        view_cache = GitGutterViewCache(view)
+        self.assert_mirrored(view, view_cache)
+        change = view.replace(0, 5, 'FIRST')
+        # the next change is not reported yet, when the first one arrives
+        view.replace(6, 12, 'SECOND!')
+        view_cache.apply_changes([change])
+        self.assertIsNone(view_cache._mirror)
+        self.assert_mirrored(view, view_cache)
+
+    def test_mirror_follows_view_change_count(self):
+        view = View('first\n')
+        view_cache = GitGutterViewCache(view)
+        self.assert_mirrored(view, view_cache)
+        view_cache.apply_changes([view.replace(0, 0, 'x')])
+        self.assertEqual(
+            view_cache._mirror_change_count, view.change_count())
+        self.assertTrue(view_cache.update())
+        self.assertEqual(view_cache.content, b'xfirst\n')
+
+    def test_other_encodings_are_not_mirrored(self):
+        view = View('first\n', 'Western (Windows 1252)')
+        view_cache = GitGutterViewCache(view)
+        self.assert_mirrored(view, view_cache, 'cp1252')
+        self.assertIsNone(view_cache._mirror)
+
+
+class TestViewLines(TestCase):
+
+    def test_line_starts(self):
+        for text in ('', 'a', 'a\n', '\n\n', 'ab\nc\n\nd€\U0001F600'):
+            view_cache = GitGutterViewCache(View(text))
+            starts = [0]
+            starts += (
+                index + 1 for index, char in enumerate(text) if char == '\n')
+            self.assertEqual(view_cache.line_starts().tolist(), starts)
+
+    def test_line_starts_follow_changes(self):
+        view = View('first\nsecond\n')
+        view_cache = GitGutterViewCache(view)
+        starts = view_cache.line_starts()
+        self.assertIs(view_cache.line_starts(), starts)
+        view.replace(0, 5, 'a\nb')
+        self.assertEqual(view_cache.line_starts().tolist(), [0, 2, 4, 11])
+
+    def test_conversion(self):
+        view = View('ab\nc\n\ndef')
+        view_cache = GitGutterViewCache(view)
+        for point in range(view.size() + 1):
+            row, col = view_cache.rowcol(point)
+            self.assertEqual(view.position(point)[1:2], (row,))
+            self.assertEqual(view_cache.text_point(row, col), point)
+        self.assertEqual(view_cache.text_point(1, 5), 8)
+        self.assertEqual(view_cache.text_point(9, 0), view.size())
+        self.assertEqual(
+            [(region.begin(), region.end())
+             for region in map(view_cache.line, range(5))],
+            [(0, 2), (3, 4), (5, 5), (6, 9), (9, 9)])
+
+
+class TestViewFile(TestCase):
+
+    def setUp(self):
+        fd, self.file_name = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.file_name)
+
+    def update(self, content, text, encoding='UTF-8', line_endings='Unix'):
+        with open(self.file_name, 'wb') as file:
+            file.write(content)
+        view_cache = GitGutterViewCache(
+            FileView(text, self.file_name, encoding, line_endings))
+        self.assertTrue(view_cache.update())
+        return view_cache
+
+    def test_file_is_read(self):
+        for content, text, encoding in (
+                (b'first\nsecond\n', 'first\nsecond\n', 'UTF-8'),
+                (b'\xef\xbb\xbffirst\n', 'first\n', 'UTF-8 with BOM')):
+            view_cache = self.update(content, text, encoding)
+            self.assertEqual(view_cache.content, content)
+            self.assertEqual(view_cache._content_file, self.file_name)
+
+    def test_file_not_matching_the_view_is_not_read(self):
+        for content, text, encoding, line_endings in (
+                (b'first\r\nsecond\r\n', 'first\nsecond\n', 'UTF-8',
+                 'Windows'),
+                (b'first\n\xc3\xa4\n', 'first\nä\n', 'UTF-8', 'Unix'),
+                (b'\x81\n', '\ufffd\n', 'Western (Windows 1252)', 'Unix'),
+                (b'changed on disk\n', 'first\n', 'UTF-8', 'Unix')):
+            view_cache = self.update(content, text, encoding, line_endings)
+            self.assertIsNone(view_cache._content_file)
+            self.assertEqual(view_cache.content, text.encode('utf-8'))
@@ -0,0 +1,235 @@
+"""
+Conformance tests for the built-in diff engine.
+
+The tests compare the output of the python port of git's xdiff library
+with the output of `git diff --no-index` for a corpus of real file pairs.
+
+The corpus consists of the package's own source files and variants of them
+created by typical editing operations. If the package is a git repository,
+the file pairs of its most recent commits are added to the corpus.
+
+To run this unit test install UnitTesting package and choose
+"UnitTesting: Test current project" command.
+"""
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from modules import xdiff
+
+# The arguments git is called with to create the reference diff.
+GIT_DIFF = [
+    'git',
+    '-c', 'core.autocrlf=input',
+    '-c', 'core.eol=lf',
+    '-c', 'core.safecrlf=false',
+    'diff', '-U0', '--no-color', '--no-index', '--no-ext-diff'
+]
+ALGORITHMS = {
+    'default': [],
+    'minimal': ['--minimal'],
+    'patience': ['--patience'],
+    'histogram': ['--histogram']
+}
+WHITESPACES = {
+    'none': [],
+    'cr': ['--ignore-cr-at-eol'],
+    'eol': ['--ignore-space-at-eol'],
+    'space': ['-b'],
+    'all': ['-w']
+}
+# The function context git appends to hunk headers isn't created by xdiff.
+HUNK_HEADER_RE = re.compile(br'^(@@ .*? @@).*$', re.MULTILINE)
+
+
+def package_folder():
+    try:
+        return os.path.dirname(os.path.dirname(__spec__.origin))
+    except (AttributeError, NameError):
+        return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def git(*args, cwd=None):
+    proc = subprocess.Popen(
+        ('git',) + args, cwd=cwd,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return proc.communicate()[0]
+
+
+def variants(content):
+    """Create modified versions of a content like a user would edit it."""
+    lines = content.splitlines(True)
+    half = len(lines) // 2
+    yield b''.join(line for i, line in enumerate(lines) if i % 7 != 3)
+    yield b''.join(lines[:half] + lines[half - 10:half] + lines[half:])
+    yield b''.join(lines[half:] + lines[:half])
+    yield b''.join(
+        b'    ' + line if i % 5 == 0 else line for i, line in enumerate(lines))
+    yield b''.join(
+        line.rstrip() + b'  \n' if i % 3 == 0 else line
+        for i, line in enumerate(lines))
+    yield b''.join(
+        line.replace(b' ', b'\t', 1) if i % 4 == 1 else line
+        for i, line in enumerate(lines))
+    yield b''.join(
+        b'# inserted\n' + line if i % 11 == 0 else line
+        for i, line in enumerate(lines))
+    yield content.replace(b'\n', b'\r\n')
+    yield content.rstrip(b'\n')
+    yield b''
+
+
+class TestDiffEngineConformance(unittest.TestCase):
+    """Check built-in and git diff engines to return the same hunks."""
+
+    @classmethod
+    def setUpClass(cls):
+        if not git('--version'):
+            raise unittest.SkipTest('git not available')
+        cls.temp_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+
+    def corpus(self):
+        folder = package_folder()
+        for sub in ('modules', 'docs'):
+            for name in sorted(os.listdir(os.path.join(folder, sub))):
+                file_name = os.path.join(folder, sub, name)
+                if os.path.isfile(file_name):
+                    with open(file_name, 'rb') as file:
+                        content = file.read()
+                    for variant in variants(content):
+                        yield file_name, content, variant
+
+        commits = git('rev-list', '--max-count=50', 'HEAD', cwd=folder)
+        for commit in commits.decode('ascii').split():
+            names = git(
+                'diff-tree', '-r', '--name-only', '--no-commit-id',
+                '--diff-filter=M', commit, cwd=folder)
+            for name in names.decode('utf-8').splitlines():
+                yield (
+                    '%s:%s' % (commit[:8], name),
+                    git('show', '%s^:%s' % (commit, name), cwd=folder),
+                    git('show', '%s:%s' % (commit, name), cwd=folder))
+
+    def git_diff(self, old, new, algorithm, whitespace):
+        file_names = []
+        for name, content in (('old', old), ('new', new)):
+            file_name = os.path.join(self.temp_dir, name)
+            with open(file_name, 'wb') as file:
+                file.write(content)
+            file_names.append(file_name)
+        args = GIT_DIFF[1:] + WHITESPACES[whitespace]
+        args += ALGORITHMS[algorithm]
+        output = git(*(args + file_names))
+        # strip the diff header
+        start = output.find(b'\n@@ ')
+        if start < 0:
+            return b''
+        return HUNK_HEADER_RE.sub(br'\1', output[start + 1:])
+
+    def assert_conformance(self, algorithms, whitespaces):
+        for name, old, new in self.corpus():
+            for algorithm in algorithms:
+                for whitespace in whitespaces:
+                    with self.subTest(
+                            file=name, algorithm=algorithm,
+                            whitespace=whitespace):
+                        self.assertEqual(
+                            xdiff.diff(old, new, algorithm, whitespace),
+                            self.git_diff(old, new, algorithm, whitespace))
+
+    def test_algorithms(self):
+        self.assert_conformance(ALGORITHMS, ('none',))
+
+    def test_whitespaces(self):
+        self.assert_conformance(('default', 'patience'), WHITESPACES)
+
+
+class TestIncrementalDiff(unittest.TestCase):
+    """Check incremental diffs to match diffs of the whole contents."""
+
+    def setUp(self):
+        file_name = os.path.join(package_folder(), 'modules', 'handler.py')
+        with open(file_name, 'rb') as file:
+            self.old = file.read()
+
+    def test_edits(self):
+        for algorithm in ALGORITHMS:
+            differ = xdiff.Differ()
+            differ.diff(self.old, self.old, algorithm)
+            lines = self.old.split(b'\n')
+            for step in range(60):
+                row = (step * 97) % (len(lines) - 1)
+                op = step % 3
+                if op == 0:
+                    lines.insert(row, b'    inserted = True')
+                elif op == 1:
+                    lines[row] += b'  # modified'
+                else:
+                    del lines[row]
+                new = b'\n'.join(lines)
+                with self.subTest(step=step, algorithm=algorithm):
+                    self.assertEqual(
+                        differ.diff(self.old, new, algorithm),
+                        xdiff.diff(self.old, new, algorithm))
+
+    def test_reset_on_changed_original(self):
+        differ = xdiff.Differ()
+        new = self.old.replace(b'import', b'import os, ', 1)
+        differ.diff(self.old, new)
+        old = self.old.replace(b'import', b'from x import', 1)
+        self.assertEqual(differ.diff(old, new), xdiff.diff(old, new))
+
+
+class TestTrimCommonLines(unittest.TestCase):
+    """Check diffs of trimmed contents to match diffs of the whole contents."""
+
+    def setUp(self):
+        file_name = os.path.join(package_folder(), 'modules', 'handler.py')
+        with open(file_name, 'rb') as file:
+            self.old = file.read()
+
+    def assertTrimmedDiff(self, old, new):
+        lines, old_section, new_section = xdiff.trim_common_lines(old, new)
+        self.assertEqual(
+            xdiff.shift_hunks(xdiff.diff(old_section, new_section), lines),
+            xdiff.diff(old, new))
+        return old_section, new_section
+
+    def test_edits(self):
+        for step in range(60):
+            lines = self.old.split(b'\n')
+            row = (step * 97) % (len(lines) - 1)
+            op = step % 4
+            if op == 0:
+                lines.insert(row, b'    inserted = True')
+            elif op == 1:
+                lines[row] += b'  # modified'
+            elif op == 2:
+                del lines[row]
+            else:
+                lines.insert(row, lines[row])
+            new = b'\n'.join(lines)
+            with self.subTest(step=step):
+                old_section, new_section = self.assertTrimmedDiff(
+                    self.old, new)
+                self.assertLess(len(old_section) + len(new_section), 1000)
+
+    def test_boundaries(self):
+        for old, new in (
+                (b'', b'a\n'),
+                (b'a\n', b''),
+                (b'a\nb\n', b'a\nb'),
+                (b'a\nb', b'a\nb\nc'),
+                (b'x\na\nb\n', b'a\nb\n'),
+                (b'a\nb\n', b'x\na\nb\n'),
+                (b'a\nb\nc\n', b'a\nbb\nc\n'),
+                (b'a\r\nb\r\n', b'a\r\nc\r\n')):
+            with self.subTest(old=old, new=new):
+                self.assertTrimmedDiff(old, new)